@@ -0,0 +1,75 @@
+"""
+Image derivative rendering for the upload blob store.
+
+Kept apart from server.py so the spawned process-pool workers only import
+Pillow and this module, not the whole application.
+"""
+
+import io
+import os
+import time
+from pathlib import Path
+from typing import Any, Dict
+
+try:
+    from PIL import Image, ImageCms, ImageOps
+except ImportError:  # image derivatives are optional
+    Image = None
+
+
+class UnsupportedImage(Exception):
+    """The source cannot be decoded as an image (or is too large to); rendering it again will not help"""
+
+
+def render_derivative(source: str, target: str, spec: Dict[str, Any], max_pixels: int) -> Dict[str, Any]:
+    """Process-pool worker: write one derivative of an image.
+
+    EXIF orientation is applied, colours are converted to sRGB, and nothing
+    from the source's metadata (EXIF, GPS, ICC profile, comments) is kept.
+    Images over `max_pixels` are refused from their header, before decoding.
+    """
+    started = time.time()
+    Image.MAX_IMAGE_PIXELS = max_pixels
+    try:
+        original = Image.open(source)
+    except (Image.UnidentifiedImageError, Image.DecompressionBombError) as e:
+        raise UnsupportedImage(str(e)) from None
+
+    with original:
+        if original.width * original.height > max_pixels:
+            raise UnsupportedImage(f"Image is {original.width}x{original.height}, over {max_pixels} pixels")
+
+        source_format = 'JPEG' if original.format == 'MPO' else original.format
+        image = ImageOps.exif_transpose(original)
+        icc_profile = image.info.get('icc_profile')
+        if icc_profile and image.mode in ('RGB', 'RGBA'):
+            try:
+                image = ImageCms.profileToProfile(
+                    image, ImageCms.ImageCmsProfile(io.BytesIO(icc_profile)), ImageCms.createProfile('sRGB')
+                )
+            except (ImageCms.PyCMSError, OSError):
+                pass
+
+        output_format = spec['format'] or source_format or 'PNG'
+        if spec['max_side']:
+            image.thumbnail((spec['max_side'], spec['max_side']))
+        if output_format == 'JPEG' and image.mode != 'RGB':
+            image = image.convert('RGB')
+        elif output_format == 'WEBP' and image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+        image.info = {}
+
+        staged = f"{target}.{os.getpid()}.tmp"
+        Path(target).parent.mkdir(parents=True, exist_ok=True)
+        image.save(staged, format=output_format, quality=spec['quality'])
+        os.replace(staged, target)
+
+        return {
+            "media_type": Image.MIME.get(output_format, 'application/octet-stream'),
+            "extension": {'JPEG': 'jpg'}.get(output_format, output_format.lower()),
+            "size": os.path.getsize(target),
+            "width": image.width,
+            "height": image.height,
+            "started": started,
+            "seconds": time.time() - started
+        }
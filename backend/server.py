@@ -4,48 +4,352 @@ All Phases Implementation: Authentication, AI Tutoring, Real-time Features,
 Analytics, Enterprise Features, and Advanced Collaboration
 """
 
-from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File
+from fastapi import FastAPI, APIRouter, HTTPException, Depends, status, UploadFile, File, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response, StreamingResponse, PlainTextResponse
 from dotenv import load_dotenv
 from motor.motor_asyncio import AsyncIOMotorClient
 from contextlib import asynccontextmanager
 import socketio
+from socketio.async_pubsub_manager import AsyncPubSubManager
 import os
+import socket
 import logging
 import json
 import uuid
 import bcrypt
 import jwt
-from datetime import datetime, timedelta
-from typing import List, Optional, Dict, Any, Union
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional, Dict, Any, Union, AsyncIterator, Tuple
 from pathlib import Path
 from pydantic import BaseModel, Field, EmailStr
 import asyncio
 import random
-from sklearn.linear_model import LinearRegression
-from sklearn.preprocessing import StandardScaler
 import numpy as np
 import base64
+import time
+import sys
+import functools
+import bisect
+import heapq
+import hashlib
+import multiprocessing
+import re
+import threading
+import unicodedata
+from urllib.parse import quote
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from bson import ObjectId
+from pymongo import UpdateOne, ReturnDocument, monitoring
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+try:
+    import msgpack
+except ImportError:  # compact Socket.IO encoding is optional
+    msgpack = None
+
+from image_derivatives import Image, UnsupportedImage, render_derivative
 
 # Load environment variables
 ROOT_DIR = Path(__file__).parent
 load_dotenv(ROOT_DIR / '.env')
 
+# ================================
+# METRICS
+# ================================
+
+class Counter:
+    """Prometheus-style counter with a fixed set of labels"""
+    
+    def __init__(self, name: str, help_text: str, labels: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.series: Dict[tuple, float] = {}
+        self.lock = threading.Lock()
+    
+    def inc(self, label_values: tuple, amount: float = 1):
+        with self.lock:
+            self.series[label_values] = self.series.get(label_values, 0) + amount
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self.series.items()):
+            lines.append(f"{self.name}{{{format_labels(self.labels, label_values)}}} {value}")
+        return lines
+
+class Histogram:
+    """Prometheus-style histogram; an observation is one bisect and three additions"""
+    
+    def __init__(self, name: str, help_text: str, labels: tuple, buckets: tuple):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self.series: Dict[tuple, list] = {}  # label values -> [bucket counts..., +Inf count, sum]
+        self.lock = threading.Lock()
+    
+    def observe(self, label_values: tuple, value: float):
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [0] * (len(self.buckets) + 2)
+            series[bisect.bisect_left(self.buckets, value)] += 1
+            series[-1] += value
+    
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for label_values, series in sorted(self.series.items()):
+            labels = format_labels(self.labels, label_values)
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{self.name}_sum{{{labels}}} {series[-1]}")
+            lines.append(f"{self.name}_count{{{labels}}} {cumulative}")
+        return lines
+
+def format_labels(names: tuple, values: tuple) -> str:
+    return ",".join(
+        f'{name}="{str(value).replace(chr(92), chr(92) * 2).replace(chr(34), chr(92) + chr(34))}"'
+        for name, value in zip(names, values)
+    )
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DB_LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 5.0)
+
+http_requests = Counter(
+    "starguide_http_requests_total", "HTTP requests by route and status", ("method", "route", "status")
+)
+http_request_seconds = Histogram(
+    "starguide_http_request_duration_seconds", "HTTP request latency by route", ("method", "route"), LATENCY_BUCKETS
+)
+mongo_command_seconds = Histogram(
+    "starguide_mongodb_command_duration_seconds", "MongoDB command latency by collection",
+    ("command", "collection", "outcome"), DB_LATENCY_BUCKETS
+)
+socketio_events = Counter(
+    "starguide_socketio_events_total", "Socket.IO events received by outcome", ("event", "outcome")
+)
+socketio_event_seconds = Histogram(
+    "starguide_socketio_event_duration_seconds", "Socket.IO handler latency", ("event",), LATENCY_BUCKETS
+)
+METRICS = [http_requests, http_request_seconds, mongo_command_seconds, socketio_events, socketio_event_seconds]
+
+class MongoCommandMetrics(monitoring.CommandListener):
+    """Times every MongoDB command by command name and collection (runs on driver threads)"""
+    
+    def __init__(self):
+        self.pending: Dict[tuple, tuple] = {}
+    
+    def started(self, event):
+        # getMore names the collection separately; the others name it as the command's value
+        collection = event.command.get('collection' if event.command_name == 'getMore' else event.command_name)
+        self.pending[(event.connection_id, event.request_id)] = (
+            event.command_name, collection if isinstance(collection, str) else ''
+        )
+    
+    def succeeded(self, event):
+        self._observe(event, 'ok')
+    
+    def failed(self, event):
+        self._observe(event, 'error')
+    
+    def _observe(self, event, outcome: str):
+        command, collection = self.pending.pop((event.connection_id, event.request_id), (event.command_name, ''))
+        mongo_command_seconds.observe((command, collection, outcome), event.duration_micros / 1e6)
+
+mongo_command_metrics = MongoCommandMetrics()
+
 # MongoDB connection
 mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
+client = AsyncIOMotorClient(mongo_url, event_listeners=[mongo_command_metrics])
 db = client[os.environ['DB_NAME']]
 
+# Socket.IO message queue shared by all workers: redis://..., amqp://..., or
+# loopback:// (in-process stand-in for tests and local runs). Empty keeps rooms in-process.
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE', '')
+PRESENCE_STORE = os.environ.get(
+    'PRESENCE_STORE',
+    'mongo' if SOCKETIO_MESSAGE_QUEUE and not SOCKETIO_MESSAGE_QUEUE.startswith('loopback://') else 'memory'
+)
+PRESENCE_HEARTBEAT_INTERVAL = float(os.environ.get('PRESENCE_HEARTBEAT_INTERVAL', '10'))
+
+# Identifies this process in shared presence state
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+# Worker-to-worker notifications (cache invalidations etc.) ride the Socket.IO
+# channel as emits on a namespace no client connects to; handlers by event name
+SHARED_EVENTS_NAMESPACE = '/__workers'
+shared_event_handlers: Dict[str, Any] = {}
+
+class SharedEventsMixin:
+    """Pub/sub client-manager mixin running shared_event_handlers for other workers' publish_shared_event calls"""
+    
+    async def _handle_emit(self, message):
+        if message.get('namespace') != SHARED_EVENTS_NAMESPACE:
+            return await super()._handle_emit(message)
+        handler = shared_event_handlers.get(message['event'])
+        # The publishing worker already applied its own change
+        if handler is not None and message.get('host_id') != self.host_id:
+            # Newer python-socketio releases publish emit arguments as a list
+            data = message['data'][0] if isinstance(message['data'], list) else message['data']
+            result = handler(data)
+            if asyncio.iscoroutine(result):
+                await result
+
+class LoopbackPubSubManager(SharedEventsMixin, AsyncPubSubManager):
+    """In-process pub/sub client manager standing in for a real broker.
+    
+    Every server created in this process on the same channel gets its own
+    queue and receives the JSON messages the others publish, exactly as it
+    would through Redis or AMQP, so multi-worker fan-out can be exercised
+    without external services.
+    """
+    name = 'loopback'
+    _channels: Dict[str, List[asyncio.Queue]] = {}
+    
+    def __init__(self, channel='socketio', write_only=False, logger=None):
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+        self._queue: asyncio.Queue = asyncio.Queue()
+        if not write_only:
+            self._channels.setdefault(channel, []).append(self._queue)
+    
+    async def _publish(self, data):
+        message = self.json.dumps(data)
+        for queue in self._channels.get(self.channel, []):
+            if queue is not self._queue:
+                queue.put_nowait(message)
+    
+    async def _listen(self):
+        while True:
+            yield await self._queue.get()
+
+def create_client_manager(url: str):
+    """Socket.IO client manager for a message queue URL (None keeps rooms in this process)"""
+    if not url:
+        return None
+    if url.startswith('loopback://'):
+        return LoopbackPubSubManager(channel=url[len('loopback://'):] or 'socketio')
+    if url.startswith(('redis://', 'rediss://')):
+        return SharedRedisManager(url)
+    if url.startswith(('amqp://', 'amqps://')):
+        return SharedAioPikaManager(url)
+    raise ValueError(f"Unsupported SOCKETIO_MESSAGE_QUEUE: {url}")
+
+class SharedRedisManager(SharedEventsMixin, socketio.AsyncRedisManager):
+    pass
+
+class SharedAioPikaManager(SharedEventsMixin, socketio.AsyncAioPikaManager):
+    pass
+
 # Socket.IO setup for real-time features
-sio = socketio.AsyncServer(cors_allowed_origins="*", logger=True, engineio_logger=True)
+sio = socketio.AsyncServer(
+    cors_allowed_origins="*",
+    logger=True,
+    engineio_logger=True,
+    client_manager=create_client_manager(SOCKETIO_MESSAGE_QUEUE)
+)
+
+_shared_event_tasks: set = set()
+
+def publish_shared_event(event: str, data: Dict[str, Any]):
+    """Run the `event` handler on every other worker (no-op without a message queue)"""
+    if not SOCKETIO_MESSAGE_QUEUE:
+        return
+    task = asyncio.create_task(sio.emit(event, data, namespace=SHARED_EVENTS_NAMESPACE))
+    _shared_event_tasks.add(task)
+    task.add_done_callback(_shared_event_tasks.discard)
 
 # JWT Settings
 JWT_SECRET = os.environ.get('JWT_SECRET', 'default_secret')
 PASSWORD_SALT = os.environ.get('PASSWORD_SALT', 'default_salt').encode()
 
+# Learning trend settings (weight multiplier applied to older scores per new result)
+LEARNING_TREND_DECAY = float(os.environ.get('LEARNING_TREND_DECAY', '0.85'))
+
+# Dashboard snapshot cache settings (seconds)
+DASHBOARD_CACHE_TTL = float(os.environ.get('DASHBOARD_CACHE_TTL', '30'))
+DASHBOARD_CACHE_MAX_STALE = float(os.environ.get('DASHBOARD_CACHE_MAX_STALE', '900'))
+
+# Cohort analytics refresh settings (seconds)
+COHORT_REFRESH_INTERVAL = float(os.environ.get('COHORT_REFRESH_INTERVAL', '60'))
+COHORT_REFRESH_LAG = float(os.environ.get('COHORT_REFRESH_LAG', '5'))
+# How long a worker may hold a claimed window before another worker retries it
+COHORT_REFRESH_LEASE = float(os.environ.get('COHORT_REFRESH_LEASE', '300'))
+
+# Item analysis settings (attempts required before an item gets an empirical difficulty band)
+ITEM_STATS_MIN_ATTEMPTS = int(os.environ.get('ITEM_STATS_MIN_ATTEMPTS', '10'))
+
+# Presence broadcast coalescing window (seconds)
+PRESENCE_TICK_INTERVAL = float(os.environ.get('PRESENCE_TICK_INTERVAL', '0.15'))
+
+# Chat write-behind settings (flush every N seconds or M messages, bounded buffer)
+CHAT_FLUSH_INTERVAL = float(os.environ.get('CHAT_FLUSH_INTERVAL', '0.5'))
+CHAT_FLUSH_BATCH_SIZE = int(os.environ.get('CHAT_FLUSH_BATCH_SIZE', '200'))
+CHAT_BUFFER_LIMIT = int(os.environ.get('CHAT_BUFFER_LIMIT', '5000'))
+CHAT_BACKPRESSURE_TIMEOUT = float(os.environ.get('CHAT_BACKPRESSURE_TIMEOUT', '2'))
+
+# Chat history settings (recent messages kept in memory per room, hot-tier retention)
+CHAT_RECENT_MESSAGES = int(os.environ.get('CHAT_RECENT_MESSAGES', '50'))
+CHAT_RECENT_MAX_ROOMS = int(os.environ.get('CHAT_RECENT_MAX_ROOMS', '10000'))
+CHAT_RETENTION_DAYS = float(os.environ.get('CHAT_RETENTION_DAYS', '30'))
+CHAT_RETENTION_INTERVAL = float(os.environ.get('CHAT_RETENTION_INTERVAL', '3600'))
+
+# Study group discovery (refresh period in seconds; fill/online bonuses in hours of recency)
+DISCOVERY_REFRESH_INTERVAL = float(os.environ.get('DISCOVERY_REFRESH_INTERVAL', '30'))
+DISCOVERY_FILL_WEIGHT = float(os.environ.get('DISCOVERY_FILL_WEIGHT', '12'))
+DISCOVERY_ONLINE_WEIGHT = float(os.environ.get('DISCOVERY_ONLINE_WEIGHT', '24'))
+
+# Help queue: how often requests changed by other workers are folded in (seconds)
+HELP_QUEUE_SYNC_INTERVAL = float(os.environ.get('HELP_QUEUE_SYNC_INTERVAL', '5'))
+# Completed requests in the rolling service-time average behind wait estimates
+HELP_SERVICE_WINDOW = int(os.environ.get('HELP_SERVICE_WINDOW', '50'))
+
+# Help auto-assignment (opt-in; batch period in seconds, requests per batch, default teacher load cap)
+HELP_AUTO_ASSIGN = os.environ.get('HELP_AUTO_ASSIGN', '').lower() in ('1', 'true', 'yes')
+HELP_ASSIGN_INTERVAL = float(os.environ.get('HELP_ASSIGN_INTERVAL', '3'))
+HELP_ASSIGN_BATCH = int(os.environ.get('HELP_ASSIGN_BATCH', '50'))
+HELP_TEACHER_MAX_LOAD = int(os.environ.get('HELP_TEACHER_MAX_LOAD', '3'))
+
+# Live quiz settings (seconds per question, pause on results, points for an instant correct answer)
+QUIZ_QUESTION_TIME_LIMIT = int(os.environ.get('QUIZ_QUESTION_TIME_LIMIT', '30'))
+QUIZ_RESULTS_PAUSE = float(os.environ.get('QUIZ_RESULTS_PAUSE', '5'))
+QUIZ_MAX_POINTS = int(os.environ.get('QUIZ_MAX_POINTS', '1000'))
+
+# Seconds a loaded quiz room may sit unstarted with nobody connected before it is unloaded
+QUIZ_ROOM_IDLE_TTL = float(os.environ.get('QUIZ_ROOM_IDLE_TTL', '1800'))
+
+# Answer-distribution broadcast period during a live question (seconds; 0.2 = 5 Hz)
+QUIZ_DISTRIBUTION_INTERVAL = float(os.environ.get('QUIZ_DISTRIBUTION_INTERVAL', '0.2'))
+
+# Per-connection Socket.IO event limits: "event=rate/burst" (tokens per second / bucket size)
+SOCKET_RATE_LIMITS = os.environ.get(
+    'SOCKET_RATE_LIMITS',
+    'send_message=2/5,quiz_answer=2/4,join_room=1/5,leave_room=2/10,join_quiz_room=1/5,'
+    'subscribe_help_queue=1/5,unsubscribe_help_queue=1/5'
+)
+
+# Socket.IO identity cache (seconds a looked-up user is reused, and served while refreshing)
+USER_CACHE_TTL = float(os.environ.get('USER_CACHE_TTL', '60'))
+USER_CACHE_MAX_STALE = float(os.environ.get('USER_CACHE_MAX_STALE', '600'))
+
+# Uploaded files: content-addressed blob directory, per-file size cap and streaming chunk size (bytes)
+BLOB_STORE_DIR = Path(os.environ.get('BLOB_STORE_DIR', str(ROOT_DIR / 'blobs')))
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', str(10 * 1024 * 1024)))
+UPLOAD_CHUNK_SIZE = int(os.environ.get('UPLOAD_CHUNK_SIZE', str(1024 * 1024)))
+
+# Image derivatives (thumbnails etc.): processes rendering them off the event loop
+DERIVATIVE_WORKERS = int(os.environ.get('DERIVATIVE_WORKERS', '2'))
+# Largest image (width x height) decoded for derivatives; bigger uploads are refused from their header
+DERIVATIVE_MAX_PIXELS = int(os.environ.get('DERIVATIVE_MAX_PIXELS', str(40_000_000)))
+
+# Bearer token required to scrape /metrics (empty leaves it open, e.g. behind an internal network)
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+
 # Security
 security = HTTPBearer()
 
@@ -76,6 +380,12 @@ ai_clients = {
     'gemini': None
 }
 
+# Long-running background tasks started in lifespan
+background_tasks: List[asyncio.Task] = []
+
+# Named callables reporting in-process subsystem state for /api/system/stats
+system_stats_providers: Dict[str, Any] = {}
+
 # ================================
 # PYDANTIC MODELS
 # ================================
@@ -164,6 +474,7 @@ class StudyGroup(BaseModel):
     subject: str
     created_by: str
     members: List[str] = []  # user IDs
+    member_count: int = 0  # kept equal to len(members), so listings never need the list
     max_members: int = 10
     is_public: bool = True
     created_at: datetime = Field(default_factory=datetime.utcnow)
@@ -207,9 +518,12 @@ class HelpRequest(BaseModel):
     student_id: str
     subject: str
     priority: str = "medium"  # low, medium, high, urgent
+    priority_rank: int = 2  # HELP_PRIORITY_RANKS[priority]; indexed queue order
     description: str
     status: str = "pending"  # pending, assigned, in_progress, completed, cancelled
     assigned_teacher: Optional[str] = None
+    claimed_at: Optional[datetime] = None
+    completed_at: Optional[datetime] = None
     created_at: datetime = Field(default_factory=datetime.utcnow)
     updated_at: datetime = Field(default_factory=datetime.utcnow)
 
@@ -267,6 +581,15 @@ class CreateAssessmentRequest(BaseModel):
 class JoinGroupRequest(BaseModel):
     group_id: str
 
+class TeacherCapacityRequest(BaseModel):
+    subjects: List[str] = []  # empty: takes requests in any subject
+    max_load: int = HELP_TEACHER_MAX_LOAD
+    auto_assign: bool = True
+
+class BatchPredictionRequest(BaseModel):
+    user_ids: Optional[List[str]] = None
+    group_id: Optional[str] = None
+
 class CreateGroupRequest(BaseModel):
     name: str
     description: str
@@ -321,6 +644,105 @@ async def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(s
         logger.error(f"Authentication error: {str(e)}")
         raise HTTPException(status_code=401, detail="Authentication failed")
 
+# ================================
+# SNAPSHOT CACHE
+# ================================
+
+class SnapshotCache:
+    """In-process per-key snapshot cache with stale-while-revalidate refreshes.
+    
+    A snapshot is served as-is for `fresh_ttl` seconds. Once it is older, or
+    has been invalidated by a write path, the stale value is still returned
+    (up to `max_stale` seconds) while one background refresh per key rebuilds
+    it. Only a cold or expired key makes the caller wait for the loader.
+    Invalidations of a named cache are also published to the other workers'
+    caches of that name, so no worker serves a snapshot older than the write.
+    """
+    
+    def __init__(self, loader, fresh_ttl: float, max_stale: float, max_entries: int = 10000,
+                 name: Optional[str] = None):
+        self.loader = loader
+        self.name = name
+        if name:
+            shared_event_handlers[f"invalidate:{name}"] = lambda data: self.invalidate(data['key'], publish=False)
+        self.fresh_ttl = fresh_ttl
+        self.max_stale = max_stale
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._refreshing: Dict[str, asyncio.Task] = {}
+        self._dirty: set = set()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+    
+    async def get(self, key: str) -> Any:
+        """Return the snapshot for `key`, refreshing it if needed"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry['built_at']
+            if not entry['stale'] and age < self.fresh_ttl:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return entry['value']
+            if age < self.max_stale:
+                self.stale_hits += 1
+                self._entries.move_to_end(key)
+                self._refresh(key)
+                return entry['value']
+        
+        self.misses += 1
+        return await asyncio.shield(self._refresh(key))
+    
+    def invalidate(self, key: str, publish: bool = True):
+        """Mark a snapshot stale; the next read serves it and triggers a rebuild"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            entry['stale'] = True
+        if key in self._refreshing:
+            self._dirty.add(key)
+        if publish and self.name:
+            publish_shared_event(f"invalidate:{self.name}", {"key": key})
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "entries": len(self._entries),
+            "refreshing": len(self._refreshing),
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses
+        }
+    
+    def _refresh(self, key: str) -> asyncio.Task:
+        # Single flight: concurrent callers share one rebuild per key
+        task = self._refreshing.get(key)
+        if task is None:
+            task = asyncio.create_task(self._load(key))
+            task.add_done_callback(self._log_failure)
+            self._refreshing[key] = task
+        return task
+    
+    @staticmethod
+    def _log_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Snapshot refresh failed: {task.exception()}")
+    
+    async def _load(self, key: str) -> Any:
+        started = time.monotonic()
+        try:
+            value = await self.loader(key)
+            self._entries[key] = {
+                "value": value,
+                "built_at": started,
+                "stale": key in self._dirty
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            return value
+        finally:
+            self._refreshing.pop(key, None)
+            self._dirty.discard(key)
+
 # ================================
 # AI INITIALIZATION
 # ================================
@@ -360,15 +782,81 @@ async def init_ai_clients():
 # FASTAPI APP INITIALIZATION
 # ================================
 
+async def run_startup_job(name: str, job, lease: float = 600):
+    """Run a one-shot startup job on a single worker and hold every worker's startup until it is done.
+    
+    The first worker to claim `once:{name}` in analytics_state runs `job`
+    and records completed_at; the others poll until that marker appears (or
+    the claimer's lease lapses), so no worker serves requests that race the
+    job and later starts skip it. A failed job releases its claim, so a
+    worker still waiting (or the next start) retries it.
+    """
+    state_id = f"once:{name}"
+    while True:
+        now = datetime.utcnow()
+        try:
+            await db.analytics_state.update_one(
+                {"_id": state_id, "completed_at": None, "lease_until": {"$not": {"$gt": now}}},
+                {"$set": {"lease_owner": WORKER_ID, "lease_until": now + timedelta(seconds=lease)}},
+                upsert=True
+            )
+        except DuplicateKeyError:
+            # Already done, or another worker is running it
+            state = await db.analytics_state.find_one({"_id": state_id}, {"completed_at": 1})
+            if state and state.get('completed_at'):
+                return
+            await asyncio.sleep(1)
+            continue
+        
+        try:
+            await job()
+        except Exception as e:
+            logger.error(f"Startup job {name} failed: {e}")
+            await db.analytics_state.update_one(
+                {"_id": state_id, "lease_owner": WORKER_ID}, {"$set": {"lease_until": None}}
+            )
+            return
+        await db.analytics_state.update_one(
+            {"_id": state_id, "lease_owner": WORKER_ID},
+            {"$set": {"completed_at": datetime.utcnow()}, "$unset": {"lease_owner": "", "lease_until": ""}}
+        )
+        return
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Application lifespan context manager"""
     # Startup
     await init_ai_clients()
+    await create_indexes()
+    await backfill_group_member_counts()
+    await backfill_help_priority_ranks()
+    await backfill_result_ingested_at()
+    await run_startup_job("teacher_load_reconcile", reconcile_teacher_loads)
+    await run_startup_job("group_memberships_backfill", backfill_group_memberships)
     await create_default_data()
+    await run_startup_job("learning_stats_backfill", backfill_learning_stats)
+    background_tasks.append(asyncio.create_task(migrate_inline_uploads()))
+    background_tasks.append(asyncio.create_task(cohort_refresh_loop()))
+    background_tasks.append(asyncio.create_task(presence_broadcaster.run()))
+    background_tasks.append(asyncio.create_task(quiz_distribution.run()))
+    background_tasks.append(asyncio.create_task(quiz_engine.run()))
+    background_tasks.append(asyncio.create_task(group_discovery.run()))
+    background_tasks.append(asyncio.create_task(help_queue.run()))
+    if HELP_AUTO_ASSIGN:
+        background_tasks.append(asyncio.create_task(help_assigner.run()))
+    background_tasks.append(asyncio.create_task(chat_buffer.run()))
+    background_tasks.append(asyncio.create_task(chat_retention_loop()))
+    background_tasks.append(asyncio.create_task(presence_heartbeat_loop()))
     logger.info("StarGuide application started")
     yield
     # Shutdown
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    await quiz_engine.close()
+    derivative_pipeline.close()
+    await chat_buffer.flush()
+    await presence_store.close()
     client.close()
     logger.info("StarGuide application shutdown")
 
@@ -392,6 +880,37 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+class MetricsMiddleware:
+    """Pure ASGI middleware recording latency and status per route template"""
+    
+    def __init__(self, app):
+        self.app = app
+    
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+        
+        started = time.perf_counter()
+        status_code = 500
+        
+        async def send_with_status(message):
+            nonlocal status_code
+            if message['type'] == 'http.response.start':
+                status_code = message['status']
+            await send(message)
+        
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The matched route's path template keeps label cardinality bounded
+            route = scope.get('route')
+            route_path = getattr(route, 'path', 'unmatched')
+            http_request_seconds.observe((scope['method'], route_path), time.perf_counter() - started)
+            http_requests.inc((scope['method'], route_path, status_code))
+
+# Outermost, so CORS and error handling are included in the timings
+app.add_middleware(MetricsMiddleware)
+
 # Mount Socket.IO
 socket_app = socketio.ASGIApp(sio, app)
 
@@ -399,6 +918,86 @@ socket_app = socketio.ASGIApp(sio, app)
 # DEFAULT DATA CREATION
 # ================================
 
+async def backfill_group_member_counts():
+    """One-off migration: store member_count on groups created before it existed"""
+    result = await db.study_groups.update_many(
+        {"member_count": {"$exists": False}},
+        [{"$set": {"member_count": {"$size": {"$ifNull": ["$members", []]}}}}]
+    )
+    if result.modified_count:
+        logger.info(f"Backfilled member_count on {result.modified_count} study groups")
+
+async def backfill_group_memberships():
+    """One-off migration: build each user's group_memberships set from existing group member lists"""
+    await db.study_groups.aggregate([
+        {"$unwind": "$members"},
+        {"$group": {"_id": "$members", "group_ids": {"$addToSet": "$id"}}},
+        {"$project": {"_id": 0, "user_id": "$_id", "group_ids": 1}},
+        {"$merge": {
+            "into": "group_memberships",
+            "on": "user_id",
+            "whenMatched": [{"$set": {"group_ids": {"$setUnion": ["$group_ids", "$$new.group_ids"]}}}],
+            "whenNotMatched": "insert"
+        }}
+    ]).to_list(None)
+
+async def backfill_result_ingested_at():
+    """One-off migration: results stored before ingested_at existed count as ingested when completed"""
+    result = await db.assessment_results.update_many(
+        {"ingested_at": {"$exists": False}},
+        [{"$set": {"ingested_at": "$completed_at"}}]
+    )
+    if result.modified_count:
+        logger.info(f"Backfilled ingested_at on {result.modified_count} assessment results")
+
+async def backfill_help_priority_ranks():
+    """One-off migration: store priority_rank on help requests created before it existed"""
+    for priority, rank in HELP_PRIORITY_RANKS.items():
+        await db.help_requests.update_many(
+            {"priority_rank": {"$exists": False}, "priority": priority},
+            {"$set": {"priority_rank": rank}}
+        )
+
+async def create_indexes():
+    """Create indexes backing the hot query paths"""
+    await db.learning_stats.create_index("user_id", unique=True)
+    await db.assessment_results.create_index([("user_id", 1), ("completed_at", 1)])
+    await db.predictions.create_index("user_id", unique=True)
+    await db.study_sessions.create_index([("user_id", 1), ("created_at", -1)])
+    await db.ai_conversations.create_index([("user_id", 1), ("created_at", -1)])
+    await db.assessment_results.create_index("ingested_at")
+    await db.assessments.create_index("id")
+    await db.study_groups.create_index("members")
+    await db.group_memberships.create_index("user_id", unique=True)
+    await db.study_groups.create_index("id")
+    await db.study_groups.create_index("last_activity")
+    await db.help_requests.create_index("id")
+    await db.help_requests.create_index([("status", 1), ("priority_rank", 1), ("created_at", 1)])
+    await db.help_requests.create_index("updated_at")
+    await db.help_requests.create_index([("status", 1), ("completed_at", -1)])
+    await db.teacher_capacity.create_index("teacher_id", unique=True)
+    await db.teacher_capacity.create_index([("auto_assign", 1), ("subjects", 1)])
+    await db.uploaded_files.create_index("id")
+    await db.uploaded_files.create_index("sha256")
+    await db.cohort_score_buckets.create_index([("scope", 1), ("key", 1)])
+    await db.questions.create_index("id")
+    await db.questions.create_index([("subject", 1), ("item_stats.p_value", 1)])
+    await db.questions.create_index([("subject", 1), ("item_stats.difficulty_band", 1)])
+    # Calibration filters are also used without a subject
+    await db.questions.create_index([("item_stats.difficulty_band", 1), ("item_stats.p_value", 1)])
+    await db.questions.create_index("item_stats.p_value")
+    await db.questions.create_index("item_stats.discrimination")
+    await db.chat_messages.create_index([("room_id", 1), ("timestamp", -1), ("id", -1)])
+    await db.chat_messages.create_index("timestamp")
+    await db.chat_message_archive.create_index([("room_id", 1), ("bucket_start", -1)])
+    await db.presence.create_index([("room_id", 1), ("sid", 1)])
+    await db.presence.create_index("sid")
+    await db.presence.create_index("worker_id")
+    await db.quiz_rooms.create_index("room_code")
+    await db.quiz_rooms.create_index("id")
+    await db.quiz_results.create_index([("user_id", 1), ("completed_at", -1)])
+    await db.quiz_results.create_index("room_id")
+
 async def create_default_data():
     """Create default achievements, sample questions, etc."""
     
@@ -458,127 +1057,1411 @@ async def create_default_data():
 # SOCKET.IO EVENTS (Real-time Features)
 # ================================
 
-# Store for active users in rooms
-active_users = {}
+# Field names sent as small integers by the compact encoding. Shared with
+# frontend/src/socketCodec.js: append only, never reorder.
+COMPACT_FIELDS = [
+    'id', 'room_id', 'user_id', 'username', 'message', 'message_type', 'timestamp',
+    'presence_id', 'joined_at', 'joined', 'left', 'online_count', 'messages', 'status',
+    'room_code', 'question_id', 'question', 'question_number', 'time_limit', 'answered',
+    'total', 'counts', 'leaderboard', 'rank', 'score', 'correct', 'participants',
+    'total_questions', 'content', 'question_type', 'subject', 'difficulty', 'options',
+    'reason', 'host_id', 'time_remaining', 'correct_answer', 'explanation', 'final_leaderboard'
+]
+# ISO timestamp fields sent as integer epoch milliseconds (UTC)
+COMPACT_TIMESTAMP_FIELDS = ('timestamp', 'joined_at')
+EPOCH = datetime(1970, 1, 1)
+MILLISECOND = timedelta(milliseconds=1)
+
+class CompactCodec:
+    """Opt-in binary encoding of Socket.IO event payloads.
+    
+    Clients that connect with `auth.encoding == 'compact'` receive msgpack
+    binary payloads in which known field names are replaced by their index
+    in COMPACT_FIELDS and timestamps by epoch milliseconds; everyone else
+    keeps JSON. Room emits go to the JSON room and to its `#compact` twin,
+    which negotiated connections join instead. Without msgpack installed the
+    option is simply not offered.
+    """
+    
+    def __init__(self, fields: List[str], timestamp_fields, shared: bool):
+        self.codes = {name: code for code, name in enumerate(fields)}
+        self.timestamp_fields = set(timestamp_fields)
+        # With a message queue other workers may hold compact clients for any room
+        self.shared = shared
+        self.sids: set = set()
+        self.metrics = {"binary_emits": 0, "binary_bytes": 0, "json_bytes_equivalent": 0}
+    
+    @property
+    def available(self) -> bool:
+        return msgpack is not None
+    
+    def negotiate(self, sid: str, requested: Optional[str]) -> str:
+        if requested == 'compact' and self.available:
+            self.sids.add(sid)
+            return 'compact'
+        return 'json'
+    
+    def forget(self, sid: str):
+        self.sids.discard(sid)
+    
+    def wanted(self) -> bool:
+        """Whether a room emit needs a compact copy at all"""
+        return self.available and (self.shared or bool(self.sids))
+    
+    def encode(self, payload: Any) -> bytes:
+        return msgpack.packb(self._compact(payload), use_bin_type=True)
+    
+    def record(self, payload: Any, encoded: bytes):
+        self.metrics['binary_emits'] += 1
+        self.metrics['binary_bytes'] += len(encoded)
+        self.metrics['json_bytes_equivalent'] += len(json.dumps(payload, default=str))
+    
+    def stats(self) -> Dict[str, Any]:
+        json_bytes = self.metrics['json_bytes_equivalent']
+        return {
+            **self.metrics,
+            "available": self.available,
+            "compact_connections": len(self.sids),
+            "size_ratio": round(self.metrics['binary_bytes'] / json_bytes, 3) if json_bytes else 0
+        }
+    
+    def _compact(self, value: Any) -> Any:
+        # Only containers recurse; leaves are handled inline (this runs per emit)
+        if isinstance(value, dict):
+            codes, timestamp_fields = self.codes, self.timestamp_fields
+            compacted = {}
+            for key, item in value.items():
+                if isinstance(item, (dict, list, tuple)):
+                    item = self._compact(item)
+                elif key in timestamp_fields:
+                    item = self._epoch_ms(item)
+                elif isinstance(item, datetime):
+                    item = item.isoformat()
+                compacted[codes.get(key, key)] = item
+            return compacted
+        if isinstance(value, (list, tuple)):
+            return [self._compact(item) if isinstance(item, (dict, list, tuple)) else item for item in value]
+        return value
+    
+    @staticmethod
+    def _epoch_ms(value: Any) -> Any:
+        if isinstance(value, str):
+            try:
+                value = datetime.fromisoformat(value)
+            except ValueError:
+                return value
+        if not isinstance(value, datetime):
+            return value
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc).replace(tzinfo=None)
+        # Naive datetimes are UTC throughout this app
+        return (value - EPOCH) // MILLISECOND
+
+compact_codec = CompactCodec(COMPACT_FIELDS, COMPACT_TIMESTAMP_FIELDS, shared=bool(SOCKETIO_MESSAGE_QUEUE))
+system_stats_providers['compact_codec'] = compact_codec.stats
+
+def compact_room(room_id: str) -> str:
+    return f"{room_id}#compact"
+
+async def enter_event_room(sid: str, room_id: str):
+    """Join a room in the encoding this connection negotiated"""
+    await sio.enter_room(sid, compact_room(room_id) if sid in compact_codec.sids else room_id)
+
+async def leave_event_room(sid: str, room_id: str):
+    await sio.leave_room(sid, compact_room(room_id) if sid in compact_codec.sids else room_id)
+
+async def emit_event(event: str, payload: Any, room: Union[str, List[str], None] = None, to: Optional[str] = None,
+                     skip_sid: Optional[str] = None):
+    """Emit to one connection or a room, JSON or compact as each client negotiated.
+    
+    A list of rooms reaches each connection in any of them once.
+    """
+    if to is not None:
+        if to in compact_codec.sids:
+            encoded = compact_codec.encode(payload)
+            compact_codec.record(payload, encoded)
+            payload = encoded
+        await sio.emit(event, payload, to=to)
+        return
+    
+    await sio.emit(event, payload, room=room, skip_sid=skip_sid)
+    if compact_codec.wanted():
+        encoded = compact_codec.encode(payload)
+        compact_codec.record(payload, encoded)
+        compact_rooms = [compact_room(name) for name in room] if isinstance(room, list) else compact_room(room)
+        await sio.emit(event, encoded, room=compact_rooms, skip_sid=skip_sid)
+
+def parse_rate_limits(spec: str) -> Dict[str, tuple]:
+    """Parse "event=rate/burst,..." into {event: (rate, burst)}"""
+    limits = {}
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        event, _, value = item.partition('=')
+        rate, _, burst = value.partition('/')
+        limits[event.strip()] = (float(rate), float(burst or rate))
+    return limits
+
+class TokenBucketLimiter:
+    """Per-connection, per-event token buckets.
+    
+    Each (sid, event) bucket holds up to `burst` tokens and refills at `rate`
+    tokens per second; an event costs one token. Buckets are refilled lazily
+    on use, so bookkeeping is O(1) per event and nothing runs in between.
+    Events without a configured limit are always allowed.
+    """
+    
+    NOTICE_INTERVAL = 1.0
+    
+    def __init__(self, limits: Dict[str, tuple]):
+        self.limits = limits
+        self._buckets: Dict[str, Dict[str, List[float]]] = {}
+        self.allowed = dict.fromkeys(limits, 0)
+        self.dropped = dict.fromkeys(limits, 0)
+        self.notices = 0
+        self.throttled_sids: set = set()
+    
+    def allow(self, sid: str, event: str) -> bool:
+        limit = self.limits.get(event)
+        if limit is None:
+            return True
+        rate, burst = limit
+        now = time.monotonic()
+        buckets = self._buckets.setdefault(sid, {})
+        bucket = buckets.get(event)
+        if bucket is None:
+            # [tokens, last refill, last over-limit notice]
+            bucket = buckets[event] = [burst, now, 0.0]
+        else:
+            bucket[0] = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+        
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+            self.allowed[event] += 1
+            return True
+        self.dropped[event] += 1
+        self.throttled_sids.add(sid)
+        return False
+    
+    def retry_after(self, sid: str, event: str) -> float:
+        rate, _ = self.limits[event]
+        return round((1 - self._buckets[sid][event][0]) / rate, 2)
+    
+    def should_notify(self, sid: str, event: str) -> bool:
+        """At most one over-limit notice per bucket per NOTICE_INTERVAL"""
+        bucket = self._buckets[sid][event]
+        now = time.monotonic()
+        if now - bucket[2] < self.NOTICE_INTERVAL:
+            return False
+        bucket[2] = now
+        self.notices += 1
+        return True
+    
+    def forget(self, sid: str):
+        self._buckets.pop(sid, None)
+        self.throttled_sids.discard(sid)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "limits": {event: {"rate": rate, "burst": burst} for event, (rate, burst) in self.limits.items()},
+            "allowed": dict(self.allowed),
+            "dropped": dict(self.dropped),
+            "notices": self.notices,
+            "tracked_connections": len(self._buckets),
+            "throttled_connections": len(self.throttled_sids)
+        }
+
+socket_rate_limiter = TokenBucketLimiter(parse_rate_limits(SOCKET_RATE_LIMITS))
+system_stats_providers['socket_rate_limits'] = socket_rate_limiter.stats
+
+def instrumented(handler, event: Optional[str] = None):
+    """Count a Socket.IO handler's calls by outcome and time them"""
+    event = event or handler.__name__
+    
+    @functools.wraps(handler)
+    async def wrapper(sid, *args):
+        started = time.perf_counter()
+        outcome = 'error'
+        try:
+            result = await handler(sid, *args)
+            outcome = 'handled'
+            return result
+        except socketio.exceptions.ConnectionRefusedError:
+            outcome = 'refused'
+            raise
+        finally:
+            socketio_event_seconds.observe((event,), time.perf_counter() - started)
+            socketio_events.inc((event, outcome))
+    
+    return wrapper
+
+def rate_limited(handler, event: Optional[str] = None):
+    """Drop over-limit events before the handler (and any DB work or fan-out) runs"""
+    event = event or handler.__name__
+    handler = instrumented(handler, event)
+    
+    @functools.wraps(handler)
+    async def wrapper(sid, *args):
+        if not socket_rate_limiter.allow(sid, event):
+            socketio_events.inc((event, 'rate_limited'))
+            if socket_rate_limiter.should_notify(sid, event):
+                await emit_event('rate_limited', {
+                    'event': event, 'retry_after': socket_rate_limiter.retry_after(sid, event)
+                }, to=sid)
+            return None
+        return await handler(sid, *args)
+    
+    return wrapper
+
+class PresenceRegistry:
+    """Tracks which users are in which Socket.IO rooms, indexed both ways.
+    
+    `rooms` maps room -> {sid: user info} and `sid_rooms` maps sid -> rooms,
+    so joins, leaves and disconnects cost O(rooms of that sid) rather than
+    O(all rooms). Rooms and sids are pruned as soon as their last entry goes.
+    """
+    
+    def __init__(self):
+        self.rooms: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self.sid_rooms: Dict[str, set] = {}
+    
+    def join(self, room_id: str, sid: str, info: Dict[str, Any]) -> bool:
+        """Add a sid to a room; returns False (keeping the original info) if it was already there"""
+        members = self.rooms.setdefault(room_id, {})
+        if sid in members:
+            return False
+        members[sid] = info
+        self.sid_rooms.setdefault(sid, set()).add(room_id)
+        return True
+    
+    def leave(self, room_id: str, sid: str) -> Optional[Dict[str, Any]]:
+        """Remove a sid from a room, returning its user info if it was present"""
+        members = self.rooms.get(room_id)
+        if not members or sid not in members:
+            return None
+        
+        info = members.pop(sid)
+        if not members:
+            del self.rooms[room_id]
+        
+        rooms = self.sid_rooms.get(sid)
+        if rooms is not None:
+            rooms.discard(room_id)
+            if not rooms:
+                del self.sid_rooms[sid]
+        return info
+    
+    def drop_sid(self, sid: str) -> List[tuple]:
+        """Remove a sid from every room it joined, returning (room_id, info) pairs"""
+        departed = []
+        for room_id in self.sid_rooms.pop(sid, ()):
+            members = self.rooms.get(room_id)
+            if members and sid in members:
+                departed.append((room_id, members.pop(sid)))
+                if not members:
+                    del self.rooms[room_id]
+        return departed
+    
+    def members(self, room_id: str) -> List[Dict[str, Any]]:
+        return list(self.rooms.get(room_id, {}).values())
+    
+    def count(self, room_id: str) -> int:
+        return len(self.rooms.get(room_id, ()))
+    
+    def memory_report(self) -> Dict[str, Any]:
+        """Approximate memory held by both indexes"""
+        room_sizes = [len(members) for members in self.rooms.values()]
+        return {
+            "rooms": len(self.rooms),
+            "connections": len(self.sid_rooms),
+            "memberships": sum(room_sizes),
+            "largest_room": max(room_sizes, default=0),
+            "forward_index_bytes": approximate_size(self.rooms),
+            "reverse_index_bytes": approximate_size(self.sid_rooms)
+        }
+
+def approximate_size(obj: Any) -> int:
+    """Deep sys.getsizeof over dicts, lists, sets and tuples (shared objects counted once)"""
+    seen = set()
+    stack = [obj]
+    total = 0
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        total += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, set, tuple, frozenset)):
+            stack.extend(item)
+    return total
+
+class PresenceBroadcaster:
+    """Coalesces room presence changes into at most one delta emit per room per tick.
+    
+    Joins and leaves are buffered per room and flushed as a single
+    `presence_delta` event ({room_id, joined, left, online_count}); a join and
+    leave of the same connection within one tick cancel out. Online counts
+    come from the (possibly shared) presence store. New members get
+    the full `online_users` snapshot once, directly. For comparison, the
+    traffic the previous full-list rebroadcast would have cost is tracked as
+    `legacy_*` counters.
+    """
+    
+    def __init__(self, registry: PresenceRegistry, store, interval: float):
+        self.registry = registry
+        self.store = store
+        self.interval = interval
+        self._joined: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._left: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._wakeup = asyncio.Event()
+        self._snapshot_bytes: Dict[str, int] = {}
+        self.totals = {
+            "emits": 0, "deliveries": 0, "bytes": 0,
+            "legacy_emits": 0, "legacy_deliveries": 0, "legacy_bytes": 0
+        }
+        self.room_stats: Dict[str, Dict[str, int]] = {}
+    
+    def joined(self, room_id: str, info: Dict[str, Any]):
+        self._joined.setdefault(room_id, {})[info['presence_id']] = info
+        self._record_legacy(room_id, info, joining=True)
+        self._wakeup.set()
+    
+    def left(self, room_id: str, info: Dict[str, Any]):
+        pending = self._joined.get(room_id)
+        if pending and info['presence_id'] in pending:
+            del pending[info['presence_id']]
+        else:
+            self._left.setdefault(room_id, {})[info['presence_id']] = {
+                'presence_id': info['presence_id'],
+                'user_id': info['user_id'],
+                'username': info['username']
+            }
+        self._record_legacy(room_id, info, joining=False)
+        self._wakeup.set()
+    
+    async def run(self):
+        """Flush loop: wakes on the first change, waits one tick to coalesce, then emits"""
+        while True:
+            await self._wakeup.wait()
+            await asyncio.sleep(self.interval)
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Error flushing presence updates: {e}")
+    
+    async def flush(self):
+        joined, left = self._joined, self._left
+        self._joined, self._left = {}, {}
+        
+        for room_id in set(joined) | set(left):
+            payload = {
+                'room_id': room_id,
+                'joined': list(joined.get(room_id, {}).values()),
+                'left': list(left.get(room_id, {}).values()),
+                'online_count': await self.store.count(room_id)
+            }
+            if not payload['joined'] and not payload['left']:
+                continue
+            
+            await emit_event('presence_delta', payload, room=room_id)
+            group_discovery.update_online(room_id, payload['online_count'])
+            
+            recipients = payload['online_count']
+            size = len(json.dumps(payload))
+            self._count(room_id, emits=1, deliveries=recipients, bytes=size * recipients)
+    
+    def stats(self) -> Dict[str, Any]:
+        busiest = sorted(self.room_stats.items(), key=lambda item: item[1]['bytes'], reverse=True)[:10]
+        legacy_bytes = self.totals['legacy_bytes']
+        return {
+            **self.totals,
+            "bytes_saved_ratio": round(1 - self.totals['bytes'] / legacy_bytes, 3) if legacy_bytes else 0,
+            "busiest_rooms": dict(busiest)
+        }
+    
+    def _record_legacy(self, room_id: str, info: Dict[str, Any], joining: bool):
+        # The old handlers sent user_joined/user_left plus the full online list to the room
+        # (estimated from this worker's connections)
+        entry_bytes = len(json.dumps(info)) + 2
+        snapshot = self._snapshot_bytes.get(room_id, 2) + (entry_bytes if joining else -entry_bytes)
+        recipients = self.registry.count(room_id)
+        if recipients:
+            self._snapshot_bytes[room_id] = snapshot
+        else:
+            self._snapshot_bytes.pop(room_id, None)
+        
+        announcement_bytes = len(json.dumps({
+            'user_id': info['user_id'],
+            'username': info['username'],
+            'room_id': room_id,
+            'message': f"{info['username']} {'joined' if joining else 'left'} the room"
+        }))
+        self._count(
+            room_id,
+            legacy_emits=2,
+            legacy_deliveries=2 * recipients,
+            legacy_bytes=(snapshot + announcement_bytes) * recipients
+        )
+        if not recipients:
+            self.room_stats.pop(room_id, None)
+    
+    def _count(self, room_id: str, **increments: int):
+        room = self.room_stats.setdefault(room_id, dict.fromkeys(self.totals, 0))
+        for key, value in increments.items():
+            room[key] += value
+            self.totals[key] += value
+
+class InProcessPresenceStore:
+    """Presence kept in this process's PresenceRegistry.
+    
+    Used for a single worker, and by loopback workers sharing one process.
+    """
+    
+    def __init__(self, registry: PresenceRegistry):
+        self.registry = registry
+    
+    async def join(self, room_id: str, sid: str, info: Dict[str, Any]) -> bool:
+        return self.registry.join(room_id, sid, info)
+    
+    async def leave(self, room_id: str, sid: str) -> Optional[Dict[str, Any]]:
+        return self.registry.leave(room_id, sid)
+    
+    async def drop_sid(self, sid: str) -> List[tuple]:
+        return self.registry.drop_sid(sid)
+    
+    async def members(self, room_id: str) -> List[Dict[str, Any]]:
+        return self.registry.members(room_id)
+    
+    async def count(self, room_id: str) -> int:
+        return self.registry.count(room_id)
+    
+    async def heartbeat(self):
+        pass
+    
+    async def close(self):
+        pass
+
+class MongoPresenceStore:
+    """Presence shared by all workers through the `presence` collection.
+    
+    Each worker still indexes its own connections in a local PresenceRegistry,
+    so disconnects need no read, and mirrors every change to Mongo, where
+    room member lists and counts are read. Entries left behind by workers
+    that stop heartbeating are pruned.
+    """
+    
+    def __init__(self, registry: PresenceRegistry, worker_id: str, heartbeat_interval: float):
+        self.registry = registry
+        self.worker_id = worker_id
+        self.heartbeat_interval = heartbeat_interval
+    
+    async def join(self, room_id: str, sid: str, info: Dict[str, Any]) -> bool:
+        if not self.registry.join(room_id, sid, info):
+            return False
+        await db.presence.insert_one({**info, "room_id": room_id, "sid": sid, "worker_id": self.worker_id})
+        return True
+    
+    async def leave(self, room_id: str, sid: str) -> Optional[Dict[str, Any]]:
+        info = self.registry.leave(room_id, sid)
+        if info is not None:
+            await db.presence.delete_one({"room_id": room_id, "sid": sid})
+        return info
+    
+    async def drop_sid(self, sid: str) -> List[tuple]:
+        departed = self.registry.drop_sid(sid)
+        if departed:
+            await db.presence.delete_many({"sid": sid})
+        return departed
+    
+    async def members(self, room_id: str) -> List[Dict[str, Any]]:
+        return await db.presence.find(
+            {"room_id": room_id}, {"_id": 0, "room_id": 0, "sid": 0, "worker_id": 0}
+        ).to_list(None)
+    
+    async def count(self, room_id: str) -> int:
+        return await db.presence.count_documents({"room_id": room_id})
+    
+    async def heartbeat(self):
+        """Record this worker as alive and prune presence of workers that are not"""
+        now = datetime.utcnow()
+        await db.presence_workers.update_one(
+            {"_id": self.worker_id}, {"$set": {"seen_at": now}}, upsert=True
+        )
+        cutoff = now - timedelta(seconds=self.heartbeat_interval * 3)
+        alive = await db.presence_workers.distinct("_id", {"seen_at": {"$gte": cutoff}})
+        await db.presence.delete_many({"worker_id": {"$nin": alive}})
+        await db.presence_workers.delete_many({"seen_at": {"$lt": cutoff}})
+    
+    async def close(self):
+        await db.presence.delete_many({"worker_id": self.worker_id})
+        await db.presence_workers.delete_one({"_id": self.worker_id})
+
+async def presence_heartbeat_loop():
+    """Keep this worker's shared presence entries alive"""
+    while True:
+        try:
+            await presence_store.heartbeat()
+        except Exception as e:
+            logger.error(f"Presence heartbeat error: {e}")
+        await asyncio.sleep(PRESENCE_HEARTBEAT_INTERVAL)
+
+# Users present in each room (study groups, quiz rooms, etc.); this worker's
+# connections are indexed locally, the store is what every worker reads
+presence_registry = PresenceRegistry()
+presence_store = (
+    MongoPresenceStore(presence_registry, WORKER_ID, PRESENCE_HEARTBEAT_INTERVAL)
+    if PRESENCE_STORE == 'mongo' else InProcessPresenceStore(presence_registry)
+)
+presence_broadcaster = PresenceBroadcaster(presence_registry, presence_store, PRESENCE_TICK_INTERVAL)
+system_stats_providers['presence'] = presence_registry.memory_report
+system_stats_providers['presence_broadcasts'] = presence_broadcaster.stats
+
+async def load_socket_identity(user_id: str) -> Optional[Dict[str, Any]]:
+    """The user fields Socket.IO handlers need, or None for an unknown user"""
+    user = await db.users.find_one({"id": user_id}, {"_id": 0, "id": 1, "username": 1, "role": 1})
+    if not user:
+        return None
+    return {'user_id': user['id'], 'username': user.get('username') or user['id'], 'role': user.get('role')}
+
+# Connections are authenticated once; events read the identity from the session
+user_identity_cache = SnapshotCache(
+    load_socket_identity, fresh_ttl=USER_CACHE_TTL, max_stale=USER_CACHE_MAX_STALE, name="user_identity"
+)
+system_stats_providers['user_identity_cache'] = user_identity_cache.stats
 
 @sio.event
-async def connect(sid, environ):
-    """Handle client connection"""
-    logger.info(f"Client connected: {sid}")
-    await sio.emit('connection_response', {'status': 'connected'}, to=sid)
+@instrumented
+async def connect(sid, environ, auth=None):
+    """Handle client connection: verify the JWT and bind the user to the session"""
+    token = auth.get('token') if isinstance(auth, dict) else None
+    if not token:
+        header = environ.get('HTTP_AUTHORIZATION', '')
+        if header.startswith('Bearer '):
+            token = header[len('Bearer '):]
+    if not token:
+        raise socketio.exceptions.ConnectionRefusedError('Authentication required')
+    
+    try:
+        payload = decode_jwt_token(token)
+    except HTTPException as e:
+        raise socketio.exceptions.ConnectionRefusedError(e.detail)
+    
+    identity = await user_identity_cache.get(payload['user_id'])
+    if identity is None:
+        raise socketio.exceptions.ConnectionRefusedError('User not found')
+    
+    encoding = compact_codec.negotiate(sid, auth.get('encoding') if isinstance(auth, dict) else None)
+    await sio.save_session(sid, {**identity, 'encoding': encoding})
+    logger.info(f"Client connected: {sid} ({identity['user_id']})")
+    # Always JSON, so the client learns which encoding it got
+    await sio.emit('connection_response', {
+        'status': 'connected', 'user_id': identity['user_id'], 'encoding': encoding
+    }, to=sid)
 
 @sio.event
-async def disconnect(sid):
+@instrumented
+async def disconnect(sid, reason=None):
     """Handle client disconnection"""
-    logger.info(f"Client disconnected: {sid}")
+    # python-socketio passes the reason; the default keeps its one-argument retry from ever running
+    logger.info(f"Client disconnected: {sid} ({reason or 'unknown reason'})")
     # Remove user from all rooms they were in
-    for room_id, users in active_users.items():
-        if sid in users:
-            user_info = users[sid]
-            del users[sid]
-            await sio.emit('user_left', {
-                'user_id': user_info['user_id'],
-                'username': user_info['username'],
-                'room_id': room_id,
-                'message': f'{user_info["username"]} left the room'
-            }, room=room_id)
-            await sio.emit('online_users', list(users.values()), room=room_id)
+    for room_id, user_info in await presence_store.drop_sid(sid):
+        presence_broadcaster.left(room_id, user_info)
+    await quiz_engine.drop_sid(sid)
+    compact_codec.forget(sid)
+    socket_rate_limiter.forget(sid)
 
 @sio.event
+@rate_limited
 async def join_room(sid, data):
     """Join a specific room (study group, quiz room, etc.)"""
     room_id = data.get('room_id')
-    user_id = data.get('user_id')
-    username = data.get('username', user_id)
+    identity = await sio.get_session(sid)
     
-    await sio.enter_room(sid, room_id)
+    # Same rule as the chat history endpoint: no presence, history or broadcasts for outsiders
+    if not await can_read_chat_room({'id': identity['user_id'], 'role': identity['role']}, room_id):
+        await emit_event('join_rejected', {'room_id': room_id, 'reason': 'not a member'}, to=sid)
+        return
     
-    # Track user in room
-    if room_id not in active_users:
-        active_users[room_id] = {}
+    await enter_event_room(sid, room_id)
     
-    active_users[room_id][sid] = {
-        'user_id': user_id,
-        'username': username,
-        'joined_at': datetime.utcnow()
+    # Track user in room
+    user_info = {
+        'presence_id': uuid.uuid4().hex[:12],
+        'user_id': identity['user_id'],
+        'username': identity['username'],
+        'joined_at': datetime.utcnow().isoformat()
     }
+    if await presence_store.join(room_id, sid, user_info):
+        presence_broadcaster.joined(room_id, user_info)
     
-    await sio.emit('user_joined', {
-        'user_id': user_id,
-        'username': username,
-        'room_id': room_id,
-        'message': f'{username} joined the room'
-    }, room=room_id)
+    # Full user list goes to the new member only; the room gets a coalesced delta
+    await emit_event('online_users', await presence_store.members(room_id), to=sid)
     
-    # Send updated user list
-    await sio.emit('online_users', list(active_users[room_id].values()), room=room_id)
+    # Recent chat history comes from the in-memory ring buffer
+    await emit_event('chat_history', {
+        'room_id': room_id,
+        'messages': [serialize_chat_message(m) for m in await recent_messages.recent(room_id)]
+    }, to=sid)
 
 @sio.event
+@rate_limited
 async def leave_room(sid, data):
     """Leave a specific room"""
     room_id = data.get('room_id')
-    user_id = data.get('user_id')
-    username = data.get('username', user_id)
     
-    await sio.leave_room(sid, room_id)
+    await leave_event_room(sid, room_id)
     
     # Remove user from tracking
-    if room_id in active_users and sid in active_users[room_id]:
-        del active_users[room_id][sid]
-        
-        await sio.emit('user_left', {
-            'user_id': user_id,
-            'username': username,
-            'room_id': room_id,
-            'message': f'{username} left the room'
-        }, room=room_id)
+    user_info = await presence_store.leave(room_id, sid)
+    if user_info is not None:
+        presence_broadcaster.left(room_id, user_info)
+
+class WriteBehindBuffer:
+    """Bounded write-behind buffer that batches inserts into one collection.
+    
+    Documents are flushed with insert_many every `flush_interval` seconds or
+    as soon as `batch_size` are pending. When `max_pending` documents are
+    waiting, producers block (up to `backpressure_timeout`) until a flush
+    frees space, then get asyncio.TimeoutError.
+    """
+    
+    def __init__(self, collection, flush_interval: float, batch_size: int, max_pending: int,
+                 backpressure_timeout: float):
+        self.collection = collection
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.backpressure_timeout = backpressure_timeout
+        self._pending: List[Dict[str, Any]] = []
+        self._flush_now = asyncio.Event()
+        self._has_space = asyncio.Event()
+        self._flush_lock = asyncio.Lock()
+        self.metrics = {
+            "max_depth": 0,
+            "flushes": 0,
+            "documents_written": 0,
+            "failed_flushes": 0,
+            "backpressure_waits": 0,
+            "rejected": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0
+        }
+    
+    async def add(self, document: Dict[str, Any]):
+        """Queue a document for the next flush, waiting for space if the buffer is full"""
+        if len(self._pending) >= self.max_pending:
+            self.metrics['backpressure_waits'] += 1
+            deadline = time.monotonic() + self.backpressure_timeout
+            # Re-check after every wake-up so the bound holds with many waiters
+            while len(self._pending) >= self.max_pending:
+                self._has_space.clear()
+                self._flush_now.set()
+                try:
+                    await asyncio.wait_for(self._has_space.wait(), timeout=max(deadline - time.monotonic(), 0))
+                except asyncio.TimeoutError:
+                    self.metrics['rejected'] += 1
+                    raise
+        
+        self._pending.append(document)
+        self.metrics['max_depth'] = max(self.metrics['max_depth'], len(self._pending))
+        if len(self._pending) >= self.batch_size:
+            self._flush_now.set()
+    
+    async def run(self):
+        """Flush loop started in lifespan"""
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+    
+    async def flush(self):
+        """Write out everything pending; documents that failed are put back for the next attempt.
         
-        # Send updated user list
-        await sio.emit('online_users', list(active_users[room_id].values()), room=room_id)
+        insert_many gives every document an _id before sending, so a retried
+        document that did land the first time fails with a duplicate key
+        error; those count as written rather than going back on the queue.
+        """
+        async with self._flush_lock:
+            while self._pending:
+                batch = self._pending[:self.batch_size]
+                del self._pending[:len(batch)]
+                started = time.perf_counter()
+                try:
+                    await self.collection.insert_many(batch, ordered=False)
+                    written = len(batch)
+                except asyncio.CancelledError:
+                    self._pending[:0] = batch
+                    raise
+                except BulkWriteError as e:
+                    failed = [
+                        batch[error['index']] for error in e.details.get('writeErrors', [])
+                        if error.get('code') != 11000
+                    ]
+                    written = len(batch) - len(failed)
+                    if failed:
+                        self._pending[:0] = failed
+                        self.metrics['failed_flushes'] += 1
+                        logger.error(f"Error flushing {len(failed)} of {len(batch)} documents to {self.collection.name}: {e}")
+                        self._record_flush(started, written)
+                        break
+                except Exception as e:
+                    self._pending[:0] = batch
+                    self.metrics['failed_flushes'] += 1
+                    logger.error(f"Error flushing {len(batch)} documents to {self.collection.name}: {e}")
+                    break
+                
+                self._record_flush(started, written)
+    
+    def _record_flush(self, started: float, written: int):
+        if written:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            self.metrics['flushes'] += 1
+            self.metrics['documents_written'] += written
+            self.metrics['last_flush_ms'] = round(elapsed_ms, 2)
+            self.metrics['max_flush_ms'] = max(self.metrics['max_flush_ms'], round(elapsed_ms, 2))
+            self.metrics['total_flush_ms'] += elapsed_ms
+            self._has_space.set()
+    
+    def stats(self) -> Dict[str, Any]:
+        flushes = self.metrics['flushes']
+        return {
+            **self.metrics,
+            "depth": len(self._pending),
+            "avg_flush_ms": round(self.metrics['total_flush_ms'] / flushes, 2) if flushes else 0.0
+        }
+
+# Chat messages are broadcast first and persisted in batches
+chat_buffer = WriteBehindBuffer(
+    db.chat_messages,
+    flush_interval=CHAT_FLUSH_INTERVAL,
+    batch_size=CHAT_FLUSH_BATCH_SIZE,
+    max_pending=CHAT_BUFFER_LIMIT,
+    backpressure_timeout=CHAT_BACKPRESSURE_TIMEOUT
+)
+system_stats_providers['chat_buffer'] = chat_buffer.stats
+
+def serialize_chat_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """JSON-ready copy of a stored chat message"""
+    message = {key: value for key, value in message.items() if key != '_id'}
+    if isinstance(message.get('timestamp'), datetime):
+        message['timestamp'] = message['timestamp'].isoformat()
+    return message
+
+class RecentMessageCache:
+    """Per-room ring buffers of the latest chat messages, so room joins need no database read.
+    
+    A room's ring is filled by send_message; the first read after a restart
+    (or after LRU eviction) merges it once with the newest stored messages.
+    With several workers a ring only sees local sends, so it is not
+    `authoritative` and every read merges with the stored messages.
+    """
+    
+    def __init__(self, size: int, max_rooms: int, authoritative: bool = True):
+        self.size = size
+        self.max_rooms = max_rooms
+        self.authoritative = authoritative
+        self._rooms: "OrderedDict[str, deque]" = OrderedDict()
+        self._warm: set = set()
+        self.hits = 0
+        self.warmups = 0
+    
+    def append(self, room_id: str, message: Dict[str, Any]):
+        ring = self._rooms.get(room_id)
+        if ring is None:
+            ring = self._rooms[room_id] = deque(maxlen=self.size)
+            self._evict()
+        ring.append(message)
+        self._rooms.move_to_end(room_id)
+    
+    async def recent(self, room_id: str) -> List[Dict[str, Any]]:
+        """Latest messages for a room, oldest first"""
+        if room_id in self._warm:
+            self.hits += 1
+            self._rooms.move_to_end(room_id)
+            return list(self._rooms[room_id])
+        
+        self.warmups += 1
+        stored = await db.chat_messages.find(
+            {"room_id": room_id}, {"_id": 0}
+        ).sort([("timestamp", -1), ("id", -1)]).limit(self.size).to_list(self.size)
+        
+        # Merge with anything appended (possibly not yet flushed) before the warm-up
+        merged = {m['id']: m for m in stored}
+        merged.update((m['id'], m) for m in self._rooms.get(room_id, ()))
+        newest = sorted(merged.values(), key=lambda m: (m['timestamp'], m['id']))[-self.size:]
+        
+        self._rooms[room_id] = deque(newest, maxlen=self.size)
+        self._rooms.move_to_end(room_id)
+        if self.authoritative:
+            self._warm.add(room_id)
+        self._evict()
+        return newest
+    
+    def stats(self) -> Dict[str, Any]:
+        return {"rooms": len(self._rooms), "warm_rooms": len(self._warm), "hits": self.hits, "warmups": self.warmups}
+    
+    def _evict(self):
+        while len(self._rooms) > self.max_rooms:
+            room_id, _ = self._rooms.popitem(last=False)
+            self._warm.discard(room_id)
+
+recent_messages = RecentMessageCache(
+    CHAT_RECENT_MESSAGES, CHAT_RECENT_MAX_ROOMS, authoritative=not SOCKETIO_MESSAGE_QUEUE
+)
+system_stats_providers['recent_messages'] = recent_messages.stats
 
 @sio.event
+@rate_limited
 async def send_message(sid, data):
     """Send chat message to room"""
     room_id = data.get('room_id')
-    user_id = data.get('user_id')
-    username = data.get('username')
     message = data.get('message')
+    identity = await sio.get_session(sid)
     
     # Create message object with proper timestamp
     chat_message = ChatMessage(
         room_id=room_id,
-        user_id=user_id,
-        username=username,
+        user_id=identity['user_id'],
+        username=identity['username'],
         message=message,
         timestamp=datetime.utcnow()
     )
     
-    # Save to database
+    # Queue for batched persistence (waits only when the buffer is full)
     message_dict = chat_message.dict()
-    await db.chat_messages.insert_one(message_dict)
+    try:
+        await chat_buffer.add(message_dict)
+    except asyncio.TimeoutError:
+        await emit_event('message_rejected', {'id': chat_message.id, 'reason': 'server busy'}, to=sid)
+        return
+    recent_messages.append(room_id, message_dict)
     
     # Broadcast to room with serialized timestamp
-    message_dict['timestamp'] = message_dict['timestamp'].isoformat()
-    await sio.emit('new_message', message_dict, room=room_id)
-
-@sio.event
-async def quiz_answer(sid, data):
-    """Handle live quiz answer submission"""
-    room_id = data.get('room_id')
-    user_id = data.get('user_id')
-    question_id = data.get('question_id')
-    answer = data.get('answer')
-    
-    # Process answer and broadcast results
-    await sio.emit('answer_submitted', {
-        'user_id': user_id,
-        'question_id': question_id,
-        'timestamp': datetime.utcnow().isoformat()
-    }, room=room_id)
+    await emit_event('new_message', {**message_dict, 'timestamp': chat_message.timestamp.isoformat()}, room=room_id)
 
-# ================================
-# API ENDPOINTS
-# ================================
+def normalize_answer(answer: Any) -> str:
+    """Canonical form used to compare a submitted answer with the answer key"""
+    return str(answer or '').strip().casefold()
+
+class LiveQuizRoom:
+    """In-memory state of one quiz room: questions, cached answer key and scoreboard"""
+    
+    PUBLIC_QUESTION_FIELDS = ('id', 'content', 'question_type', 'subject', 'difficulty', 'options')
+    
+    def __init__(self, room: Dict[str, Any], questions: List[Dict[str, Any]]):
+        self.id = room['id']
+        self.room_code = room['room_code']
+        self.host_id = room['host_id']
+        self.assessment_id = room['assessment_id']
+        self.allowed = set(room.get('participants', []))
+        self.status = room.get('status', 'waiting')
+        self.started_at: Optional[datetime] = None
+        self.last_activity = time.monotonic()
+        
+        # The answer key never leaves the server; clients only get the public fields
+        self.answer_key = {q['id']: normalize_answer(q.get('correct_answer')) for q in questions}
+        self.reveals = {
+            q['id']: {'correct_answer': q.get('correct_answer'), 'explanation': q.get('explanation', '')}
+            for q in questions
+        }
+        self.questions = [
+            {field: q.get(field) for field in self.PUBLIC_QUESTION_FIELDS} for q in questions
+        ]
+        self.option_index = [
+            {normalize_answer(option): i for i, option in enumerate(q.get('options') or [])}
+            for q in questions
+        ]
+        
+        self.current = -1
+        self.question_started = 0.0
+        self.accepting = False
+        self.answered: set = set()
+        self.correct_count = 0
+        self.option_counts: List[int] = []
+        self.all_answered = asyncio.Event()
+        # The host watches and drives the quiz but does not play: their sockets
+        # stay out of players/connections so "everyone answered" can be reached
+        self.players: Dict[str, Dict[str, Any]] = {}
+        self.connections: Dict[str, set] = {}
+        self.host_sids: set = set()
+        self.task: Optional[asyncio.Task] = None
+        self._leaderboard: List[Dict[str, Any]] = []
+        self._leaderboard_dirty = False
+    
+    def begin_question(self, index: int):
+        self.current = index
+        self.question_started = time.monotonic()
+        self.answered = set()
+        self.correct_count = 0
+        self.option_counts = [0] * len(self.option_index[index])
+        self.all_answered.clear()
+        self.accepting = True
+        self.check_all_answered()
+    
+    def grade(self, user_id: str, answer: Any, time_limit: int, max_points: int) -> Dict[str, Any]:
+        """Grade the current question for one player and fold it into their totals"""
+        question_id = self.questions[self.current]['id']
+        elapsed = time.monotonic() - self.question_started
+        is_correct = normalize_answer(answer) == self.answer_key[question_id]
+        # Correct answers earn between max_points (instant) and half of it (at the buzzer)
+        points = round(max_points * (1 - 0.5 * min(elapsed / time_limit, 1))) if is_correct else 0
+        
+        player = self.players[user_id]
+        player['score'] += points
+        player['correct'] += int(is_correct)
+        player['answers'].append({
+            'question_id': question_id,
+            'answer': str(answer or ''),
+            'is_correct': is_correct,
+            'time_taken': int(elapsed)
+        })
+        self.answered.add(user_id)
+        self.correct_count += int(is_correct)
+        option = self.option_index[self.current].get(normalize_answer(answer))
+        if option is not None:
+            self.option_counts[option] += 1
+        self._leaderboard_dirty = True
+        self.check_all_answered()
+        return {'is_correct': is_correct, 'points': points}
+    
+    def distribution(self) -> Dict[str, Any]:
+        """Compact answer-distribution snapshot of the current question"""
+        return {
+            'room_code': self.room_code,
+            'question_id': self.questions[self.current]['id'],
+            'answered': len(self.answered),
+            'total': len(self.connections),
+            'counts': list(self.option_counts)
+        }
+    
+    def leaderboard(self) -> List[Dict[str, Any]]:
+        """Players ranked by score, re-sorted only after scores change"""
+        if self._leaderboard_dirty or len(self._leaderboard) != len(self.players):
+            ranked = sorted(self.players.values(), key=lambda p: (-p['score'], -p['correct'], p['username']))
+            self._leaderboard = [
+                {'rank': rank, 'user_id': p['user_id'], 'username': p['username'],
+                 'score': p['score'], 'correct': p['correct']}
+                for rank, p in enumerate(ranked, start=1)
+            ]
+            self._leaderboard_dirty = False
+        return self._leaderboard
+    
+    def snapshot(self, time_limit: int) -> Dict[str, Any]:
+        """Full room state for a (re)joining client"""
+        state = {
+            'room_code': self.room_code,
+            'host_id': self.host_id,
+            'status': self.status,
+            'participants': list(self.connections),
+            'total_questions': len(self.questions),
+            'question_number': self.current + 1,
+            'leaderboard': self.leaderboard()
+        }
+        if self.accepting:
+            state['question'] = self.questions[self.current]
+            state['time_remaining'] = max(int(time_limit - (time.monotonic() - self.question_started)), 0)
+        return state
+    
+    def check_all_answered(self):
+        if self.accepting and self.connections and self.answered.issuperset(self.connections):
+            self.all_answered.set()
+
+class AnswerDistributionBroadcaster:
+    """Rate-limited answer-distribution snapshots for live quiz questions.
+    
+    Answers only mark their room dirty; at most once per `interval` each
+    dirty room gets one `answer_distribution` snapshot ({room_code,
+    question_id, answered, total, counts}), and a question's final snapshot
+    is sent as soon as it closes (at the latest when everyone has answered).
+    Outbound emits grow with question time rather than with
+    participants × answers.
+    """
+    
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._dirty: Dict[str, LiveQuizRoom] = {}
+        self._wakeup = asyncio.Event()
+        self.metrics = {"answers": 0, "emits": 0, "deliveries": 0, "bytes": 0}
+    
+    def mark(self, room: LiveQuizRoom):
+        self.metrics['answers'] += 1
+        self._dirty[room.room_code] = room
+        self._wakeup.set()
+    
+    async def run(self):
+        """Emit loop: sends the first change right away, then at most one snapshot per room per tick"""
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            dirty, self._dirty = self._dirty, {}
+            for room in dirty.values():
+                # Closed questions get their final snapshot from flush_room
+                if not room.accepting:
+                    continue
+                try:
+                    await self._emit(room)
+                except Exception as e:
+                    logger.error(f"Error broadcasting answer distribution for {room.room_code}: {e}")
+            await asyncio.sleep(self.interval)
+    
+    async def flush_room(self, room: LiveQuizRoom):
+        """Send a closing question's final snapshot if it changed since the last tick"""
+        if self._dirty.pop(room.room_code, None) is not None:
+            await self._emit(room)
+    
+    def stats(self) -> Dict[str, Any]:
+        emits = self.metrics['emits']
+        return {
+            **self.metrics,
+            "pending_rooms": len(self._dirty),
+            "answers_per_emit": round(self.metrics['answers'] / emits, 2) if emits else 0
+        }
+    
+    async def _emit(self, room: LiveQuizRoom):
+        payload = room.distribution()
+        await emit_event('answer_distribution', payload, room=room.id)
+        self.metrics['emits'] += 1
+        self.metrics['deliveries'] += payload['total']
+        self.metrics['bytes'] += len(json.dumps(payload)) * payload['total']
+
+class QuizEngine:
+    """Server-authoritative live quiz rooms.
+    
+    A room is loaded once (room document, assessment and answer key) when its
+    first participant joins, then driven waiting → active → completed by a
+    task on the event loop: each question runs on a timer that ends early
+    once every connected participant has answered, answers are graded in
+    memory and folded into the scoreboard as they arrive. Apart from the
+    current_question marker nothing is written while the quiz runs; on
+    completion the room and every player's result are written in bulk.
+    Rooms live on the worker that loaded them, so multi-worker deployments
+    need sticky routing per room. Rooms that were never started are unloaded
+    once nobody has been connected for `idle_ttl` seconds.
+    """
+    
+    def __init__(self, question_time_limit: int, results_pause: float, max_points: int,
+                 distribution: AnswerDistributionBroadcaster, idle_ttl: float):
+        self.question_time_limit = question_time_limit
+        self.results_pause = results_pause
+        self.max_points = max_points
+        self.distribution = distribution
+        self.idle_ttl = idle_ttl
+        self.rooms: Dict[str, LiveQuizRoom] = {}
+        self.sid_rooms: Dict[str, set] = {}
+        self._loading: Dict[str, asyncio.Future] = {}
+        self.metrics = {
+            "rooms_loaded": 0,
+            "rooms_completed": 0,
+            "rooms_evicted": 0,
+            "questions_run": 0,
+            "answers_graded": 0,
+            "answers_rejected": 0,
+            "results_written": 0,
+            "failed_writes": 0,
+            "total_grade_us": 0.0,
+            "max_grade_us": 0.0
+        }
+    
+    async def room(self, room_code: str) -> Optional[LiveQuizRoom]:
+        """Cached room for a code, loading it once even under concurrent joins"""
+        room = self.rooms.get(room_code)
+        if room is not None:
+            return room
+        loading = self._loading.get(room_code)
+        if loading is None:
+            loading = self._loading[room_code] = asyncio.ensure_future(self._load(room_code))
+            loading.add_done_callback(lambda _: self._loading.pop(room_code, None))
+        return await asyncio.shield(loading)
+    
+    async def join(self, sid: str, room_code: str, user_id: str, username: str) -> Optional[str]:
+        """Attach a connection to a room; returns a reason string if it was refused"""
+        room = await self.room(room_code)
+        if room is None:
+            return "Quiz room not found"
+        
+        if user_id not in room.allowed:
+            # Joined through the REST endpoint after this room was loaded (possibly on another worker)
+            if not await db.quiz_rooms.find_one({"id": room.id, "participants": user_id}, {"_id": 1}):
+                return "Join the room before connecting"
+            room.allowed.add(user_id)
+        
+        await enter_event_room(sid, room.id)
+        room.last_activity = time.monotonic()
+        self.sid_rooms.setdefault(sid, set()).add(room_code)
+        if user_id == room.host_id:
+            room.host_sids.add(sid)
+            await emit_event('quiz_state', room.snapshot(self.question_time_limit), to=sid)
+            return None
+        
+        room.players.setdefault(user_id, {
+            'user_id': user_id, 'username': username or user_id, 'score': 0, 'correct': 0, 'answers': []
+        })
+        first_connection = user_id not in room.connections
+        room.connections.setdefault(user_id, set()).add(sid)
+        
+        await emit_event('quiz_state', room.snapshot(self.question_time_limit), to=sid)
+        if first_connection:
+            await emit_event('participant_joined', {'user_id': user_id, 'username': username}, room=room.id, skip_sid=sid)
+        return None
+    
+    def admit(self, room_code: str, user_id: str):
+        """Note a REST join for a room this worker already holds"""
+        room = self.rooms.get(room_code)
+        if room is not None:
+            room.allowed.add(user_id)
+    
+    async def drop_sid(self, sid: str):
+        for room_code in self.sid_rooms.pop(sid, ()):
+            room = self.rooms.get(room_code)
+            if room is None:
+                continue
+            room.last_activity = time.monotonic()
+            room.host_sids.discard(sid)
+            for user_id, sids in list(room.connections.items()):
+                if sid in sids:
+                    sids.discard(sid)
+                    if not sids:
+                        del room.connections[user_id]
+                        await emit_event('participant_left', {'user_id': user_id}, room=room.id)
+            # The last player still thinking may just have left
+            room.check_all_answered()
+    
+    def start(self, room: LiveQuizRoom):
+        room.status = 'active'
+        room.started_at = datetime.utcnow()
+        room.task = asyncio.create_task(self._run(room))
+        room.task.add_done_callback(self._log_failure)
+    
+    def answer(self, sid: str, room_code: str, user_id: str, question_id: Optional[str], answer: Any) -> Optional[str]:
+        """Grade an answer to the current question; returns a reason string if it was rejected"""
+        started = time.perf_counter()
+        room = self.rooms.get(room_code)
+        reason = None
+        if room is None or room.status != 'active' or not room.accepting:
+            reason = "No question is open"
+        elif sid not in room.connections.get(user_id, ()):
+            reason = "Not a participant"
+        elif question_id and question_id != room.questions[room.current]['id']:
+            reason = "Question is closed"
+        elif user_id in room.answered:
+            reason = "Already answered"
+        elif time.monotonic() - room.question_started > self.question_time_limit:
+            reason = "Time is up"
+        
+        if reason is not None:
+            self.metrics['answers_rejected'] += 1
+            return reason
+        
+        room.grade(user_id, answer, self.question_time_limit, self.max_points)
+        self.distribution.mark(room)
+        elapsed_us = (time.perf_counter() - started) * 1e6
+        self.metrics['answers_graded'] += 1
+        self.metrics['total_grade_us'] += elapsed_us
+        self.metrics['max_grade_us'] = max(self.metrics['max_grade_us'], round(elapsed_us, 1))
+        return None
+    
+    def evict_idle(self) -> int:
+        """Unload rooms that were loaded but never started and have nobody connected"""
+        cutoff = time.monotonic() - self.idle_ttl
+        idle = [
+            room_code for room_code, room in self.rooms.items()
+            if room.task is None and not room.connections and not room.host_sids
+            and room.last_activity < cutoff
+        ]
+        for room_code in idle:
+            del self.rooms[room_code]
+        self.metrics['rooms_evicted'] += len(idle)
+        return len(idle)
+    
+    async def run(self):
+        """Sweep loop unloading idle rooms"""
+        while True:
+            await asyncio.sleep(max(self.idle_ttl / 4, 1))
+            self.evict_idle()
+    
+    async def close(self):
+        """Cancel running quizzes on shutdown"""
+        tasks = [room.task for room in self.rooms.values() if room.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    
+    def stats(self) -> Dict[str, Any]:
+        statuses: Dict[str, int] = {}
+        for room in self.rooms.values():
+            statuses[room.status] = statuses.get(room.status, 0) + 1
+        graded = self.metrics['answers_graded']
+        return {
+            **self.metrics,
+            "rooms": statuses,
+            "players": sum(len(room.players) for room in self.rooms.values()),
+            "connections": len(self.sid_rooms),
+            "avg_grade_us": round(self.metrics['total_grade_us'] / graded, 1) if graded else 0.0
+        }
+    
+    async def _load(self, room_code: str) -> Optional[LiveQuizRoom]:
+        room_doc = await db.quiz_rooms.find_one({"room_code": room_code}, {"_id": 0})
+        if not room_doc or room_doc.get('status') == 'completed':
+            return None
+        
+        assessment = await db.assessments.find_one({"id": room_doc['assessment_id']}, {"_id": 0, "questions": 1})
+        question_ids = assessment['questions'] if assessment else []
+        fetched = await db.questions.find(
+            {"id": {"$in": question_ids}},
+            {"_id": 0, "item_stats": 0, "hints": 0, "created_by": 0, "created_at": 0}
+        ).to_list(None)
+        by_id = {q['id']: q for q in fetched}
+        questions = [by_id[question_id] for question_id in question_ids if question_id in by_id]
+        
+        room = LiveQuizRoom(room_doc, questions)
+        if room.status == 'active':
+            # The worker that ran it is gone; the remaining questions can only be restarted
+            room.status = 'waiting'
+        self.rooms[room_code] = room
+        self.metrics['rooms_loaded'] += 1
+        return room
+    
+    async def _run(self, room: LiveQuizRoom):
+        await db.quiz_rooms.update_one(
+            {"id": room.id},
+            {"$set": {"status": "active", "start_time": room.started_at, "current_question": 0}}
+        )
+        await emit_event('quiz_started', {
+            'room_code': room.room_code, 'total_questions': len(room.questions)
+        }, room=room.id)
+        
+        for index, question in enumerate(room.questions):
+            room.begin_question(index)
+            self.metrics['questions_run'] += 1
+            if index:
+                await db.quiz_rooms.update_one({"id": room.id}, {"$set": {"current_question": index}})
+            await emit_event('new_question', {
+                'question': question,
+                'question_number': index + 1,
+                'time_limit': self.question_time_limit
+            }, room=room.id)
+            
+            try:
+                await asyncio.wait_for(room.all_answered.wait(), timeout=self.question_time_limit)
+            except asyncio.TimeoutError:
+                pass
+            room.accepting = False
+            await self.distribution.flush_room(room)
+            
+            await emit_event('question_results', {
+                'question_id': question['id'],
+                **room.reveals[question['id']],
+                'answered': len(room.answered),
+                'correct': room.correct_count,
+                'leaderboard': room.leaderboard()
+            }, room=room.id)
+            if index + 1 < len(room.questions):
+                await asyncio.sleep(self.results_pause)
+        
+        await self._complete(room)
+    
+    async def _complete(self, room: LiveQuizRoom):
+        room.status = 'completed'
+        ended_at = datetime.utcnow()
+        leaderboard = room.leaderboard()
+        await emit_event('quiz_completed', {
+            'room_code': room.room_code, 'final_leaderboard': leaderboard
+        }, room=room.id)
+        
+        total_questions = len(room.questions)
+        results = [
+            {
+                "id": str(uuid.uuid4()),
+                "room_id": room.id,
+                "room_code": room.room_code,
+                "assessment_id": room.assessment_id,
+                "user_id": entry['user_id'],
+                "username": entry['username'],
+                "rank": entry['rank'],
+                "points": entry['score'],
+                "correct": entry['correct'],
+                "total_questions": total_questions,
+                "score": (entry['correct'] / total_questions) * 100 if total_questions else 0,
+                "answers": room.players[entry['user_id']]['answers'],
+                "completed_at": ended_at
+            }
+            for entry in leaderboard
+        ]
+        try:
+            writes = [db.quiz_rooms.update_one(
+                {"id": room.id},
+                {"$set": {"status": "completed", "end_time": ended_at, "current_question": max(room.current, 0)}}
+            )]
+            if results:
+                writes.append(db.quiz_results.insert_many(results, ordered=False))
+            await asyncio.gather(*writes)
+            self.metrics['results_written'] += len(results)
+        except Exception as e:
+            self.metrics['failed_writes'] += 1
+            logger.error(f"Error writing results for quiz room {room.room_code}: {e}")
+        
+        self.metrics['rooms_completed'] += 1
+        self.rooms.pop(room.room_code, None)
+        for sid in set().union(room.host_sids, *room.connections.values()):
+            codes = self.sid_rooms.get(sid)
+            if codes is not None:
+                codes.discard(room.room_code)
+                if not codes:
+                    del self.sid_rooms[sid]
+    
+    @staticmethod
+    def _log_failure(task: asyncio.Task):
+        if not task.cancelled() and task.exception() is not None:
+            logger.error(f"Quiz room failed: {task.exception()}")
+
+quiz_distribution = AnswerDistributionBroadcaster(QUIZ_DISTRIBUTION_INTERVAL)
+quiz_engine = QuizEngine(
+    QUIZ_QUESTION_TIME_LIMIT, QUIZ_RESULTS_PAUSE, QUIZ_MAX_POINTS, quiz_distribution, QUIZ_ROOM_IDLE_TTL
+)
+system_stats_providers['quiz_engine'] = quiz_engine.stats
+system_stats_providers['quiz_distribution'] = quiz_distribution.stats
+
+async def join_quiz_room_event(sid, data):
+    """Attach a connection to a live quiz room"""
+    identity = await sio.get_session(sid)
+    reason = await quiz_engine.join(sid, data.get('room_code'), identity['user_id'], identity['username'])
+    if reason is not None:
+        await emit_event('quiz_error', {'room_code': data.get('room_code'), 'reason': reason}, to=sid)
+
+# Registered by hand: the REST join endpoint below is also called join_quiz_room
+sio.on('join_quiz_room', rate_limited(join_quiz_room_event, 'join_quiz_room'))
+
+@sio.event
+@rate_limited
+async def quiz_answer(sid, data):
+    """Handle live quiz answer submission"""
+    room_code = data.get('room_code')
+    user_id = (await sio.get_session(sid))['user_id']
+    question_id = data.get('question_id')
+    
+    reason = quiz_engine.answer(sid, room_code, user_id, question_id, data.get('answer'))
+    if reason is not None:
+        await emit_event('answer_rejected', {'question_id': question_id, 'reason': reason}, to=sid)
+        return
+    
+    # Acknowledge to the sender only; the room sees aggregated answer_distribution snapshots
+    await emit_event('answer_submitted', {
+        'user_id': user_id,
+        'question_id': question_id,
+        'timestamp': datetime.utcnow().isoformat()
+    }, to=sid)
+
+# ================================
+# API ENDPOINTS
+# ================================
 
 # Health Check
 @api_router.get("/")
@@ -586,6 +2469,46 @@ async def root():
     """Health check endpoint"""
     return {"message": "IDFS StarGuide API is running", "version": "1.0.0"}
 
+@api_router.get("/system/stats")
+async def get_system_stats(current_user: dict = Depends(get_current_user)):
+    """Get in-process subsystem state such as presence memory footprint (for admins)"""
+    if current_user['role'] != UserRole.ADMIN:
+        raise HTTPException(status_code=403, detail="Access denied")
+    
+    return {name: provider() for name, provider in system_stats_providers.items()}
+
+def stats_gauge_lines() -> List[str]:
+    """Numeric values of the system stats providers (top level and one nested level) as gauges"""
+    lines = []
+    for provider_name, provider in system_stats_providers.items():
+        try:
+            stats = provider()
+        except Exception as e:
+            logger.error(f"Stats provider {provider_name} failed: {e}")
+            continue
+        values = []
+        for key, value in stats.items():
+            if isinstance(value, dict):
+                values.extend((f"{key}_{inner}", item) for inner, item in value.items())
+            else:
+                values.append((key, value))
+        for key, value in values:
+            if isinstance(value, (int, float)):
+                name = re.sub(r'[^a-zA-Z0-9_]', '_', f"starguide_{provider_name}_{key}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {float(value)}")
+    return lines
+
+@app.get("/metrics", include_in_schema=False)
+async def get_metrics(request: Request):
+    """Prometheus text exposition of request, MongoDB and Socket.IO timings plus subsystem gauges"""
+    if METRICS_TOKEN and request.headers.get('authorization') != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    
+    lines = [line for metric in METRICS for line in metric.render()]
+    lines.extend(stats_gauge_lines())
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # ================================
 # AUTHENTICATION ENDPOINTS
 # ================================
@@ -745,6 +2668,7 @@ async def chat_with_ai(message_data: AIMessage, current_user: dict = Depends(get
         )
         
         await db.ai_conversations.insert_one(conversation.dict())
+        dashboard_cache.invalidate(current_user['id'])
         
         # Award XP for AI interaction
         await award_xp(current_user['id'], 10, "ai_chat")
@@ -866,6 +2790,10 @@ async def get_questions(
     subject: Optional[str] = None,
     difficulty: Optional[str] = None,
     question_type: Optional[str] = None,
+    empirical_difficulty: Optional[str] = None,
+    min_p_value: Optional[float] = None,
+    max_p_value: Optional[float] = None,
+    min_discrimination: Optional[float] = None,
     limit: int = 50
 ):
     """Get questions with filters"""
@@ -877,6 +2805,16 @@ async def get_questions(
             query["difficulty"] = difficulty
         if question_type:
             query["question_type"] = question_type
+        if empirical_difficulty:
+            query["item_stats.difficulty_band"] = empirical_difficulty
+        if min_p_value is not None or max_p_value is not None:
+            query["item_stats.p_value"] = {}
+            if min_p_value is not None:
+                query["item_stats.p_value"]["$gte"] = min_p_value
+            if max_p_value is not None:
+                query["item_stats.p_value"]["$lte"] = max_p_value
+        if min_discrimination is not None:
+            query["item_stats.discrimination"] = {"$gte": min_discrimination}
         
         questions = await db.questions.find(query).limit(limit).to_list(limit)
         
@@ -889,6 +2827,204 @@ async def get_questions(
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.post("/questions/stats/recompute")
+async def recompute_question_stats(current_user: dict = Depends(get_current_user)):
+    """Rebuild item statistics from all assessment results (for admins)"""
+    try:
+        if current_user['role'] != UserRole.ADMIN:
+            raise HTTPException(status_code=403, detail="Access denied")
+        
+        summary = await recompute_item_stats()
+        
+        return {"message": "Item statistics recomputed successfully", **summary}
+        
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ================================
+# ITEM ANALYSIS
+# ================================
+
+# Raw running sums kept under question.item_stats; derived fields are recomputed from them
+ITEM_STATS_SUMS = [
+    "attempts", "correct", "sum_time", "timed_attempts",
+    "sum_total", "sum_total_sq", "sum_total_correct"
+]
+
+def item_difficulty_band(p_value):
+    """Empirical difficulty band for a p-value (proportion correct)"""
+    return "easy" if p_value >= 0.7 else "hard" if p_value < 0.3 else "medium"
+
+def derive_item_stats(attempts, correct, sum_time, timed_attempts, sum_total, sum_total_sq, sum_total_correct):
+    """p-value, mean time and point-biserial discrimination from running sums (element-wise)"""
+    n, n1 = np.asarray(attempts, dtype=float), np.asarray(correct, dtype=float)
+    n0 = n - n1
+    with np.errstate(divide='ignore', invalid='ignore'):
+        p_value = np.where(n > 0, n1 / n, np.nan)
+        mean_time = np.where(np.asarray(timed_attempts) > 0, np.asarray(sum_time) / np.asarray(timed_attempts), np.nan)
+        
+        # r_pb = (M1 - M0) / s * sqrt(p * q), with M1/M0 the mean total score of correct/incorrect responders
+        mean_total = np.asarray(sum_total) / n
+        std_total = np.sqrt(np.maximum(np.asarray(sum_total_sq) / n - mean_total ** 2, 0.0))
+        mean_correct = np.asarray(sum_total_correct) / n1
+        mean_incorrect = (np.asarray(sum_total) - np.asarray(sum_total_correct)) / n0
+        discrimination = np.where(
+            (n1 > 0) & (n0 > 0) & (std_total > 0),
+            (mean_correct - mean_incorrect) / std_total * np.sqrt(n1 * n0) / n,
+            np.nan
+        )
+    return {"p_value": p_value, "mean_time": mean_time, "discrimination": discrimination}
+
+def item_stats_derivation_stage() -> Dict[str, Any]:
+    """Pipeline stage recomputing the derived item_stats fields from the running sums"""
+    n, n1 = "$item_stats.attempts", "$item_stats.correct"
+    n0 = {"$subtract": [n, n1]}
+    mean_total = {"$divide": ["$item_stats.sum_total", n]}
+    variance = {"$subtract": [{"$divide": ["$item_stats.sum_total_sq", n]}, {"$multiply": [mean_total, mean_total]}]}
+    std_total = {"$sqrt": {"$max": [variance, 0]}}
+    mean_correct = {"$divide": ["$item_stats.sum_total_correct", {"$max": [n1, 1]}]}
+    mean_incorrect = {"$divide": [
+        {"$subtract": ["$item_stats.sum_total", "$item_stats.sum_total_correct"]}, {"$max": [n0, 1]}
+    ]}
+    p_value = {"$divide": [n1, n]}
+    
+    return {"$set": {
+        "item_stats.p_value": p_value,
+        "item_stats.mean_time": {"$cond": [
+            {"$gt": ["$item_stats.timed_attempts", 0]},
+            {"$divide": ["$item_stats.sum_time", "$item_stats.timed_attempts"]},
+            None
+        ]},
+        "item_stats.discrimination": {"$cond": [
+            {"$and": [{"$gt": [n1, 0]}, {"$gt": [n0, 0]}, {"$gt": [std_total, 0]}]},
+            {"$multiply": [
+                {"$divide": [{"$subtract": [mean_correct, mean_incorrect]}, {"$max": [std_total, 1e-12]}]},
+                {"$divide": [{"$sqrt": {"$multiply": [n1, n0]}}, n]}
+            ]},
+            None
+        ]},
+        "item_stats.difficulty_band": {"$cond": [
+            {"$lt": [n, ITEM_STATS_MIN_ATTEMPTS]},
+            None,
+            {"$switch": {
+                "branches": [
+                    {"case": {"$gte": [p_value, 0.7]}, "then": "easy"},
+                    {"case": {"$lt": [p_value, 0.3]}, "then": "hard"}
+                ],
+                "default": "medium"
+            }}
+        ]},
+        "item_stats.updated_at": "$$NOW"
+    }}
+
+async def record_item_responses(answers: List[StudentAnswer], total_score: float):
+    """Fold one submission's answers into each question's running item statistics"""
+    try:
+        derivation = item_stats_derivation_stage()
+        operations = []
+        for answer in answers:
+            correct = 1 if answer.is_correct else 0
+            increments = {
+                "attempts": 1,
+                "correct": correct,
+                "sum_time": answer.time_taken or 0,
+                "timed_attempts": 1 if answer.time_taken is not None else 0,
+                "sum_total": total_score,
+                "sum_total_sq": total_score * total_score,
+                "sum_total_correct": total_score * correct
+            }
+            operations.append(UpdateOne(
+                {"id": answer.question_id},
+                [
+                    {"$set": {
+                        f"item_stats.{field}": {"$add": [{"$ifNull": [f"$item_stats.{field}", 0]}, value]}
+                        for field, value in increments.items()
+                    }},
+                    derivation
+                ]
+            ))
+        
+        if operations:
+            await db.questions.bulk_write(operations, ordered=False)
+        
+    except Exception as e:
+        logger.error(f"Error recording item responses: {e}")
+
+async def recompute_item_stats() -> Dict[str, Any]:
+    """Rebuild every question's item statistics from assessment_results in one vectorized pass.
+    
+    Meant for backfill: submissions landing during the run may be overwritten.
+    """
+    started = time.perf_counter()
+    cursor = db.assessment_results.find(
+        {}, {"_id": 0, "score": 1, "answers.question_id": 1, "answers.is_correct": 1, "answers.time_taken": 1}
+    ).batch_size(10000)
+    
+    question_codes: Dict[str, int] = {}
+    codes, correct, times, timed, totals = [], [], [], [], []
+    async for result in cursor:
+        for answer in result.get('answers', []):
+            codes.append(question_codes.setdefault(answer['question_id'], len(question_codes)))
+            correct.append(1.0 if answer.get('is_correct') else 0.0)
+            timed.append(0.0 if answer.get('time_taken') is None else 1.0)
+            times.append(answer.get('time_taken') or 0)
+            totals.append(result['score'])
+    
+    if not codes:
+        return {"questions_updated": 0, "responses_processed": 0}
+    
+    codes = np.asarray(codes, dtype=np.int64)
+    correct, times, timed, totals = (np.asarray(v, dtype=float) for v in (correct, times, timed, totals))
+    
+    def seg(values):
+        return np.bincount(codes, weights=values, minlength=len(question_codes))
+    
+    sums = {
+        "attempts": np.bincount(codes, minlength=len(question_codes)),
+        "correct": seg(correct),
+        "sum_time": seg(times),
+        "timed_attempts": seg(timed),
+        "sum_total": seg(totals),
+        "sum_total_sq": seg(totals * totals),
+        "sum_total_correct": seg(totals * correct)
+    }
+    derived = derive_item_stats(*(sums[field] for field in ITEM_STATS_SUMS))
+    
+    def finite(value):
+        return None if np.isnan(value) else float(value)
+    
+    now = datetime.utcnow()
+    operations = []
+    for question_id, i in question_codes.items():
+        attempts = int(sums['attempts'][i])
+        p_value = finite(derived['p_value'][i])
+        item_stats = {field: float(sums[field][i]) for field in ITEM_STATS_SUMS}
+        item_stats.update({
+            "attempts": attempts,
+            "correct": int(sums['correct'][i]),
+            "timed_attempts": int(sums['timed_attempts'][i]),
+            "p_value": p_value,
+            "mean_time": finite(derived['mean_time'][i]),
+            "discrimination": finite(derived['discrimination'][i]),
+            "difficulty_band": item_difficulty_band(p_value) if attempts >= ITEM_STATS_MIN_ATTEMPTS else None,
+            "updated_at": now
+        })
+        operations.append(UpdateOne({"id": question_id}, {"$set": {"item_stats": item_stats}}))
+    
+    for i in range(0, len(operations), 1000):
+        await db.questions.bulk_write(operations[i:i + 1000], ordered=False)
+    
+    duration_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"Recomputed item stats for {len(operations)} questions in {duration_ms:.0f}ms")
+    
+    return {
+        "questions_updated": len(operations),
+        "responses_processed": int(len(codes)),
+        "duration_ms": round(duration_ms, 1)
+    }
+
 # ================================
 # ASSESSMENT ENDPOINTS
 # ================================
@@ -967,7 +3103,15 @@ async def submit_assessment(
             time_taken=sum(answer.time_taken or 0 for answer in answers)
         )
         
-        await db.assessment_results.insert_one(result.dict())
+        # Cohort refresh windows go by ingested_at: completed_at is set before the write and may lag it
+        await db.assessment_results.insert_one({**result.dict(), "ingested_at": datetime.utcnow()})
+        
+        # Calibrate the answered items
+        await record_item_responses(answers, score)
+        
+        # Fold score into the running learning-trend sums
+        await record_learning_result(current_user['id'], score)
+        dashboard_cache.invalidate(current_user['id'])
         
         # Award XP based on performance
         xp_earned = int(score * 2)  # 2 XP per percentage point
@@ -999,42 +3143,113 @@ async def create_study_group(group_data: CreateGroupRequest, current_user: dict
             subject=group_data.subject,
             created_by=current_user['id'],
             members=[current_user['id']],
+            member_count=1,
             max_members=group_data.max_members,
             is_public=group_data.is_public
         )
         
         await db.study_groups.insert_one(group.dict())
+        await add_group_membership(current_user['id'], group.id)
+        group_discovery.changed({field: value for field, value in group.dict().items() if field in GROUP_LISTING_PROJECTION})
         
         return {"message": "Study group created successfully", "group": group.dict()}
         
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def add_group_membership(user_id: str, group_id: str):
+    await db.group_memberships.update_one(
+        {"user_id": user_id}, {"$addToSet": {"group_ids": group_id}}, upsert=True
+    )
+
+async def user_group_ids(user_id: str) -> set:
+    """Ids of the groups a user belongs to, from their group_memberships set"""
+    memberships = await db.group_memberships.find_one({"user_id": user_id}, {"_id": 0, "group_ids": 1})
+    return set(memberships['group_ids']) if memberships else set()
+
+# Study group fields returned by listings (no member list)
+GROUP_LISTING_PROJECTION = {
+    "_id": 0, "id": 1, "name": 1, "description": 1, "subject": 1, "created_by": 1,
+    "member_count": 1, "max_members": 1, "is_public": 1, "created_at": 1, "last_activity": 1
+}
+
+async def join_capped_list(
+    collection,
+    query: Dict[str, Any],
+    list_field: str,
+    max_field: str,
+    member_id: str,
+    extra_set: Optional[Dict[str, Any]] = None,
+    count_field: Optional[str] = None,
+    projection: Optional[Dict[str, Any]] = None
+) -> tuple:
+    """Atomically add a member to a capped list.
+    
+    Membership and capacity are checked by the same find_one_and_update that
+    pushes the member, so concurrent joins can never overfill the list.
+    Returns (document, None) on success, or (None, reason) with reason one of
+    'not_found', 'already_member' or 'full'; only a refused join pays a
+    second, diagnostic read.
+    """
+    update = {"$push": {list_field: member_id}}
+    if count_field:
+        update["$inc"] = {count_field: 1}
+    if extra_set:
+        update["$set"] = extra_set
+    
+    joined = await collection.find_one_and_update(
+        {
+            **query,
+            list_field: {"$ne": member_id},
+            "$expr": {"$lt": [{"$size": f"${list_field}"}, f"${max_field}"]}
+        },
+        update,
+        projection=projection or {"_id": 0, "id": 1},
+        return_document=ReturnDocument.AFTER
+    )
+    if joined is not None:
+        return joined, None
+    
+    state = await collection.find_one(query, {
+        "_id": 0,
+        "is_member": {"$in": [member_id, f"${list_field}"]}
+    })
+    if state is None:
+        return None, 'not_found'
+    return None, 'already_member' if state['is_member'] else 'full'
+
 @api_router.post("/groups/join")
 async def join_study_group(join_data: JoinGroupRequest, current_user: dict = Depends(get_current_user)):
     """Join a study group"""
     try:
-        group = await db.study_groups.find_one({"id": join_data.group_id})
-        if not group:
+        group, failure = await join_capped_list(
+            db.study_groups,
+            {"id": join_data.group_id},
+            "members",
+            "max_members",
+            current_user['id'],
+            extra_set={"last_activity": datetime.utcnow()},
+            count_field="member_count",
+            projection=GROUP_LISTING_PROJECTION
+        )
+        if failure == 'not_found':
             raise HTTPException(status_code=404, detail="Study group not found")
         
-        if current_user['id'] in group['members']:
+        if failure == 'already_member':
+            # Repairs the set if an earlier join failed between the two writes
+            await add_group_membership(current_user['id'], join_data.group_id)
             raise HTTPException(status_code=400, detail="Already a member of this group")
         
-        if len(group['members']) >= group['max_members']:
+        if failure == 'full':
             raise HTTPException(status_code=400, detail="Group is full")
         
-        # Add user to group
-        await db.study_groups.update_one(
-            {"id": join_data.group_id},
-            {
-                "$push": {"members": current_user['id']},
-                "$set": {"last_activity": datetime.utcnow()}
-            }
-        )
+        await add_group_membership(current_user['id'], join_data.group_id)
+        group_discovery.changed(group)
         
         return {"message": "Joined study group successfully"}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -1050,13 +3265,12 @@ async def get_study_groups(
         if subject:
             query["subject"] = subject
         
-        groups = await db.study_groups.find(query).limit(limit).to_list(limit)
-        
-        # Convert ObjectIds to strings and add member count and user membership status
+        groups, member_of = await asyncio.gather(
+            db.study_groups.find(query, GROUP_LISTING_PROJECTION).limit(limit).to_list(limit),
+            user_group_ids(current_user['id'])
+        )
         for group in groups:
-            group = serialize_mongo_doc(group)
-            group['member_count'] = len(group['members'])
-            group['is_member'] = current_user['id'] in group['members']
+            group['is_member'] = group['id'] in member_of
         
         return {"groups": groups}
         
@@ -1067,8 +3281,11 @@ async def get_study_groups(
 async def get_my_study_groups(current_user: dict = Depends(get_current_user)):
     """Get user's study groups"""
     try:
+        # The user's membership set, then an id lookup per group
+        group_ids = list(await user_group_ids(current_user['id']))
         groups = await db.study_groups.find(
-            {"members": current_user['id']}
+            {"id": {"$in": group_ids}},
+            {**GROUP_LISTING_PROJECTION, "is_member": {"$literal": True}}
         ).to_list(100)
         
         return {"groups": groups}
@@ -1076,6 +3293,211 @@ async def get_my_study_groups(current_user: dict = Depends(get_current_user)):
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+# ================================
+# GROUP DISCOVERY
+# ================================
+
+def group_discovery_score(group: Dict[str, Any], online: int) -> float:
+    """Hot-style rank: hours of recency plus weighted fill and online bonuses.
+    
+    Recency is the absolute last-activity time in hours, so scores of idle
+    groups never need to decay and existing rankings stay valid over time.
+    """
+    activity = group.get('last_activity') or group.get('created_at') or EPOCH
+    capacity = max(group.get('max_members') or 1, 1)
+    fill = group.get('member_count', 0) / capacity
+    # Partly filled groups are the best bet; full ones cannot be joined
+    fill_score = -1.0 if fill >= 1 else fill
+    return (
+        (activity - EPOCH) / timedelta(hours=1)
+        + DISCOVERY_FILL_WEIGHT * fill_score
+        + DISCOVERY_ONLINE_WEIGHT * min(online / capacity, 1)
+    )
+
+class GroupDiscoveryIndex:
+    """Ranked lists of public study groups, per subject and overall.
+    
+    Lists are kept sorted as groups change: creates and joins update them
+    directly, presence deltas update online counts, and both are published
+    to the other workers' indexes. A refresh loop still folds in groups
+    changed by last_activity, in case a notification was lost. Discovery
+    requests only slice a list.
+    """
+    
+    REFRESH_OVERLAP = timedelta(seconds=5)
+    
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self.groups: Dict[str, Dict[str, Any]] = {}
+        self.online: Dict[str, int] = {}
+        self._keys: Dict[str, tuple] = {}
+        self._subjects: Dict[str, str] = {}
+        # Sorted (-score, group_id) lists; the None key ranks all subjects
+        self.ranked: Dict[Optional[str], List[tuple]] = {None: []}
+        self.watermark: Optional[datetime] = None
+        self._load_lock = asyncio.Lock()
+        self.metrics = {"reads": 0, "updates": 0, "online_updates": 0, "refreshes": 0, "refreshed_groups": 0}
+        shared_event_handlers['group_changed'] = lambda data: self.reload(data['group_id'])
+        shared_event_handlers['group_online'] = lambda data: self.update_online(
+            data['room_id'], data['count'], publish=False
+        )
+    
+    def changed(self, group: Dict[str, Any]):
+        """A group was created or joined on this worker"""
+        self.upsert(group)
+        publish_shared_event('group_changed', {'group_id': group['id']})
+    
+    async def reload(self, group_id: str):
+        """Re-read a group another worker changed"""
+        if self.watermark is None:
+            return  # the initial load will see it
+        group = await db.study_groups.find_one({"id": group_id}, GROUP_LISTING_PROJECTION)
+        if group is None:
+            self.remove(group_id)
+        else:
+            self.upsert(group)
+    
+    def upsert(self, group: Dict[str, Any]):
+        group_id = group['id']
+        if not group.get('is_public', True):
+            self.remove(group_id)
+            return
+        current = self.groups.get(group_id)
+        self.groups[group_id] = {**current, **group} if current else dict(group)
+        self._rerank(group_id)
+        self.metrics['updates'] += 1
+    
+    def remove(self, group_id: str):
+        self.groups.pop(group_id, None)
+        self.online.pop(group_id, None)
+        key = self._keys.pop(group_id, None)
+        if key is not None:
+            self._unlink(None, key)
+            self._unlink(self._subjects.pop(group_id), key)
+    
+    def update_online(self, room_id: str, count: int, publish: bool = True):
+        """Presence hook: only study-group rooms are ranked"""
+        if room_id in self.groups and self.online.get(room_id, 0) != count:
+            self.online[room_id] = count
+            self._rerank(room_id)
+            self.metrics['online_updates'] += 1
+            if publish:
+                publish_shared_event('group_online', {'room_id': room_id, 'count': count})
+    
+    def top(self, subject: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        """Best groups for a subject, topped up with the best of other subjects"""
+        self.metrics['reads'] += 1
+        picked = []
+        if subject:
+            picked = [group_id for _, group_id in self.ranked.get(subject, [])[:limit]]
+        if len(picked) < limit:
+            seen = set(picked)
+            for _, group_id in self.ranked[None]:
+                if len(picked) >= limit:
+                    break
+                if group_id not in seen:
+                    picked.append(group_id)
+        return [
+            {
+                **self.groups[group_id],
+                "online_count": self.online.get(group_id, 0),
+                "subject_match": bool(subject) and self.groups[group_id]['subject'] == subject,
+                "rank_score": round(-self._keys[group_id][0], 2)
+            }
+            for group_id in picked
+        ]
+    
+    async def ensure_loaded(self):
+        async with self._load_lock:
+            if self.watermark is not None:
+                return
+            started = datetime.utcnow()
+            groups = await db.study_groups.find({"is_public": True}, GROUP_LISTING_PROJECTION).to_list(None)
+            for group in groups:
+                self.upsert(group)
+            self.watermark = started
+            logger.info(f"Group discovery loaded {len(groups)} public groups")
+    
+    async def refresh(self):
+        """Fold in groups changed since the last refresh (by any worker)"""
+        started = datetime.utcnow()
+        changed = await db.study_groups.find(
+            {"last_activity": {"$gte": self.watermark - self.REFRESH_OVERLAP}},
+            GROUP_LISTING_PROJECTION
+        ).to_list(None)
+        for group in changed:
+            self.upsert(group)
+        self.watermark = started
+        self.metrics['refreshes'] += 1
+        self.metrics['refreshed_groups'] += len(changed)
+    
+    async def run(self):
+        """Background loop started in lifespan"""
+        while True:
+            try:
+                if self.watermark is None:
+                    await self.ensure_loaded()
+                else:
+                    await self.refresh()
+            except Exception as e:
+                logger.error(f"Group discovery refresh error: {e}")
+            await asyncio.sleep(self.refresh_interval)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            "groups": len(self.groups),
+            "subjects": len(self.ranked) - 1,
+            "groups_online": sum(1 for count in self.online.values() if count)
+        }
+    
+    def _rerank(self, group_id: str):
+        group = self.groups[group_id]
+        old_key = self._keys.get(group_id)
+        if old_key is not None:
+            self._unlink(None, old_key)
+            self._unlink(self._subjects[group_id], old_key)
+        
+        key = (-group_discovery_score(group, self.online.get(group_id, 0)), group_id)
+        self._keys[group_id] = key
+        bisect.insort(self.ranked[None], key)
+        bisect.insort(self.ranked.setdefault(group['subject'], []), key)
+        self._subjects[group_id] = group['subject']
+    
+    def _unlink(self, subject: Optional[str], key: tuple):
+        ranked = self.ranked.get(subject)
+        if not ranked:
+            return
+        index = bisect.bisect_left(ranked, key)
+        if index < len(ranked) and ranked[index] == key:
+            del ranked[index]
+        if subject is not None and not ranked:
+            del self.ranked[subject]
+
+group_discovery = GroupDiscoveryIndex(DISCOVERY_REFRESH_INTERVAL)
+system_stats_providers['group_discovery'] = group_discovery.stats
+
+@api_router.get("/groups/discover")
+async def discover_study_groups(
+    subject: Optional[str] = None,
+    limit: int = 20,
+    current_user: dict = Depends(get_current_user)
+):
+    """Public study groups ranked by subject, recent activity, fill and members online"""
+    try:
+        await group_discovery.ensure_loaded()
+        limit = max(1, min(limit, 100))
+        groups = group_discovery.top(subject, limit)
+        
+        member_of = await user_group_ids(current_user['id'])
+        for group in groups:
+            group['is_member'] = group['id'] in member_of
+        
+        return {"groups": groups, "subject": subject}
+        
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 # ================================
 # QUIZ ARENA ENDPOINTS
 # ================================
@@ -1108,163 +3530,1185 @@ async def create_quiz_room(
 async def join_quiz_room(room_code: str, current_user: dict = Depends(get_current_user)):
     """Join a quiz room using room code"""
     try:
-        room = await db.quiz_rooms.find_one({"room_code": room_code})
-        if not room:
+        room, failure = await join_capped_list(
+            db.quiz_rooms,
+            {"room_code": room_code},
+            "participants",
+            "max_participants",
+            current_user['id']
+        )
+        if failure == 'not_found':
             raise HTTPException(status_code=404, detail="Quiz room not found")
         
-        if current_user['id'] in room['participants']:
+        if failure == 'already_member':
             raise HTTPException(status_code=400, detail="Already joined this room")
         
-        if len(room['participants']) >= room['max_participants']:
+        if failure == 'full':
             raise HTTPException(status_code=400, detail="Room is full")
         
-        # Add participant
-        await db.quiz_rooms.update_one(
-            {"room_code": room_code},
-            {"$push": {"participants": current_user['id']}}
-        )
+        quiz_engine.admit(room_code, current_user['id'])
         
         return {"message": "Joined quiz room successfully", "room_id": room['id']}
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.post("/quiz/rooms/{room_code}/start")
+async def start_quiz_room(room_code: str, current_user: dict = Depends(get_current_user)):
+    """Start a live quiz (host only); questions are then driven by the server"""
+    room = await quiz_engine.room(room_code)
+    if room is None:
+        raise HTTPException(status_code=404, detail="Quiz room not found")
+    
+    if room.host_id != current_user['id']:
+        raise HTTPException(status_code=403, detail="Only the host can start the quiz")
+    
+    if room.status != 'waiting':
+        raise HTTPException(status_code=400, detail=f"Quiz is already {room.status}")
+    
+    if not room.questions:
+        raise HTTPException(status_code=400, detail="Quiz has no questions")
+    
+    quiz_engine.start(room)
+    return {
+        "message": "Quiz started",
+        "room_id": room.id,
+        "total_questions": len(room.questions),
+        "participants": len(room.connections)
+    }
+
 # ================================
-# HELP QUEUE ENDPOINTS
+# CHAT HISTORY ENDPOINTS
 # ================================
 
-@api_router.post("/help/request")
-async def create_help_request(
-    subject: str,
-    description: str,
-    priority: str = "medium",
+@api_router.get("/chat/rooms/{room_id}/messages")
+async def get_chat_history(
+    room_id: str,
+    before: Optional[datetime] = None,
+    before_id: Optional[str] = None,
+    limit: int = 50,
     current_user: dict = Depends(get_current_user)
 ):
-    """Create a help request"""
+    """Get a room's chat history, newest first, paginated by (timestamp, id) keyset"""
     try:
-        if current_user['role'] != UserRole.STUDENT:
-            raise HTTPException(status_code=403, detail="Only students can create help requests")
-        
-        help_request = HelpRequest(
-            student_id=current_user['id'],
-            subject=subject,
-            description=description,
-            priority=priority
-        )
+        if not await can_read_chat_room(current_user, room_id):
+            raise HTTPException(status_code=403, detail="Not a member of this room")
+        
+        limit = max(1, min(limit, 200))
+        if before is not None and before.tzinfo is not None:
+            # Stored timestamps are naive UTC
+            before = before.astimezone(timezone.utc).replace(tzinfo=None)
+        
+        # First page within the ring buffer size is served from memory
+        if before is None and limit <= CHAT_RECENT_MESSAGES:
+            recent = await recent_messages.recent(room_id)
+            if len(recent) >= limit:
+                return chat_history_page(recent[::-1][:limit], limit)
+        
+        query = {"room_id": room_id}
+        if before is not None:
+            query["$or"] = [
+                {"timestamp": {"$lt": before}},
+                {"timestamp": before, "id": {"$lt": before_id or ""}}
+            ]
+        page = await db.chat_messages.find(query, {"_id": 0}).sort(
+            [("timestamp", -1), ("id", -1)]
+        ).limit(limit).to_list(limit)
         
-        await db.help_requests.insert_one(help_request.dict())
+        # Older pages fall through to the compacted archive tier
+        if len(page) < limit:
+            page += await read_archived_messages(room_id, page[-1] if page else None, before, before_id, limit - len(page))
         
-        return {"message": "Help request created successfully", "request": help_request.dict()}
+        return chat_history_page(page, limit)
         
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@api_router.get("/help/queue")
-async def get_help_queue(current_user: dict = Depends(get_current_user)):
-    """Get help queue (for teachers)"""
-    try:
-        if current_user['role'] not in [UserRole.TEACHER, UserRole.ADMIN]:
-            raise HTTPException(status_code=403, detail="Access denied")
-        
-        requests = await db.help_requests.find(
-            {"status": {"$in": ["pending", "assigned"]}}
-        ).sort("created_at", 1).to_list(100)
-        
-        return {"requests": requests}
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+async def can_read_chat_room(user: dict, room_id: str) -> bool:
+    """Chat rooms are study groups and quiz rooms; their members (and admins) may read them"""
+    if user['role'] == UserRole.ADMIN:
+        return True
+    group, quiz_room = await asyncio.gather(
+        db.study_groups.find_one({"id": room_id, "members": user['id']}, {"_id": 1}),
+        db.quiz_rooms.find_one({"id": room_id, "participants": user['id']}, {"_id": 1})
+    )
+    return group is not None or quiz_room is not None
 
-@api_router.post("/help/requests/{request_id}/claim")
-async def claim_help_request(request_id: str, current_user: dict = Depends(get_current_user)):
-    """Claim a help request (for teachers)"""
+def chat_history_page(page: List[Dict[str, Any]], limit: int) -> Dict[str, Any]:
+    """Shape a newest-first page with the keyset cursor for the next one"""
+    last = page[-1] if len(page) == limit else None
+    return {
+        "messages": [serialize_chat_message(m) for m in page],
+        "next_before": last['timestamp'].isoformat() if last else None,
+        "next_before_id": last['id'] if last else None
+    }
+
+async def read_archived_messages(
+    room_id: str,
+    last: Optional[Dict[str, Any]],
+    before: Optional[datetime],
+    before_id: Optional[str],
+    limit: int
+) -> List[Dict[str, Any]]:
+    """Continue a newest-first page from the archived hourly buckets"""
+    if last is not None:
+        before, before_id = last['timestamp'], last['id']
+    
+    query = {"room_id": room_id}
+    if before is not None:
+        query["bucket_start"] = {"$lte": before}
+    
+    messages = []
+    async for bucket in db.chat_message_archive.find(query, {"_id": 0}).sort("bucket_start", -1):
+        for message in sorted(bucket['messages'], key=lambda m: (m['timestamp'], m['id']), reverse=True):
+            if before is not None and (message['timestamp'], message['id']) >= (before, before_id or ""):
+                continue
+            messages.append(message)
+            if len(messages) >= limit:
+                return messages
+    return messages
+
+async def claim_periodic_run(name: str, interval: float) -> bool:
+    """Claim the next run of a periodic job across workers (at most one per interval)"""
+    now = datetime.utcnow()
     try:
-        if current_user['role'] not in [UserRole.TEACHER, UserRole.ADMIN]:
-            raise HTTPException(status_code=403, detail="Access denied")
-        
-        result = await db.help_requests.update_one(
-            {"id": request_id, "status": "pending"},
-            {
-                "$set": {
-                    "status": "assigned",
-                    "assigned_teacher": current_user['id'],
-                    "updated_at": datetime.utcnow()
-                }
-            }
+        await db.scheduler_leases.update_one(
+            {"_id": name, "next_run": {"$lte": now}},
+            {"$set": {"next_run": now + timedelta(seconds=interval), "claimed_at": now}},
+            upsert=True
         )
-        
-        if result.modified_count == 0:
-            raise HTTPException(status_code=404, detail="Request not found or already claimed")
-        
-        return {"message": "Help request claimed successfully"}
-        
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    except DuplicateKeyError:
+        # Another worker already holds this interval (next_run is still in the future)
+        return False
+    return True
+
+async def archive_old_chat_messages() -> int:
+    """Compact messages past the hot-tier retention window into hourly archive buckets"""
+    cutoff = datetime.utcnow() - timedelta(days=CHAT_RETENTION_DAYS)
+    
+    await db.chat_messages.aggregate([
+        {"$match": {"timestamp": {"$lt": cutoff}}},
+        {"$sort": {"room_id": 1, "timestamp": 1}},
+        {"$group": {
+            "_id": {
+                "room_id": "$room_id",
+                "bucket_start": {"$dateFromParts": {
+                    "year": {"$year": "$timestamp"},
+                    "month": {"$month": "$timestamp"},
+                    "day": {"$dayOfMonth": "$timestamp"},
+                    "hour": {"$hour": "$timestamp"}
+                }}
+            },
+            "messages": {"$push": {
+                "id": "$id",
+                "room_id": "$room_id",
+                "user_id": "$user_id",
+                "username": "$username",
+                "message": "$message",
+                "message_type": "$message_type",
+                "timestamp": "$timestamp"
+            }},
+            "message_count": {"$sum": 1}
+        }},
+        {"$set": {"room_id": "$_id.room_id", "bucket_start": "$_id.bucket_start"}},
+        {"$merge": {
+            "into": "chat_message_archive",
+            "on": "_id",
+            # A run that merged but failed before deleting is repeated; skip messages already archived
+            "whenMatched": [
+                {"$set": {"messages": {"$concatArrays": ["$messages", {"$filter": {
+                    "input": "$$new.messages",
+                    "cond": {"$not": [{"$in": ["$$this.id", "$messages.id"]}]}
+                }}]}}},
+                {"$set": {"message_count": {"$size": "$messages"}}}
+            ],
+            "whenNotMatched": "insert"
+        }}
+    ]).to_list(None)
+    
+    result = await db.chat_messages.delete_many({"timestamp": {"$lt": cutoff}})
+    return result.deleted_count
+
+async def chat_retention_loop():
+    """Scheduler moving old chat messages into the archive tier"""
+    while True:
+        try:
+            if await claim_periodic_run("chat_retention", CHAT_RETENTION_INTERVAL):
+                archived = await archive_old_chat_messages()
+                if archived:
+                    logger.info(f"Archived {archived} chat messages")
+        except Exception as e:
+            logger.error(f"Error archiving chat messages: {e}")
+        await asyncio.sleep(CHAT_RETENTION_INTERVAL)
 
 # ================================
-# ANALYTICS ENDPOINTS
+# HELP QUEUE ENDPOINTS
 # ================================
 
-@api_router.get("/analytics/dashboard")
-async def get_analytics_dashboard(current_user: dict = Depends(get_current_user)):
-    """Get user analytics dashboard"""
-    try:
-        # Get user stats
-        user_stats = await get_user_statistics(current_user['id'])
-        
-        # Get recent activity
-        recent_sessions = await db.study_sessions.find(
-            {"user_id": current_user['id']}
-        ).sort("created_at", -1).limit(10).to_list(10)
-        
-        # Get performance trends (simplified)
-        assessment_results = await db.assessment_results.find(
-            {"user_id": current_user['id']}
-        ).sort("completed_at", -1).limit(20).to_list(20)
+# Lower rank is served first
+HELP_PRIORITY_RANKS = {"urgent": 0, "high": 1, "medium": 2, "low": 3}
+HELP_OPEN_STATUSES = ["pending", "assigned", "in_progress"]
+HELP_REQUEST_FIELDS = {
+    "_id": 0, "id": 1, "student_id": 1, "subject": 1, "priority": 1, "priority_rank": 1,
+    "description": 1, "status": 1, "assigned_teacher": 1, "claimed_at": 1, "completed_at": 1,
+    "created_at": 1, "updated_at": 1
+}
+HELP_QUEUE_ROOM = "help_queue"
+# Presence room of teachers connected to the help channel (who auto-assignment treats as online)
+HELP_TEACHERS_ROOM = "help_teachers"
+
+
+def truncate_to_millisecond(value: Optional[datetime]) -> Optional[datetime]:
+    """A datetime as it reads back from Mongo, which stores milliseconds"""
+    return value.replace(microsecond=value.microsecond // 1000 * 1000) if value else value
+
+class HelpQueue:
+    """In-memory view of open help requests.
+    
+    Pending requests sit in binary heaps (one overall, one per subject)
+    ordered by priority rank, then age, then subject, so the head is read
+    in O(log n) without touching Mongo. Entries are deleted lazily: a heap
+    entry counts only while it is its request's current entry, and every
+    push gets a new sequence number, so a request that goes back to pending
+    is never mistaken for the dead entry it left behind. The view is
+    rebuilt on startup, updated by this worker's creates, claims and
+    cancels, and a sync loop folds in requests other workers changed (by
+    updated_at). Claims themselves are always decided by an atomic
+    find_one_and_update, so a stale head can never be double-claimed.
+    Wait estimates use a rolling average of recent service times (claim to
+    completion) spread over the teachers currently serving.
+    """
+    
+    SYNC_OVERLAP = timedelta(seconds=5)
+    
+    def __init__(self, sync_interval: float, service_window: int):
+        self.sync_interval = sync_interval
+        self.service_times: deque = deque(maxlen=service_window)
+        self.pending: Dict[str, Dict[str, Any]] = {}
+        self.assigned: Dict[str, Dict[str, Any]] = {}
+        self._keys: Dict[str, tuple] = {}
+        self._heaps: Dict[Optional[str], List[tuple]] = {None: []}
+        self._sequence = 0
+        self.watermark: Optional[datetime] = None
+        self.metrics = {"applied": 0, "syncs": 0, "synced_requests": 0, "stale_pops": 0, "heap_rebuilds": 0}
+    
+    def apply(self, request: Dict[str, Any]):
+        """Bring one request's state up to date"""
+        request_id = request['id']
+        self.pending.pop(request_id, None)
+        self.assigned.pop(request_id, None)
+        self.metrics['applied'] += 1
+        
+        if request['status'] == 'pending':
+            self.pending[request_id] = request
+            key = self._key(request)
+            current = self._keys.get(request_id)
+            if current is None or current[:4] != key:
+                self._sequence += 1
+                key += (self._sequence,)
+                self._keys[request_id] = key
+                heapq.heappush(self._heaps[None], key)
+                heapq.heappush(self._heaps.setdefault(request['subject'], []), key)
+        else:
+            self._keys.pop(request_id, None)
+            if request['status'] in HELP_OPEN_STATUSES:
+                self.assigned[request_id] = request
+        
+        self._compact_if_bloated()
+    
+    def head(self, subject: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Next request to serve, overall or for one subject"""
+        heap = self._heaps.get(subject)
+        while heap:
+            key = heap[0]
+            if self._keys.get(key[3]) == key:
+                return self.pending[key[3]]
+            heapq.heappop(heap)
+            self.metrics['stale_pops'] += 1
+        return None
+    
+    def ordered(self, subject: Optional[str] = None, limit: int = 100) -> List[Dict[str, Any]]:
+        """Pending requests in service order (top `limit`)"""
+        live = [key for key in self._heaps.get(subject, ()) if self._keys.get(key[3]) == key]
+        return [self.pending[key[3]] for key in heapq.nsmallest(limit, live)]
+    
+    def record_service(self, request: Dict[str, Any]):
+        if request.get('claimed_at') and request.get('completed_at'):
+            self.service_times.append((request['completed_at'] - request['claimed_at']).total_seconds())
+    
+    def wait_summary(self) -> Dict[str, Any]:
+        """Queue-level figures sent with every snapshot and event"""
+        average = sum(self.service_times) / len(self.service_times) if self.service_times else None
+        teachers = len({r['assigned_teacher'] for r in self.assigned.values() if r.get('assigned_teacher')})
+        summary = {
+            "pending_count": len(self.pending),
+            "active_teachers": teachers,
+            "avg_service_seconds": round(average, 1) if average is not None else None
+        }
+        summary["estimated_wait_seconds"] = self.estimated_wait(len(self.pending) + 1, summary)
+        return summary
+    
+    @staticmethod
+    def estimated_wait(position: int, summary: Dict[str, Any]) -> Optional[int]:
+        """Seconds until the request at `position` is picked up, or None without service history"""
+        if summary['avg_service_seconds'] is None:
+            return None
+        return round((position - 1) * summary['avg_service_seconds'] / max(summary['active_teachers'], 1))
+    
+    def snapshot(self, subject: Optional[str]) -> Dict[str, Any]:
+        """Full queue state for a new subscriber, each pending request with its place and wait"""
+        summary = self.wait_summary()
+        positions = {request['id']: place for place, request in enumerate(self.ordered(None, len(self.pending)), start=1)}
+        pending = [
+            {**request, "position": positions[request['id']],
+             "estimated_wait_seconds": self.estimated_wait(positions[request['id']], summary)}
+            for request in self.ordered(subject, len(self.pending))
+        ]
+        assigned = [r for r in self.assigned.values() if subject is None or r['subject'] == subject]
+        return {"subject": subject, "pending": pending, "assigned": assigned, **summary}
+    
+    async def rebuild(self):
+        started = datetime.utcnow()
+        recent = await db.help_requests.find(
+            {"status": "completed", "claimed_at": {"$ne": None}}, {"_id": 0, "claimed_at": 1, "completed_at": 1}
+        ).sort("completed_at", -1).limit(self.service_times.maxlen).to_list(None)
+        self.service_times.clear()
+        for request in reversed(recent):
+            self.record_service(request)
+        
+        open_requests = await db.help_requests.find(
+            {"status": {"$in": HELP_OPEN_STATUSES}}, HELP_REQUEST_FIELDS
+        ).to_list(None)
+        self.pending, self.assigned, self._keys = {}, {}, {}
+        self._heaps = {None: []}
+        for request in open_requests:
+            self.apply(request)
+        self.watermark = started
+        logger.info(f"Help queue rebuilt with {len(self.pending)} pending and {len(self.assigned)} assigned requests")
+    
+    async def sync(self):
+        """Fold in requests changed since the last sync (state only; the writer already emitted)"""
+        started = datetime.utcnow()
+        changed = await db.help_requests.find(
+            {"updated_at": {"$gte": self.watermark - self.SYNC_OVERLAP}}, HELP_REQUEST_FIELDS
+        ).to_list(None)
+        for request in changed:
+            if self._is_current(request):
+                continue
+            if request['status'] == 'completed':
+                self.record_service(request)
+            self.apply(request)
+            self.metrics['synced_requests'] += 1
+        self.watermark = started
+        self.metrics['syncs'] += 1
+    
+    async def run(self):
+        """Background loop started in lifespan"""
+        while True:
+            try:
+                if self.watermark is None:
+                    await self.rebuild()
+                else:
+                    await self.sync()
+            except Exception as e:
+                logger.error(f"Help queue sync error: {e}")
+            await asyncio.sleep(self.sync_interval)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            "pending": len(self.pending),
+            "assigned": len(self.assigned),
+            "heap_entries": sum(len(heap) for heap in self._heaps.values()),
+            "subjects": len(self._heaps) - 1,
+            "service_samples": len(self.service_times),
+            "avg_service_seconds": self.wait_summary()["avg_service_seconds"]
+        }
+    
+    def _is_current(self, request: Dict[str, Any]) -> bool:
+        known = self.pending.get(request['id']) or self.assigned.get(request['id'])
+        if known is None:
+            return request['status'] not in HELP_OPEN_STATUSES and request['id'] not in self._keys
+        return known['status'] == request['status'] and (
+            # Mongo keeps milliseconds; the copy this worker applied itself still has microseconds
+            truncate_to_millisecond(known.get('updated_at')) == truncate_to_millisecond(request.get('updated_at'))
+        )
+    
+    @staticmethod
+    def _key(request: Dict[str, Any]) -> tuple:
+        """Heap order without the sequence number apply() appends"""
+        rank = request.get('priority_rank', HELP_PRIORITY_RANKS.get(request.get('priority'), HELP_PRIORITY_RANKS['medium']))
+        return (rank, request['created_at'], request['subject'], request['id'])
+    
+    def _compact_if_bloated(self):
+        # Lazy deletion leaves dead entries behind; rebuild once they dominate
+        overall = self._heaps[None]
+        if len(overall) > 64 and len(overall) > 2 * len(self._keys):
+            self._heaps = {None: list(self._keys.values())}
+            for key in self._keys.values():
+                self._heaps.setdefault(key[2], []).append(key)
+            for heap in self._heaps.values():
+                heapq.heapify(heap)
+            self.metrics['heap_rebuilds'] += 1
+
+help_queue = HelpQueue(HELP_QUEUE_SYNC_INTERVAL, HELP_SERVICE_WINDOW)
+system_stats_providers['help_queue'] = help_queue.stats
+
+def help_queue_room(subject: Optional[str]) -> str:
+    return f"{HELP_QUEUE_ROOM}:{subject}" if subject else HELP_QUEUE_ROOM
+
+def help_teacher_room(teacher_id: str) -> str:
+    return f"{HELP_QUEUE_ROOM}#teacher:{teacher_id}"
+
+def serialize_help_request(request: Dict[str, Any]) -> Dict[str, Any]:
+    """JSON-ready copy of a help request for Socket.IO payloads"""
+    return {
+        key: value.isoformat() if isinstance(value, datetime) else value
+        for key, value in request.items()
+    }
+
+async def publish_help_event(event_type: str, request: Dict[str, Any]):
+    """Push a queue change to teachers watching all subjects and the request's subject"""
+    try:
+        payload = {"type": event_type, "request": serialize_help_request(request), **help_queue.wait_summary()}
+        # One emit to both rooms, so a teacher watching both gets the event once
+        await emit_event('help_queue_event', payload, room=[HELP_QUEUE_ROOM, help_queue_room(request['subject'])])
+    except Exception as e:
+        logger.error(f"Error publishing help queue event: {e}")
+
+@sio.event
+@rate_limited
+async def subscribe_help_queue(sid, data):
+    """Teachers: receive the queue once, then help_queue_event deltas"""
+    identity = await sio.get_session(sid)
+    if identity['role'] not in [UserRole.TEACHER, UserRole.ADMIN]:
+        await emit_event('help_queue_error', {'reason': 'Access denied'}, to=sid)
+        return
+    
+    if identity['role'] == UserRole.TEACHER:
+        await enter_event_room(sid, help_teacher_room(identity['user_id']))
+        await presence_store.join(HELP_TEACHERS_ROOM, sid, {
+            'presence_id': uuid.uuid4().hex[:12],
+            'user_id': identity['user_id'],
+            'username': identity['username'],
+            'joined_at': datetime.utcnow().isoformat()
+        })
+    
+    subject = (data or {}).get('subject')
+    await enter_event_room(sid, help_queue_room(subject))
+    snapshot = help_queue.snapshot(subject)
+    await emit_event('help_queue_state', {
+        **snapshot,
+        'pending': [serialize_help_request(r) for r in snapshot['pending']],
+        'assigned': [serialize_help_request(r) for r in snapshot['assigned']]
+    }, to=sid)
+
+@sio.event
+@rate_limited
+async def unsubscribe_help_queue(sid, data):
+    """Stop a subject's deltas; a teacher left with no subscription is no longer online for auto-assignment"""
+    await leave_event_room(sid, help_queue_room((data or {}).get('subject')))
+    
+    rooms = {room.removesuffix(compact_room('')) for room in sio.rooms(sid)}
+    subscribed = any(room == HELP_QUEUE_ROOM or room.startswith(f"{HELP_QUEUE_ROOM}:") for room in rooms)
+    if not subscribed:
+        await presence_store.leave(HELP_TEACHERS_ROOM, sid)
+
+@api_router.post("/help/request")
+async def create_help_request(
+    subject: str,
+    description: str,
+    priority: str = "medium",
+    current_user: dict = Depends(get_current_user)
+):
+    """Create a help request"""
+    try:
+        if current_user['role'] != UserRole.STUDENT:
+            raise HTTPException(status_code=403, detail="Only students can create help requests")
         
-        performance_trend = [result['score'] for result in assessment_results]
+        if priority not in HELP_PRIORITY_RANKS:
+            raise HTTPException(status_code=400, detail=f"Priority must be one of: {', '.join(HELP_PRIORITY_RANKS)}")
+        
+        help_request = HelpRequest(
+            student_id=current_user['id'],
+            subject=subject,
+            description=description,
+            priority=priority,
+            priority_rank=HELP_PRIORITY_RANKS[priority]
+        )
+        
+        await db.help_requests.insert_one(help_request.dict())
+        help_queue.apply(help_request.dict())
+        await publish_help_event("created", help_request.dict())
+        
+        return {
+            "message": "Help request created successfully",
+            "request": help_request.dict(),
+            "estimated_wait_seconds": help_queue.wait_summary()["estimated_wait_seconds"]
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/help/queue")
+async def get_help_queue(
+    subject: Optional[str] = None,
+    limit: int = 100,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get help queue (for teachers), served from memory in priority order"""
+    try:
+        if current_user['role'] not in [UserRole.TEACHER, UserRole.ADMIN]:
+            raise HTTPException(status_code=403, detail="Access denied")
+        
+        pending = help_queue.ordered(subject, limit)
+        assigned = sorted(
+            (r for r in help_queue.assigned.values() if subject is None or r['subject'] == subject),
+            key=lambda r: r['updated_at']
+        )
         
         return {
-            "user_stats": user_stats,
-            "recent_sessions": recent_sessions,
-            "performance_trend": performance_trend,
-            "total_assessments": len(assessment_results),
-            "average_score": sum(performance_trend) / len(performance_trend) if performance_trend else 0
+            "requests": pending + assigned,
+            "next": help_queue.head(subject),
+            "pending_count": len(help_queue.pending)
         }
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def adjust_teacher_load(teacher_id: Optional[str], delta: int):
+    """Keep teacher_capacity.current_load in step with claims (teachers without a capacity entry are skipped)"""
+    if teacher_id:
+        await db.teacher_capacity.update_one({"teacher_id": teacher_id}, {"$inc": {"current_load": delta}})
+
+async def claim_pending_request(
+    query: Dict[str, Any], teacher_id: str, auto: bool = False
+) -> Optional[Dict[str, Any]]:
+    """Atomically move a pending request to assigned; None if it was not pending.
+    
+    Auto-assignment reserves the teacher's load before claiming, so only
+    manual claims add to it here.
+    """
+    now = datetime.utcnow()
+    claimed = await db.help_requests.find_one_and_update(
+        {**query, "status": "pending"},
+        {"$set": {"status": "assigned", "assigned_teacher": teacher_id, "claimed_at": now, "updated_at": now}},
+        projection=HELP_REQUEST_FIELDS,
+        return_document=ReturnDocument.AFTER
+    )
+    if claimed is not None:
+        help_queue.apply(claimed)
+        help_assigner.record_assignment(claimed, auto)
+        if not auto:
+            await adjust_teacher_load(teacher_id, 1)
+        await publish_help_event("claimed", claimed)
+    return claimed
+
+@api_router.post("/help/requests/{request_id}/claim")
+async def claim_help_request(request_id: str, current_user: dict = Depends(get_current_user)):
+    """Claim a help request (for teachers)"""
+    try:
+        if current_user['role'] not in [UserRole.TEACHER, UserRole.ADMIN]:
+            raise HTTPException(status_code=403, detail="Access denied")
+        
+        claimed = await claim_pending_request({"id": request_id}, current_user['id'])
+        if claimed is None:
+            raise HTTPException(status_code=404, detail="Request not found or already claimed")
+        
+        return {"message": "Help request claimed successfully", "request": claimed}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.post("/help/queue/claim-next")
+async def claim_next_help_request(subject: Optional[str] = None, current_user: dict = Depends(get_current_user)):
+    """Claim the highest-priority pending request (optionally for one subject)"""
+    try:
+        if current_user['role'] not in [UserRole.TEACHER, UserRole.ADMIN]:
+            raise HTTPException(status_code=403, detail="Access denied")
+        
+        while True:
+            head = help_queue.head(subject)
+            if head is None:
+                raise HTTPException(status_code=404, detail="No pending help requests")
+            
+            claimed = await claim_pending_request({"id": head['id']}, current_user['id'])
+            if claimed is not None:
+                return {"message": "Help request claimed successfully", "request": claimed}
+            
+            # Claimed or cancelled through another worker; learn its state and move on
+            current = await db.help_requests.find_one({"id": head['id']}, HELP_REQUEST_FIELDS)
+            help_queue.apply(current or {**head, "status": "cancelled"})
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.post("/help/requests/{request_id}/cancel")
+async def cancel_help_request(request_id: str, current_user: dict = Depends(get_current_user)):
+    """Cancel an open help request (its student, or an admin)"""
+    try:
+        query = {"id": request_id, "status": {"$in": HELP_OPEN_STATUSES}}
+        if current_user['role'] != UserRole.ADMIN:
+            query["student_id"] = current_user['id']
+        
+        cancelled = await db.help_requests.find_one_and_update(
+            query,
+            {"$set": {"status": "cancelled", "updated_at": datetime.utcnow()}},
+            projection=HELP_REQUEST_FIELDS,
+            return_document=ReturnDocument.AFTER
+        )
+        if cancelled is None:
+            raise HTTPException(status_code=404, detail="Open request not found")
+        
+        help_queue.apply(cancelled)
+        await adjust_teacher_load(cancelled.get('assigned_teacher'), -1)
+        await publish_help_event("cancelled", cancelled)
+        
+        return {"message": "Help request cancelled", "request": cancelled}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.post("/help/requests/{request_id}/complete")
+async def complete_help_request(request_id: str, current_user: dict = Depends(get_current_user)):
+    """Mark a claimed help request as completed (its teacher, or an admin)"""
+    try:
+        if current_user['role'] not in [UserRole.TEACHER, UserRole.ADMIN]:
+            raise HTTPException(status_code=403, detail="Access denied")
+        
+        query = {"id": request_id, "status": {"$in": ["assigned", "in_progress"]}}
+        if current_user['role'] != UserRole.ADMIN:
+            query["assigned_teacher"] = current_user['id']
+        
+        now = datetime.utcnow()
+        completed = await db.help_requests.find_one_and_update(
+            query,
+            {"$set": {"status": "completed", "completed_at": now, "updated_at": now}},
+            projection=HELP_REQUEST_FIELDS,
+            return_document=ReturnDocument.AFTER
+        )
+        if completed is None:
+            raise HTTPException(status_code=404, detail="Claimed request not found")
+        
+        help_queue.record_service(completed)
+        help_queue.apply(completed)
+        await adjust_teacher_load(completed['assigned_teacher'], -1)
+        await publish_help_event("completed", completed)
+        
+        return {"message": "Help request completed", "request": completed}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ================================
+# HELP AUTO-ASSIGNMENT
+# ================================
+
+TEACHER_CAPACITY_FIELDS = {"_id": 0, "teacher_id": 1, "subjects": 1, "max_load": 1, "current_load": 1, "auto_assign": 1}
+
+class HelpAssigner:
+    """Matches pending help requests to online teachers every few seconds.
+    
+    Requests are taken in queue order; each goes to the least-loaded online
+    teacher (by current_load / max_load) whose subjects include it, falling
+    back to teachers who listed no subjects. The teacher's load is reserved
+    with a conditional $inc before the request is claimed, so concurrent
+    workers and manual claims can never push a teacher past max_load.
+    """
+    
+    def __init__(self, interval: float, batch_size: int, window: int = 500):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.waits = {True: deque(maxlen=window), False: deque(maxlen=window)}
+        self.metrics = {'batches': 0, 'assigned': 0, 'unmatched': 0, 'reservation_conflicts': 0, 'claim_conflicts': 0}
+    
+    def record_assignment(self, request: Dict[str, Any], auto: bool):
+        """Time from creation to claim, kept separately for automatic and manual claims"""
+        if request.get('claimed_at') and request.get('created_at'):
+            self.waits[auto].append((request['claimed_at'] - request['created_at']).total_seconds())
+    
+    async def online_teachers(self) -> List[Dict[str, Any]]:
+        """Capacity entries of auto-assign teachers connected to the help channel with room for more"""
+        online = {member['user_id'] for member in await presence_store.members(HELP_TEACHERS_ROOM)}
+        if not online:
+            return []
+        teachers = await db.teacher_capacity.find(
+            {"teacher_id": {"$in": list(online)}, "auto_assign": True}, TEACHER_CAPACITY_FIELDS
+        ).to_list(None)
+        return [t for t in teachers if t['current_load'] < t['max_load']]
+    
+    @staticmethod
+    def pick_teacher(request: Dict[str, Any], teachers: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        """Least-loaded teacher with free capacity, subject experts first"""
+        free = [t for t in teachers if t['current_load'] < t['max_load']]
+        pool = [t for t in free if request['subject'] in t['subjects']] or [t for t in free if not t['subjects']]
+        if not pool:
+            return None
+        return min(pool, key=lambda t: (t['current_load'] / t['max_load'], t['current_load'], t['teacher_id']))
+    
+    async def assign_batch(self) -> int:
+        """One scheduling pass over the head of the queue; returns how many requests were assigned"""
+        pending = help_queue.ordered(None, self.batch_size)
+        if not pending:
+            return 0
+        teachers = await self.online_teachers()
+        self.metrics['batches'] += 1
+        
+        assigned = 0
+        for request in pending:
+            teacher = self.pick_teacher(request, teachers)
+            if teacher is None:
+                self.metrics['unmatched'] += 1
+                continue
+            
+            reserved = await db.teacher_capacity.find_one_and_update(
+                {"teacher_id": teacher['teacher_id'], "$expr": {"$lt": ["$current_load", "$max_load"]}},
+                {"$inc": {"current_load": 1}},
+                projection=TEACHER_CAPACITY_FIELDS,
+                return_document=ReturnDocument.AFTER
+            )
+            if reserved is None:
+                # Filled up by a manual claim or another worker since the batch started
+                teacher['current_load'] = teacher['max_load']
+                self.metrics['reservation_conflicts'] += 1
+                continue
+            
+            claimed = await claim_pending_request({"id": request['id']}, teacher['teacher_id'], auto=True)
+            if claimed is None:
+                await adjust_teacher_load(teacher['teacher_id'], -1)
+                teacher['current_load'] = reserved['current_load'] - 1
+                self.metrics['claim_conflicts'] += 1
+                continue
+            
+            teacher['current_load'] = reserved['current_load']
+            assigned += 1
+            await emit_event('help_assigned', serialize_help_request(claimed), room=help_teacher_room(teacher['teacher_id']))
+        
+        self.metrics['assigned'] += assigned
+        return assigned
+    
+    async def run(self):
+        """Background loop started in lifespan when HELP_AUTO_ASSIGN is set"""
+        while True:
+            try:
+                await self.assign_batch()
+            except Exception as e:
+                logger.error(f"Help auto-assignment error: {e}")
+            await asyncio.sleep(self.interval)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {
+            **self.metrics,
+            "enabled": HELP_AUTO_ASSIGN,
+            "median_time_to_assignment_seconds": {
+                "auto": round(float(np.median(self.waits[True])), 1) if self.waits[True] else None,
+                "manual": round(float(np.median(self.waits[False])), 1) if self.waits[False] else None
+            }
+        }
+
+help_assigner = HelpAssigner(HELP_ASSIGN_INTERVAL, HELP_ASSIGN_BATCH)
+system_stats_providers['help_assignment'] = help_assigner.stats
+
+async def reconcile_teacher_loads():
+    """Recount each teacher's open assigned requests into teacher_capacity.current_load.
+    
+    Overwrites loads outright, so it only runs once through run_startup_job,
+    before any worker is reserving capacity.
+    """
+    counts = await db.help_requests.aggregate([
+        {"$match": {"status": {"$in": ["assigned", "in_progress"]}, "assigned_teacher": {"$ne": None}}},
+        {"$group": {"_id": "$assigned_teacher", "load": {"$sum": 1}}}
+    ]).to_list(None)
+    loads = {row['_id']: row['load'] for row in counts}
+    teacher_ids = await db.teacher_capacity.distinct("teacher_id")
+    if teacher_ids:
+        await db.teacher_capacity.bulk_write([
+            UpdateOne({"teacher_id": teacher_id}, {"$set": {"current_load": loads.get(teacher_id, 0)}})
+            for teacher_id in teacher_ids
+        ])
+
+@api_router.get("/help/capacity")
+async def get_teacher_capacity(current_user: dict = Depends(get_current_user)):
+    """Get the current teacher's help capacity settings and load"""
+    try:
+        if current_user['role'] != UserRole.TEACHER:
+            raise HTTPException(status_code=403, detail="Only teachers have help capacity")
+        
+        capacity = await db.teacher_capacity.find_one({"teacher_id": current_user['id']}, TEACHER_CAPACITY_FIELDS)
+        return {"capacity": capacity, "auto_assign_enabled": HELP_AUTO_ASSIGN}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.put("/help/capacity")
+async def update_teacher_capacity(request: TeacherCapacityRequest, current_user: dict = Depends(get_current_user)):
+    """Set the subjects and load a teacher accepts auto-assigned help requests for"""
+    try:
+        if current_user['role'] != UserRole.TEACHER:
+            raise HTTPException(status_code=403, detail="Only teachers have help capacity")
+        
+        if request.max_load < 1:
+            raise HTTPException(status_code=400, detail="max_load must be at least 1")
+        
+        current_load = await db.help_requests.count_documents(
+            {"assigned_teacher": current_user['id'], "status": {"$in": ["assigned", "in_progress"]}}
+        )
+        capacity = await db.teacher_capacity.find_one_and_update(
+            {"teacher_id": current_user['id']},
+            {
+                "$set": {
+                    "subjects": request.subjects,
+                    "max_load": request.max_load,
+                    "auto_assign": request.auto_assign,
+                    "updated_at": datetime.utcnow()
+                },
+                "$setOnInsert": {"current_load": current_load}
+            },
+            projection=TEACHER_CAPACITY_FIELDS,
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+        
+        return {"message": "Help capacity updated", "capacity": capacity}
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ================================
+# LEARNING TREND MODEL
+# ================================
+
+# Two-sided 95% Student-t critical values for 1..30 degrees of freedom
+T_CRITICAL_95 = np.array([
+    12.706, 4.303, 3.182, 2.776, 2.571, 2.447, 2.365, 2.306, 2.262, 2.228,
+    2.201, 2.179, 2.160, 2.145, 2.131, 2.120, 2.110, 2.101, 2.093, 2.086,
+    2.080, 2.074, 2.069, 2.064, 2.060, 2.056, 2.052, 2.048, 2.045, 2.042
+])
+
+def t_critical_95(df):
+    """Student-t critical value for a 95% interval (normal approximation past 30 df)"""
+    df = np.floor(np.asarray(df, dtype=float))
+    idx = np.clip(df, 1, len(T_CRITICAL_95)).astype(int) - 1
+    return np.where(df > len(T_CRITICAL_95), 1.96, T_CRITICAL_95[idx])
+
+def regression_from_sums(w, sx, sy, sxx, sxy, syy, x_next, n_eff=None) -> Dict[str, Any]:
+    """Closed-form least-squares fit and 95% prediction interval from running sums.
+    
+    Works element-wise, so the same code scores one user (scalars) or a whole
+    class at once (arrays). `w` is the (possibly weighted) sample mass and
+    `n_eff` the effective sample size used for degrees of freedom.
+    """
+    w, sx, sy, sxx, sxy, syy = (np.asarray(v, dtype=float) for v in (w, sx, sy, sxx, sxy, syy))
+    n_eff = w if n_eff is None else np.asarray(n_eff, dtype=float)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denom = w * sxx - sx * sx
+        slope = np.where(denom > 0, (w * sxy - sx * sy) / denom, 0.0)
+        intercept = np.where(w > 0, (sy - slope * sx) / w, 0.0)
+        prediction = intercept + slope * x_next
+        
+        # Residual and total sums of squares
+        sse = np.maximum(syy - intercept * sy - slope * sxy, 0.0)
+        sst = np.maximum(syy - np.where(w > 0, sy * sy / w, 0.0), 0.0)
+        r_squared = np.where(sst > 0, 1.0 - sse / sst, 0.0)
+        
+        # Prediction standard error for the next observation
+        df = n_eff - 2
+        x_mean = np.where(w > 0, sx / w, 0.0)
+        sxx_centered = np.maximum(sxx - sx * x_mean, 0.0) * np.where(w > 0, n_eff / w, 0.0)
+        resid_var = np.where(df > 0, sse * n_eff / (w * df), 0.0)
+        leverage = np.where(sxx_centered > 0, (x_next - x_mean) ** 2 / sxx_centered, 0.0)
+        std_error = np.sqrt(resid_var * (1.0 + 1.0 / n_eff + leverage))
+        half_width = np.where(df > 0, t_critical_95(np.maximum(df, 1)) * std_error, 100.0)
+    
+    prediction = np.clip(prediction, 0, 100)
+    return {
+        "slope": slope,
+        "intercept": intercept,
+        "prediction": prediction,
+        "lower": np.clip(prediction - half_width, 0, 100),
+        "upper": np.clip(prediction + half_width, 0, 100),
+        "confidence": np.clip(1.0 - half_width / 100.0, 0.0, 1.0),
+        "r_squared": np.clip(r_squared, 0.0, 1.0),
+    }
+
+def predict_next_score(stats: Dict[str, Any], weighted: bool = False) -> Dict[str, float]:
+    """Forecast a user's next assessment score from their learning_stats document"""
+    if weighted:
+        w, ww = stats['ew_w'], stats['ew_ww']
+        fit = regression_from_sums(
+            w, stats['ew_x'], stats['ew_y'], stats['ew_xx'], stats['ew_xy'], stats['ew_yy'],
+            x_next=stats['n'], n_eff=(w * w / ww) if ww > 0 else 0
+        )
+    else:
+        fit = regression_from_sums(
+            stats['n'], stats['sum_x'], stats['sum_y'], stats['sum_xx'], stats['sum_xy'], stats['sum_yy'],
+            x_next=stats['n']
+        )
+    return {key: float(value) for key, value in fit.items()}
+
+def segment_learning_sums(codes: np.ndarray, scores: np.ndarray, n_segments: int) -> Dict[str, np.ndarray]:
+    """Build learning_stats sums for many score histories at once.
+    
+    `codes` holds a segment (user) index per score and must be grouped and
+    chronologically ordered within each segment, as produced by
+    load_score_histories. Every sum is one bincount over the ragged segments.
+    """
+    codes = np.asarray(codes, dtype=np.int64)
+    y = np.asarray(scores, dtype=float)
+    counts = np.bincount(codes, minlength=n_segments)
+    starts = np.cumsum(counts) - counts
+    x = (np.arange(len(codes)) - starts[codes]).astype(float)
+    w = LEARNING_TREND_DECAY ** (counts[codes] - 1 - x)
+    
+    def seg(values):
+        return np.bincount(codes, weights=values, minlength=n_segments)
+    
+    return {
+        "n": counts,
+        "sum_x": seg(x), "sum_y": seg(y),
+        "sum_xx": seg(x * x), "sum_xy": seg(x * y), "sum_yy": seg(y * y),
+        "ew_w": seg(w), "ew_ww": seg(w * w),
+        "ew_x": seg(w * x), "ew_y": seg(w * y),
+        "ew_xx": seg(w * x * x), "ew_xy": seg(w * x * y), "ew_yy": seg(w * y * y),
+    }
+
+async def load_score_histories(query: Dict[str, Any]):
+    """Stream assessment scores grouped by user into flat segment arrays"""
+    cursor = db.assessment_results.find(
+        query, {"_id": 0, "user_id": 1, "score": 1}
+    ).sort([("user_id", 1), ("completed_at", 1)]).batch_size(10000)
+    
+    user_ids, codes, scores = [], [], []
+    async for result in cursor:
+        if not user_ids or user_ids[-1] != result['user_id']:
+            user_ids.append(result['user_id'])
+        codes.append(len(user_ids) - 1)
+        scores.append(result['score'])
+    
+    return user_ids, np.asarray(codes, dtype=np.int64), np.asarray(scores, dtype=float)
+
+async def record_learning_result(user_id: str, score: float):
+    """Fold a new assessment score into the user's running regression sums"""
+    try:
+        x = {"$ifNull": ["$n", 0]}
+        
+        def summed(field, term):
+            return {"$add": [{"$ifNull": [f"${field}", 0]}, term]}
+        
+        def decayed(field, term, factor=LEARNING_TREND_DECAY):
+            return {"$add": [{"$multiply": [{"$ifNull": [f"${field}", 0]}, factor]}, term]}
+        
+        # Single pipeline update so concurrent submissions stay consistent
+        await db.learning_stats.update_one(
+            {"user_id": user_id},
+            [{"$set": {
+                "n": summed("n", 1),
+                "sum_x": summed("sum_x", x),
+                "sum_y": summed("sum_y", score),
+                "sum_xx": summed("sum_xx", {"$multiply": [x, x]}),
+                "sum_xy": summed("sum_xy", {"$multiply": [x, score]}),
+                "sum_yy": summed("sum_yy", score * score),
+                "ew_w": decayed("ew_w", 1),
+                "ew_ww": decayed("ew_ww", 1, LEARNING_TREND_DECAY ** 2),
+                "ew_x": decayed("ew_x", x),
+                "ew_y": decayed("ew_y", score),
+                "ew_xx": decayed("ew_xx", {"$multiply": [x, x]}),
+                "ew_xy": decayed("ew_xy", {"$multiply": [x, score]}),
+                "ew_yy": decayed("ew_yy", score * score),
+                "updated_at": datetime.utcnow()
+            }}],
+            upsert=True
+        )
+        
+    except Exception as e:
+        logger.error(f"Error recording learning result: {e}")
+
+async def backfill_learning_stats():
+    """Seed running regression sums for users whose results predate them.
+    
+    Runs once through run_startup_job before any worker serves requests, so
+    no record_learning_result can create a user's sums between reading their
+    history and seeding it.
+    """
+    seeded = await db.learning_stats.distinct("user_id")
+    user_ids, codes, scores = await load_score_histories({"user_id": {"$nin": seeded}})
+    if not user_ids:
+        return
+    
+    sums = segment_learning_sums(codes, scores, len(user_ids))
+    now = datetime.utcnow()
+    operations = [
+        UpdateOne(
+            {"user_id": user_id},
+            {"$setOnInsert": {
+                **{key: (int(values[i]) if key == "n" else float(values[i])) for key, values in sums.items()},
+                "updated_at": now
+            }},
+            upsert=True
+        )
+        for i, user_id in enumerate(user_ids)
+    ]
+    for i in range(0, len(operations), 1000):
+        await db.learning_stats.bulk_write(operations[i:i + 1000], ordered=False)
+    
+    logger.info(f"Seeded learning stats for {len(user_ids)} users")
+
+async def run_batch_predictions(user_ids: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Score every student's next assessment in one vectorized pass.
+    
+    Results are upserted into the predictions collection with a generated_at
+    freshness timestamp. Restrict the run with `user_ids` (e.g. a class).
+    """
+    started = time.perf_counter()
+    query = {"user_id": {"$in": user_ids}} if user_ids is not None else {}
+    scored_ids, codes, scores = await load_score_histories(query)
+    
+    generated_at = datetime.utcnow()
+    if scored_ids:
+        sums = segment_learning_sums(codes, scores, len(scored_ids))
+        n = sums['n']
+        fit = regression_from_sums(
+            n, sums['sum_x'], sums['sum_y'], sums['sum_xx'], sums['sum_xy'], sums['sum_yy'], x_next=n
+        )
+        ew_ww = sums['ew_ww']
+        weighted_fit = regression_from_sums(
+            sums['ew_w'], sums['ew_x'], sums['ew_y'], sums['ew_xx'], sums['ew_xy'], sums['ew_yy'],
+            x_next=n, n_eff=np.where(ew_ww > 0, sums['ew_w'] ** 2 / np.where(ew_ww > 0, ew_ww, 1), 0)
+        )
+        trend = np.where(fit['slope'] > 0, "improving", np.where(fit['slope'] < 0, "declining", "stable"))
+        enough = n >= 3
+        
+        operations = []
+        for i, user_id in enumerate(scored_ids):
+            prediction = {
+                "user_id": user_id,
+                "samples": int(n[i]),
+                "generated_at": generated_at
+            }
+            if enough[i]:
+                prediction.update({
+                    "predicted_next_score": round(float(fit['prediction'][i]), 2),
+                    "weighted_next_score": round(float(weighted_fit['prediction'][i]), 2),
+                    "trend": str(trend[i]),
+                    "confidence": round(float(fit['confidence'][i]), 2),
+                    "confidence_interval": [round(float(fit['lower'][i]), 2), round(float(fit['upper'][i]), 2)],
+                    "r_squared": round(float(fit['r_squared'][i]), 3)
+                })
+            else:
+                prediction.update({
+                    "predicted_next_score": None,
+                    "weighted_next_score": None,
+                    "trend": None,
+                    "confidence": 0,
+                    "confidence_interval": None,
+                    "r_squared": None
+                })
+            operations.append(UpdateOne({"user_id": user_id}, {"$set": prediction}, upsert=True))
+        
+        for i in range(0, len(operations), 1000):
+            await db.predictions.bulk_write(operations[i:i + 1000], ordered=False)
+    
+    duration_ms = (time.perf_counter() - started) * 1000
+    logger.info(f"Batch predictions scored {len(scored_ids)} users from {len(scores)} results in {duration_ms:.0f}ms")
+    
+    return {
+        "users_scored": len(scored_ids),
+        "results_processed": int(len(scores)),
+        "generated_at": generated_at,
+        "duration_ms": round(duration_ms, 1)
+    }
+
+# ================================
+# ANALYTICS ENDPOINTS
+# ================================
+
+async def build_dashboard_snapshot(user_id: str) -> Dict[str, Any]:
+    """Build a user's analytics dashboard with all independent reads in flight at once"""
+    user_stats, recent_sessions, assessment_results = await asyncio.gather(
+        get_user_statistics(user_id),
+        db.study_sessions.find(
+            {"user_id": user_id}, {"_id": 0}
+        ).sort("created_at", -1).limit(10).to_list(10),
+        db.assessment_results.find(
+            {"user_id": user_id}, {"_id": 0, "score": 1}
+        ).sort("completed_at", -1).limit(20).to_list(20)
+    )
+    
+    performance_trend = [result['score'] for result in assessment_results]
+    
+    return {
+        "user_stats": user_stats,
+        "recent_sessions": recent_sessions,
+        "performance_trend": performance_trend,
+        "total_assessments": len(assessment_results),
+        "average_score": sum(performance_trend) / len(performance_trend) if performance_trend else 0,
+        "snapshot_at": datetime.utcnow()
+    }
+
+# Landing-page dashboards, invalidated by award_xp, submit_assessment and chat_with_ai
+dashboard_cache = SnapshotCache(
+    build_dashboard_snapshot,
+    fresh_ttl=DASHBOARD_CACHE_TTL,
+    max_stale=DASHBOARD_CACHE_MAX_STALE,
+    name="dashboard"
+)
+system_stats_providers['dashboard_cache'] = dashboard_cache.stats
+
+@api_router.get("/analytics/dashboard")
+async def get_analytics_dashboard(current_user: dict = Depends(get_current_user)):
+    """Get user analytics dashboard"""
+    try:
+        return await dashboard_cache.get(current_user['id'])
+        
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @api_router.get("/analytics/predictions")
-async def get_learning_predictions(current_user: dict = Depends(get_current_user)):
+async def get_learning_predictions(weighted: bool = False, current_user: dict = Depends(get_current_user)):
     """Get AI-powered learning predictions"""
     try:
-        # Simple ML prediction (in production, use more sophisticated models)
-        assessment_results = await db.assessment_results.find(
-            {"user_id": current_user['id']}
-        ).sort("completed_at", 1).to_list(100)
+        # Closed-form regression over the running sums kept by record_learning_result
+        stats = await db.learning_stats.find_one({"user_id": current_user['id']}, {"_id": 0})
         
-        if len(assessment_results) < 3:
+        if not stats or stats.get('n', 0) < 3:
             return {"prediction": "Need more data for predictions", "confidence": 0}
         
-        # Prepare data for linear regression
-        X = np.array([[i] for i in range(len(assessment_results))])
-        y = np.array([result['score'] for result in assessment_results])
-        
-        # Train simple model
-        model = LinearRegression()
-        model.fit(X, y)
-        
-        # Predict next assessment performance
-        next_prediction = model.predict([[len(assessment_results)]])[0]
+        forecast = predict_next_score(stats, weighted=weighted)
         
         # Calculate trend
-        trend = "improving" if model.coef_[0] > 0 else "declining" if model.coef_[0] < 0 else "stable"
+        slope = forecast['slope']
+        trend = "improving" if slope > 0 else "declining" if slope < 0 else "stable"
         
         return {
-            "predicted_next_score": round(next_prediction, 2),
+            "predicted_next_score": round(forecast['prediction'], 2),
             "trend": trend,
-            "confidence": 0.75,  # Simplified confidence
+            "confidence": round(forecast['confidence'], 2),
+            "confidence_interval": [round(forecast['lower'], 2), round(forecast['upper'], 2)],
+            "confidence_level": 0.95,
+            "r_squared": round(forecast['r_squared'], 3),
+            "samples": stats['n'],
+            "weighted": weighted,
             "recommendation": f"Based on your {trend} trend, focus on practice questions in your weaker subjects."
         }
         
@@ -1272,6 +4716,305 @@ async def get_learning_predictions(current_user: dict = Depends(get_current_user
         logger.error(f"Prediction error: {e}")
         return {"prediction": "Unable to generate predictions", "confidence": 0}
 
+async def resolve_prediction_cohort(user_ids: Optional[List[str]], group_id: Optional[str]) -> Optional[List[str]]:
+    """Resolve the students a batch prediction request refers to (None means everyone)"""
+    if group_id:
+        group = await db.study_groups.find_one({"id": group_id}, {"_id": 0, "members": 1})
+        if not group:
+            raise HTTPException(status_code=404, detail="Study group not found")
+        return group['members']
+    return user_ids
+
+@api_router.post("/analytics/predictions/batch")
+async def run_class_predictions(request: BatchPredictionRequest, current_user: dict = Depends(get_current_user)):
+    """Score predicted next assessment results for a whole class (for teachers)"""
+    try:
+        if current_user['role'] not in [UserRole.TEACHER, UserRole.ADMIN]:
+            raise HTTPException(status_code=403, detail="Access denied")
+        
+        user_ids = await resolve_prediction_cohort(request.user_ids, request.group_id)
+        summary = await run_batch_predictions(user_ids)
+        
+        return {"message": "Batch predictions generated successfully", **summary}
+        
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        logger.error(f"Batch prediction error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/analytics/predictions/batch")
+async def get_class_predictions(
+    group_id: Optional[str] = None,
+    limit: int = 1000,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get stored batch predictions (for teachers)"""
+    try:
+        if current_user['role'] not in [UserRole.TEACHER, UserRole.ADMIN]:
+            raise HTTPException(status_code=403, detail="Access denied")
+        
+        user_ids = await resolve_prediction_cohort(None, group_id)
+        query = {"user_id": {"$in": user_ids}} if user_ids is not None else {}
+        
+        predictions = await db.predictions.find(query, {"_id": 0}).limit(limit).to_list(limit)
+        
+        return {
+            "predictions": predictions,
+            "generated_at": min((p['generated_at'] for p in predictions), default=None)
+        }
+        
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+# ================================
+# COHORT ANALYTICS
+# ================================
+
+# Score buckets are 1 point wide (0..100); summaries are re-binned into 10-point bins
+COHORT_SCORE_BUCKETS = 101
+COHORT_PERCENTILES = np.array([10, 25, 50, 75, 90])
+
+# Maps each cohort scope to the stages that derive its grouping key from a result
+COHORT_SCOPES = {
+    "assessment": [
+        {"$set": {"cohort_key": "$assessment_id"}}
+    ],
+    "subject": [
+        {"$lookup": {"from": "assessments", "localField": "assessment_id", "foreignField": "id", "as": "assessment"}},
+        {"$set": {"cohort_key": {"$ifNull": [{"$arrayElemAt": ["$assessment.subject", 0]}, "unknown"]}}}
+    ],
+    "group": [
+        {"$lookup": {"from": "study_groups", "localField": "user_id", "foreignField": "members", "as": "groups"}},
+        {"$unwind": "$groups"},
+        {"$set": {"cohort_key": "$groups.id"}}
+    ]
+}
+
+def cohort_bucket_pipeline(
+    scope: str, window_start: datetime, window_end: datetime, refreshed_at: datetime
+) -> List[Dict[str, Any]]:
+    """Aggregate a window of results into score buckets and $merge them into the materialized view.
+    
+    Each bucket records the last window folded into it, so re-running a
+    window after a failed merge skips the buckets it already reached.
+    """
+    summed_fields = ["count", "sum_score", "sum_time", "sum_completion"]
+    already_merged = {"$eq": ["$last_window", "$$new.last_window"]}
+    return [
+        {"$match": {"ingested_at": {"$gt": window_start, "$lte": window_end}}},
+        *COHORT_SCOPES[scope],
+        {"$project": {
+            "_id": 0,
+            "cohort_key": 1,
+            "score": 1,
+            "time_taken": {"$ifNull": ["$time_taken", 0]},
+            "bucket": {"$min": [COHORT_SCORE_BUCKETS - 1, {"$max": [0, {"$floor": "$score"}]}]},
+            "completion": {"$cond": [
+                {"$gt": ["$total_questions", 0]},
+                {"$min": [1, {"$divide": [{"$size": {"$ifNull": ["$answers", []]}}, "$total_questions"]}]},
+                1
+            ]}
+        }},
+        {"$group": {
+            "_id": {"scope": scope, "key": "$cohort_key", "bucket": "$bucket"},
+            "count": {"$sum": 1},
+            "sum_score": {"$sum": "$score"},
+            "sum_time": {"$sum": "$time_taken"},
+            "sum_completion": {"$sum": "$completion"}
+        }},
+        {"$set": {
+            "scope": "$_id.scope", "key": "$_id.key", "bucket": "$_id.bucket",
+            "last_window": window_end, "updated_at": refreshed_at
+        }},
+        {"$merge": {
+            "into": "cohort_score_buckets",
+            "on": "_id",
+            "whenMatched": [{"$set": {
+                **{
+                    field: {"$cond": [already_merged, f"${field}", {"$add": [f"${field}", f"$$new.{field}"]}]}
+                    for field in summed_fields
+                },
+                "last_window": "$$new.last_window",
+                "updated_at": "$$new.updated_at"
+            }}],
+            "whenNotMatched": "insert"
+        }}
+    ]
+
+async def refresh_cohort_scope(scope: str) -> bool:
+    """Fold results stored since the scope's watermark into its materialized buckets.
+    
+    Windows are cut on ingested_at, the server's insert time, rather than
+    completed_at, so a result whose completed_at is already behind the
+    watermark when it lands (a slow or retried submission) is still merged.
+    
+    A worker first claims the window (watermark, upto] with a lease on the
+    state document, so concurrent workers never merge the same results. The
+    watermark only advances once the merge has succeeded; a failed or
+    abandoned window is retried with the same bounds once its lease lapses.
+    """
+    state_id = f"cohort_buckets:{scope}"
+    now = datetime.utcnow()
+    state = await db.analytics_state.find_one({"_id": state_id})
+    if state is None:
+        try:
+            await db.analytics_state.insert_one({"_id": state_id, "watermark": datetime(1970, 1, 1)})
+        except DuplicateKeyError:
+            pass
+        state = await db.analytics_state.find_one({"_id": state_id})
+    
+    previous = state['watermark']
+    if state.get('lease_until') and state['lease_until'] > now:
+        return False  # another worker is merging a window
+    # An unfinished window keeps its bounds so the bucket guard recognises it
+    upto = state.get('lease_upto') or now - timedelta(seconds=COHORT_REFRESH_LAG)
+    if upto <= previous:
+        return False
+    
+    claimed = await db.analytics_state.find_one_and_update(
+        {"_id": state_id, "watermark": previous, "lease_until": state.get('lease_until')},
+        {"$set": {"lease_owner": WORKER_ID, "lease_until": now + timedelta(seconds=COHORT_REFRESH_LEASE), "lease_upto": upto}}
+    )
+    if claimed is None:
+        return False
+    
+    try:
+        pipeline = cohort_bucket_pipeline(scope, previous, upto, datetime.utcnow())
+        await db.assessment_results.aggregate(pipeline).to_list(None)
+    except BaseException:
+        # Let the next refresh retry this window instead of waiting out the lease
+        await db.analytics_state.update_one(
+            {"_id": state_id, "lease_owner": WORKER_ID, "watermark": previous},
+            {"$set": {"lease_until": None}}
+        )
+        raise
+    
+    await db.analytics_state.update_one(
+        {"_id": state_id, "lease_owner": WORKER_ID, "watermark": previous},
+        {
+            "$set": {"watermark": upto, "refreshed_at": datetime.utcnow()},
+            "$unset": {"lease_owner": "", "lease_until": "", "lease_upto": ""}
+        }
+    )
+    return True
+
+async def refresh_cohort_analytics():
+    """Incrementally refresh every cohort scope"""
+    for scope in COHORT_SCOPES:
+        try:
+            await refresh_cohort_scope(scope)
+        except Exception as e:
+            logger.error(f"Error refreshing {scope} cohort analytics: {e}")
+
+async def cohort_refresh_loop():
+    """Scheduler keeping the cohort materialized views current"""
+    while True:
+        await refresh_cohort_analytics()
+        await asyncio.sleep(COHORT_REFRESH_INTERVAL)
+
+def summarize_cohort_buckets(buckets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Turn materialized bucket documents into per-cohort distributions, vectorized across cohorts"""
+    if not buckets:
+        return []
+    
+    keys, codes = np.unique([bucket['key'] for bucket in buckets], return_inverse=True)
+    bucket_index = np.array([bucket['bucket'] for bucket in buckets], dtype=np.int64)
+    flat = codes * COHORT_SCORE_BUCKETS + bucket_index
+    size = len(keys) * COHORT_SCORE_BUCKETS
+    
+    def matrix(field):
+        weights = np.array([bucket.get(field, 0) for bucket in buckets], dtype=float)
+        return np.bincount(flat, weights=weights, minlength=size).reshape(len(keys), COHORT_SCORE_BUCKETS)
+    
+    histogram = matrix('count')
+    totals = histogram.sum(axis=1)
+    safe_totals = np.where(totals > 0, totals, 1)
+    
+    # Percentile = first score bucket whose cumulative share reaches p
+    cumulative = np.cumsum(histogram, axis=1) / safe_totals[:, None]
+    reached = cumulative[:, None, :] >= (COHORT_PERCENTILES / 100.0)[None, :, None]
+    percentiles = reached.argmax(axis=2)
+    
+    # Re-bin 1-point buckets into 10-point display bins (100 joins the top bin)
+    display_bins = np.minimum(np.arange(COHORT_SCORE_BUCKETS) // 10, 9)
+    coarse = np.zeros((len(keys), 10))
+    np.add.at(coarse.T, display_bins, histogram.T)
+    
+    total_score = matrix('sum_score').sum(axis=1)
+    total_time = matrix('sum_time').sum(axis=1)
+    total_completion = matrix('sum_completion').sum(axis=1)
+    
+    return [
+        {
+            "key": str(key),
+            "results": int(totals[i]),
+            "mean_score": round(float(total_score[i] / safe_totals[i]), 2),
+            "percentiles": {f"p{p}": int(v) for p, v in zip(COHORT_PERCENTILES, percentiles[i])},
+            "histogram": {
+                "bin_width": 10,
+                "counts": [int(c) for c in coarse[i]]
+            },
+            "completion_rate": round(float(total_completion[i] / safe_totals[i]), 3),
+            "mean_time_on_task": round(float(total_time[i] / safe_totals[i]), 1),
+            "total_time_on_task": int(total_time[i])
+        }
+        for i, key in enumerate(keys)
+    ]
+
+@api_router.get("/analytics/cohorts/{scope}")
+async def get_cohort_analytics(
+    scope: str,
+    key: Optional[str] = None,
+    current_user: dict = Depends(get_current_user)
+):
+    """Get score distributions, completion and time-on-task per subject, assessment or group (for teachers)"""
+    try:
+        if current_user['role'] not in [UserRole.TEACHER, UserRole.ADMIN]:
+            raise HTTPException(status_code=403, detail="Access denied")
+        
+        if scope not in COHORT_SCOPES:
+            raise HTTPException(status_code=400, detail=f"Unknown cohort scope: {scope}")
+        
+        # Reads only touch the materialized buckets, never raw assessment_results
+        query = {"scope": scope}
+        if key:
+            query["key"] = key
+        
+        buckets, state = await asyncio.gather(
+            db.cohort_score_buckets.find(query, {"_id": 0, "scope": 0, "last_window": 0, "updated_at": 0}).to_list(None),
+            db.analytics_state.find_one({"_id": f"cohort_buckets:{scope}"})
+        )
+        
+        return {
+            "scope": scope,
+            "cohorts": summarize_cohort_buckets(buckets),
+            "as_of": state['watermark'] if state else None
+        }
+        
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.post("/analytics/cohorts/refresh")
+async def trigger_cohort_refresh(current_user: dict = Depends(get_current_user)):
+    """Refresh cohort analytics now instead of waiting for the scheduler (for admins)"""
+    try:
+        if current_user['role'] != UserRole.ADMIN:
+            raise HTTPException(status_code=403, detail="Access denied")
+        
+        await refresh_cohort_analytics()
+        
+        return {"message": "Cohort analytics refreshed successfully"}
+        
+    except HTTPException as e:
+        raise e
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
 # ================================
 # ACHIEVEMENTS & GAMIFICATION
 # ================================
@@ -1343,6 +5086,7 @@ async def award_xp(user_id: str, xp_amount: int, activity_type: str):
         )
         
         await db.study_sessions.insert_one(session.dict())
+        dashboard_cache.invalidate(user_id)
         
         # Check for level up achievement
         if new_level > current_level:
@@ -1412,20 +5156,22 @@ async def award_achievement(user_id: str, achievement_id: str):
 async def get_user_statistics(user_id: str) -> Dict[str, Any]:
     """Get comprehensive user statistics"""
     try:
+        # Independent reads run concurrently
+        assessment_results, ai_conversations, study_sessions, user = await asyncio.gather(
+            db.assessment_results.find({"user_id": user_id}, {"_id": 0, "score": 1}).to_list(1000),
+            db.ai_conversations.count_documents({"user_id": user_id}),
+            db.study_sessions.find({"user_id": user_id}, {"_id": 0, "duration": 1}).to_list(1000),
+            db.users.find_one({"id": user_id}, {"_id": 0, "study_streak": 1})
+        )
+        
         # Assessment stats
-        assessment_results = await db.assessment_results.find({"user_id": user_id}).to_list(1000)
         assessments_completed = len(assessment_results)
         perfect_scores = len([r for r in assessment_results if r['score'] == 100])
         
-        # AI conversation stats
-        ai_conversations = await db.ai_conversations.count_documents({"user_id": user_id})
-        
         # Study session stats
-        study_sessions = await db.study_sessions.find({"user_id": user_id}).to_list(1000)
         total_study_time = sum(session['duration'] for session in study_sessions)
         
         # User data
-        user = await db.users.find_one({"id": user_id})
         study_streak = user.get('study_streak', 0) if user else 0
         
         return {
@@ -1444,37 +5190,543 @@ async def get_user_statistics(user_id: str) -> Dict[str, Any]:
 # FILE UPLOAD ENDPOINTS
 # ================================
 
+class BlobTooLarge(Exception):
+    """Raised while streaming an upload past UPLOAD_MAX_BYTES"""
+
+class BlobStore:
+    """Content-addressed files on local disk, stored at <root>/ab/cd/<sha256>.<generation>.
+    
+    Uploads stream chunk by chunk into a temporary file while being hashed,
+    so memory per upload is one chunk no matter how large the file is. File
+    I/O runs in worker threads off the event loop. Identical content is kept
+    once: the `blobs` document for a hash lists the uploaded_files ids that
+    reference it ($addToSet/$pull, so retries are idempotent) and names the
+    generation whose file holds the bytes. A writer places its own generation
+    on disk before creating the document, and a delete only removes the
+    generation it deleted, so a blob recreated while its last reference was
+    being dropped never loses its file.
+    """
+    
+    def __init__(self, root: Path, chunk_size: int):
+        self.root = root
+        self.staging = root / 'tmp'
+        self.chunk_size = chunk_size
+        self.metrics = {
+            'writes': 0, 'bytes_written': 0, 'rejected_too_large': 0,
+            'deduplicated': 0, 'bytes_deduplicated': 0, 'deleted': 0, 'bytes_read': 0
+        }
+    
+    def path(self, digest: str, generation: str) -> Path:
+        return self.root / digest[:2] / digest[2:4] / f"{digest}.{generation}"
+    
+    async def write(self, chunks: AsyncIterator[bytes], max_bytes: int, file_id: str) -> Tuple[str, int, str]:
+        """Store a stream of chunks referenced by `file_id`; returns (sha256 hex digest, size, generation)"""
+        await asyncio.to_thread(self.staging.mkdir, parents=True, exist_ok=True)
+        staged = self.staging / uuid.uuid4().hex
+        hasher = hashlib.sha256()
+        size = 0
+        handle = await asyncio.to_thread(open, staged, 'wb')
+        try:
+            async for chunk in chunks:
+                size += len(chunk)
+                if size > max_bytes:
+                    self.metrics['rejected_too_large'] += 1
+                    raise BlobTooLarge(f"File exceeds the {max_bytes} byte limit")
+                hasher.update(chunk)
+                await asyncio.to_thread(handle.write, chunk)
+            await asyncio.to_thread(handle.close)
+            digest = hasher.hexdigest()
+            generation = uuid.uuid4().hex[:12]
+            await asyncio.to_thread(self._place, staged, self.path(digest, generation))
+        except BaseException:
+            await asyncio.to_thread(self._discard, handle, staged)
+            raise
+        
+        try:
+            blob = await self._add_reference(digest, size, generation, file_id)
+        except BaseException:
+            await asyncio.to_thread(self.path(digest, generation).unlink, missing_ok=True)
+            raise
+        if blob['generation'] != generation:
+            # Same content is already stored; ours was only needed had it not been
+            await asyncio.to_thread(self.path(digest, generation).unlink, missing_ok=True)
+            self.metrics['deduplicated'] += 1
+            self.metrics['bytes_deduplicated'] += size
+        else:
+            self.metrics['writes'] += 1
+            self.metrics['bytes_written'] += size
+        return digest, size, blob['generation']
+    
+    async def _add_reference(self, digest: str, size: int, generation: str, file_id: str) -> Dict[str, Any]:
+        update = {
+            "$addToSet": {"refs": file_id},
+            "$setOnInsert": {"generation": generation, "size": size, "created_at": datetime.utcnow()}
+        }
+        try:
+            return await db.blobs.find_one_and_update(
+                {"_id": digest}, update, projection={"generation": 1}, upsert=True,
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # Lost a race to create the same blob; the document exists now
+            return await db.blobs.find_one_and_update(
+                {"_id": digest}, update, projection={"generation": 1}, return_document=ReturnDocument.AFTER
+            )
+    
+    async def release_reference(self, digest: str, file_id: str):
+        """Drop one file's reference; the last one deletes the blob"""
+        blob = await db.blobs.find_one_and_update(
+            {"_id": digest}, {"$pull": {"refs": file_id}},
+            projection={"generation": 1, "refs": 1}, return_document=ReturnDocument.AFTER
+        )
+        if blob is None or blob['refs']:
+            return
+        result = await db.blobs.delete_one({"_id": digest, "generation": blob['generation'], "refs": {"$size": 0}})
+        if result.deleted_count:
+            await asyncio.to_thread(self.path(digest, blob['generation']).unlink, missing_ok=True)
+            await derivative_pipeline.forget(digest, blob['generation'])
+            self.metrics['deleted'] += 1
+    
+    def derivative_path(self, digest: str, generation: str, variant: str) -> Path:
+        return self.root / 'derivatives' / digest[:2] / f"{digest}.{generation}.{variant}"
+    
+    async def read(self, path: Path, start: int, end: int) -> AsyncIterator[bytes]:
+        """Stream bytes start..end (inclusive) of a stored file, one chunk at a time"""
+        handle = await asyncio.to_thread(open, path, 'rb')
+        try:
+            await asyncio.to_thread(handle.seek, start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = await asyncio.to_thread(handle.read, min(self.chunk_size, remaining))
+                if not chunk:
+                    break
+                remaining -= len(chunk)
+                self.metrics['bytes_read'] += len(chunk)
+                yield chunk
+        finally:
+            await asyncio.to_thread(handle.close)
+    
+    @staticmethod
+    def _place(staged: Path, final: Path):
+        final.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(staged, final)
+    
+    @staticmethod
+    def _discard(handle, staged: Path):
+        handle.close()
+        staged.unlink(missing_ok=True)
+    
+    def stats(self) -> Dict[str, Any]:
+        return {**self.metrics, "root": str(self.root)}
+
+blob_store = BlobStore(BLOB_STORE_DIR, UPLOAD_CHUNK_SIZE)
+system_stats_providers['blob_store'] = blob_store.stats
+
+async def upload_file_chunks(file: UploadFile) -> AsyncIterator[bytes]:
+    while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+        yield chunk
+
+async def store_upload(
+    chunks: AsyncIterator[bytes], filename: Optional[str], content_type: Optional[str], user_id: str
+) -> Dict[str, Any]:
+    """Stream an upload into the blob store and record its metadata in uploaded_files"""
+    file_id = str(uuid.uuid4())
+    try:
+        digest, size, generation = await blob_store.write(chunks, UPLOAD_MAX_BYTES, file_id)
+    except BlobTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    
+    file_record = {
+        "id": file_id,
+        "filename": filename,
+        "content_type": content_type or "application/octet-stream",
+        "size": size,
+        "sha256": digest,
+        "blob_generation": generation,
+        "uploaded_by": user_id,
+        "uploaded_at": datetime.utcnow()
+    }
+    try:
+        await db.uploaded_files.insert_one(file_record)
+    except BaseException:
+        await blob_store.release_reference(digest, file_id)
+        raise
+    return file_record
+
 @api_router.post("/upload/image")
 async def upload_image(file: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
     """Upload and process image (for image recognition features)"""
     try:
-        # Read file content
-        content = await file.read()
-        
-        # Convert to base64 for storage
-        base64_content = base64.b64encode(content).decode('utf-8')
+        file_record = await store_upload(
+            upload_file_chunks(file), file.filename, file.content_type, current_user['id']
+        )
         
-        # Store in database (in production, use cloud storage)
-        file_record = {
-            "id": str(uuid.uuid4()),
+        return {
+            "message": "Image uploaded successfully",
+            "file_id": file_record['id'],
             "filename": file.filename,
-            "content_type": file.content_type,
-            "content": base64_content,
-            "uploaded_by": current_user['id'],
-            "uploaded_at": datetime.utcnow()
+            "size": file_record['size']
         }
         
-        await db.uploaded_files.insert_one(file_record)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.post("/upload/stream")
+async def upload_stream(request: Request, filename: str, current_user: dict = Depends(get_current_user)):
+    """Upload a file sent as the raw request body, stored as it arrives"""
+    try:
+        declared = request.headers.get('content-length')
+        if declared and declared.isdigit() and int(declared) > UPLOAD_MAX_BYTES:
+            raise HTTPException(status_code=413, detail=f"File exceeds the {UPLOAD_MAX_BYTES} byte limit")
+        
+        file_record = await store_upload(
+            request.stream(), filename, request.headers.get('content-type'), current_user['id']
+        )
         
         return {
-            "message": "Image uploaded successfully",
+            "message": "File uploaded successfully",
             "file_id": file_record['id'],
-            "filename": file.filename
+            "filename": filename,
+            "size": file_record['size']
         }
         
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+def parse_byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Inclusive (start, end) for a single-range Range header; None to serve the whole file.
+    
+    Raises ValueError when the range cannot be satisfied.
+    """
+    unit, _, spec = header.partition('=')
+    if unit.strip() != 'bytes' or ',' in spec:
+        return None  # other units and multipart ranges get the full body
+    first, _, last = spec.strip().partition('-')
+    if not (first or last) or not all(part.isdigit() for part in (first, last) if part):
+        return None  # malformed ranges are ignored
+    if not first:
+        if int(last) == 0:
+            raise ValueError("Empty suffix range")
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start = int(first)
+        end = min(int(last), size - 1) if last else size - 1
+    if start >= size or end < start:
+        raise ValueError("Range outside the file")
+    return start, end
+
+def content_disposition(filename: str) -> str:
+    """Inline Content-Disposition with an ASCII fallback and the UTF-8 name (RFC 6266)"""
+    fallback = unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii')
+    fallback = re.sub(r'[^A-Za-z0-9._ -]', '_', fallback).strip()
+    stem, dot, extension = fallback.rpartition('.')
+    if not (stem if dot else extension).strip('._ '):
+        fallback = f"download{dot}{extension}" if dot else "download"
+    return f"inline; filename=\"{fallback}\"; filename*=UTF-8''{quote(filename, safe='')}"
+
+def none_match(header: Optional[str], etag: str) -> bool:
+    """If-None-Match uses the weak comparison: W/ prefixes are ignored and * matches any (RFC 9110 13.1.2)"""
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(',')]
+    return '*' in tags or etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+def uploaded_file_query(file_id: str, user: dict) -> Dict[str, Any]:
+    """Uploads are private to their uploader (and admins); anyone else gets a 404"""
+    query = {"id": file_id}
+    if user['role'] != UserRole.ADMIN:
+        query["uploaded_by"] = user['id']
+    return query
+
+def stored_file_response(
+    request: Request, path: Path, size: int, etag: str, media_type: str, filename: str
+) -> Response:
+    """Stream an immutable stored file, honouring If-None-Match, Range and If-Range"""
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        # Content never changes under a hash, so clients need not revalidate
+        "Cache-Control": "private, max-age=31536000, immutable",
+        "Content-Disposition": content_disposition(filename)
+    }
+    
+    if none_match(request.headers.get('if-none-match'), etag):
+        return Response(status_code=304, headers=headers)
+    
+    byte_range = None
+    range_header = request.headers.get('range')
+    if range_header and request.headers.get('if-range', etag) == etag:
+        try:
+            byte_range = parse_byte_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    
+    start, end = byte_range or (0, size - 1)
+    headers["Content-Length"] = str(end - start + 1)
+    if byte_range:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    
+    return StreamingResponse(
+        blob_store.read(path, start, end),
+        status_code=206 if byte_range else 200,
+        media_type=media_type,
+        headers=headers
+    )
+
+@api_router.get("/upload/files/{file_id}")
+async def download_file(file_id: str, request: Request, current_user: dict = Depends(get_current_user)):
+    """Download an uploaded file, streamed from the blob store (supports Range and ETag revalidation)"""
+    try:
+        record = await db.uploaded_files.find_one(
+            {**uploaded_file_query(file_id, current_user), "blob_generation": {"$exists": True}},
+            {"_id": 0, "filename": 1, "content_type": 1, "size": 1, "sha256": 1, "blob_generation": 1}
+        )
+        if not record:
+            raise HTTPException(status_code=404, detail="File not found")
+        
+        return stored_file_response(
+            request, blob_store.path(record['sha256'], record['blob_generation']), record['size'], f'"{record["sha256"]}"',
+            record['content_type'], record.get('filename') or file_id
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.get("/upload/files/{file_id}/variants/{variant}")
+async def download_file_variant(
+    file_id: str, variant: str, request: Request, current_user: dict = Depends(get_current_user)
+):
+    """Download a derivative of an uploaded image (thumbnail, normalized, stripped), rendered on first request"""
+    try:
+        if variant not in DERIVATIVE_VARIANTS:
+            raise HTTPException(status_code=404, detail=f"Variant must be one of: {', '.join(DERIVATIVE_VARIANTS)}")
+        if Image is None:
+            raise HTTPException(status_code=503, detail="Image processing is not available")
+        
+        record = await db.uploaded_files.find_one(
+            {**uploaded_file_query(file_id, current_user), "blob_generation": {"$exists": True}},
+            {"_id": 0, "filename": 1, "sha256": 1, "blob_generation": 1}
+        )
+        if not record:
+            raise HTTPException(status_code=404, detail="File not found")
+        
+        try:
+            derivative = await derivative_pipeline.get(record['sha256'], record['blob_generation'], variant)
+        except DerivativeFailed as e:
+            raise HTTPException(status_code=415, detail=str(e))
+        
+        filename = f"{Path(record.get('filename') or file_id).stem}-{variant}.{derivative['extension']}"
+        return stored_file_response(
+            request, blob_store.derivative_path(record['sha256'], record['blob_generation'], variant), derivative['size'],
+            f'"{record["sha256"]}-{variant}"', derivative['media_type'], filename
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.delete("/upload/files/{file_id}")
+async def delete_file(file_id: str, current_user: dict = Depends(get_current_user)):
+    """Delete an uploaded file (its uploader, or an admin)"""
+    try:
+        record = await db.uploaded_files.find_one_and_delete(uploaded_file_query(file_id, current_user), {"_id": 0, "id": 1, "sha256": 1})
+        if not record:
+            raise HTTPException(status_code=404, detail="File not found")
+        
+        if record.get('sha256'):
+            await blob_store.release_reference(record['sha256'], record['id'])
+        
+        return {"message": "File deleted successfully"}
+        
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def migrate_inline_uploads():
+    """One-off migration: move base64 content stored in uploaded_files into the blob store.
+    
+    Safe to run on every worker at once and to resume after a crash: the
+    blob reference is keyed by the file id, so repeating it adds nothing.
+    """
+    async def single_chunk(data: bytes) -> AsyncIterator[bytes]:
+        yield data
+    
+    try:
+        migrated = 0
+        async for record in db.uploaded_files.find({"content": {"$exists": True}}, {"_id": 1, "id": 1, "content": 1}):
+            file_id = record.get('id') or str(record['_id'])
+            digest, size, generation = await blob_store.write(
+                single_chunk(base64.b64decode(record['content'])), float('inf'), file_id
+            )
+            result = await db.uploaded_files.update_one(
+                {"_id": record['_id'], "content": {"$exists": True}},
+                {
+                    "$set": {"id": file_id, "sha256": digest, "size": size, "blob_generation": generation},
+                    "$unset": {"content": ""}
+                }
+            )
+            migrated += result.modified_count
+        if migrated:
+            logger.info(f"Moved {migrated} inline uploads into the blob store")
+    except Exception as e:
+        logger.error(f"Inline upload migration error: {e}")
+
+# ================================
+# IMAGE DERIVATIVES
+# ================================
+
+# max_side: longest edge in pixels (None keeps the size); format: output format (None keeps the source's)
+DERIVATIVE_VARIANTS = {
+    "thumbnail": {"max_side": 256, "format": "WEBP", "quality": 80},
+    "normalized": {"max_side": 2048, "format": "JPEG", "quality": 85},
+    "stripped": {"max_side": None, "format": None, "quality": 90}
+}
+
+class DerivativeFailed(Exception):
+    """Raised when a stored file cannot be rendered as an image"""
+
+class DerivativePipeline:
+    """Renders image variants in a process pool, lazily and once per (content hash, variant).
+    
+    Rendered files sit next to the blobs and are described in the
+    `blob_derivatives` collection, so every worker reuses them; descriptions
+    are also kept in memory. Concurrent requests for a variant that is not
+    rendered yet share one render. The pool uses spawned processes, since
+    forking a process with a running event loop and driver threads is unsafe,
+    and is rebuilt if a worker dies. Only sources that cannot be decoded are
+    remembered as failed; other errors are retried on the next request.
+    """
+    
+    def __init__(self, store: BlobStore, variants: Dict[str, Dict[str, Any]], workers: int, max_pixels: int,
+                 max_known: int = 10000):
+        self.store = store
+        self.variants = variants
+        self.workers = workers
+        self.max_pixels = max_pixels
+        self.max_known = max_known
+        self.known: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()  # (sha256, generation, variant) -> description
+        self.inflight: Dict[tuple, asyncio.Task] = {}
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.render_seconds: deque = deque(maxlen=500)
+        self.queue_seconds: deque = deque(maxlen=500)
+        self.metrics = {
+            'memory_hits': 0, 'stored_hits': 0, 'joined': 0, 'renders': 0, 'failures': 0, 'queued': 0,
+            'pool_restarts': 0
+        }
+    
+    async def get(self, digest: str, generation: str, variant: str) -> Dict[str, Any]:
+        """Description of a rendered variant (media_type, extension, size, ...), rendering it if needed"""
+        key = (digest, generation, variant)
+        known = self.known.get(key)
+        if known is not None:
+            self.metrics['memory_hits'] += 1
+            self.known.move_to_end(key)
+        else:
+            task = self.inflight.get(key)
+            if task is None:
+                task = asyncio.create_task(self._produce(key))
+                self.inflight[key] = task
+                task.add_done_callback(lambda _: self.inflight.pop(key, None))
+            else:
+                self.metrics['joined'] += 1
+            known = await asyncio.shield(task)
+        
+        if 'error' in known:
+            raise DerivativeFailed(known['error'])
+        return known
+    
+    async def forget(self, digest: str, generation: str):
+        """Drop the variants of a deleted blob"""
+        for variant in self.variants:
+            self.known.pop((digest, generation, variant), None)
+            await asyncio.to_thread(self.store.derivative_path(digest, generation, variant).unlink, missing_ok=True)
+        await db.blob_derivatives.delete_many(
+            {"_id": {"$in": [f"{digest}.{generation}:{variant}" for variant in self.variants]}}
+        )
+    
+    async def _produce(self, key: tuple) -> Dict[str, Any]:
+        digest, generation, variant = key
+        target = self.store.derivative_path(digest, generation, variant)
+        stored = await db.blob_derivatives.find_one({"_id": f"{digest}.{generation}:{variant}"}, {"_id": 0})
+        if stored is not None and await asyncio.to_thread(target.exists):
+            self.metrics['stored_hits'] += 1
+            return self._remember(key, stored)
+        
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        
+        pool = self.pool
+        enqueued = time.time()
+        self.metrics['queued'] += 1
+        try:
+            result = await asyncio.get_running_loop().run_in_executor(
+                pool, render_derivative, str(self.store.path(digest, generation)), str(target),
+                self.variants[variant], self.max_pixels
+            )
+        except UnsupportedImage as e:
+            self.metrics['failures'] += 1
+            logger.warning(f"Could not render {variant} of blob {digest}: {e}")
+            return self._remember(key, {"error": "File is not a supported image"})
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); later renders get a fresh pool
+            self.metrics['failures'] += 1
+            if self.pool is pool:
+                self.pool = None
+                self.metrics['pool_restarts'] += 1
+                pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        except Exception:
+            self.metrics['failures'] += 1
+            raise
+        finally:
+            self.metrics['queued'] -= 1
+        
+        self.metrics['renders'] += 1
+        self.queue_seconds.append(result.pop('started') - enqueued)
+        self.render_seconds.append(result.pop('seconds'))
+        await db.blob_derivatives.update_one(
+            {"_id": f"{digest}.{generation}:{variant}"}, {"$set": {**result, "created_at": datetime.utcnow()}},
+            upsert=True
+        )
+        return self._remember(key, result)
+    
+    def _remember(self, key: tuple, description: Dict[str, Any]) -> Dict[str, Any]:
+        self.known[key] = description
+        if len(self.known) > self.max_known:
+            self.known.popitem(last=False)
+        return description
+    
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+    
+    def stats(self) -> Dict[str, Any]:
+        def milliseconds(samples, quantile):
+            return round(float(np.quantile(samples, quantile)) * 1000, 1) if samples else None
+        
+        return {
+            **self.metrics,
+            "available": Image is not None,
+            "workers": self.workers,
+            "inflight": len(self.inflight),
+            "known": len(self.known),
+            "render_ms_p50": milliseconds(self.render_seconds, 0.5),
+            "render_ms_p95": milliseconds(self.render_seconds, 0.95),
+            "queue_wait_ms_p50": milliseconds(self.queue_seconds, 0.5),
+            "queue_wait_ms_p95": milliseconds(self.queue_seconds, 0.95)
+        }
+
+derivative_pipeline = DerivativePipeline(blob_store, DERIVATIVE_VARIANTS, DERIVATIVE_WORKERS, DERIVATIVE_MAX_PIXELS)
+system_stats_providers['image_derivatives'] = derivative_pipeline.stats
+
 # Include router in app
 app.include_router(api_router)
 
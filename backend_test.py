@@ -12,6 +12,7 @@ import string
 import time
 import os
 import base64
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from pathlib import Path
 
@@ -559,6 +560,10 @@ class StudyGroupsTest(unittest.TestCase):
         self.assertEqual(response.status_code, 200, f"Failed to get study groups: {response.text}")
         data = response.json()
         self.assertIn('groups', data, "No groups returned")
+        for group in data['groups']:
+            self.assertIn('member_count', group, "No member count returned")
+            self.assertIn('is_member', group, "No membership flag returned")
+            self.assertNotIn('members', group, "Full member list returned")
         
         print(f"Successfully retrieved {len(data['groups'])} study groups")
     
@@ -607,6 +612,128 @@ class StudyGroupsTest(unittest.TestCase):
         
         print(f"Successfully retrieved {len(data['groups'])} of user's study groups")
 
+    def test_05_concurrent_joins_respect_capacity(self):
+        """Test that hundreds of simultaneous joins never overfill a group"""
+        print("\n=== Testing Concurrent Study Group Joins ===")
+
+        user = TEST_USERS['student']
+        if not user['token']:
+            self.skipTest("No student token available")
+
+        max_members = 10
+        response = requests.post(
+            f"{API_URL}/groups",
+            headers={'Authorization': f"Bearer {user['token']}"},
+            json={
+                'name': 'Concurrency Test Group',
+                'description': 'Capacity under concurrent joins',
+                'subject': 'Computer Science',
+                'max_members': max_members,
+                'is_public': True
+            }
+        )
+        self.assertEqual(response.status_code, 200, f"Failed to create study group: {response.text}")
+        group_id = response.json()['group']['id']
+
+        suffix = random.randint(10000, 99999)
+
+        def register(i):
+            response = requests.post(
+                f"{API_URL}/auth/register",
+                json={
+                    'username': f"joiner_{suffix}_{i}",
+                    'email': f"joiner_{suffix}_{i}@test.com",
+                    'password': 'JoinTest123!',
+                    'role': 'student',
+                    'full_name': f"Joiner {i}"
+                }
+            )
+            return response.json()['token'] if response.status_code == 200 else None
+
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            tokens = [token for token in pool.map(register, range(200)) if token]
+        self.assertGreater(len(tokens), max_members, "Not enough joiners registered")
+
+        def join(token):
+            return requests.post(
+                f"{API_URL}/groups/join",
+                headers={'Authorization': f"Bearer {token}"},
+                json={'group_id': group_id}
+            )
+
+        # Every joiner twice, all at once
+        with ThreadPoolExecutor(max_workers=100) as pool:
+            responses = list(pool.map(join, tokens + tokens))
+
+        joined = [r for r in responses if r.status_code == 200]
+        refused = [r for r in responses if r.status_code == 400]
+        self.assertEqual(len(joined) + len(refused), len(responses), "Unexpected join failures")
+        self.assertEqual(len(joined), max_members - 1, "Group capacity not enforced under concurrency")
+        self.assertTrue(
+            all(r.json()['detail'] in ("Group is full", "Already a member of this group") for r in refused),
+            "Refused joins did not report a reason"
+        )
+
+        response = requests.get(
+            f"{API_URL}/groups/my",
+            headers={'Authorization': f"Bearer {user['token']}"}
+        )
+        group = next(g for g in response.json()['groups'] if g['id'] == group_id)
+        self.assertEqual(group['member_count'], max_members, "Stored members exceed capacity")
+
+        print(f"{len(joined)} of {len(responses)} concurrent joins succeeded for {max_members - 1} open seats")
+
+    def test_06_discover_study_groups(self):
+        """Test ranked study group discovery"""
+        print("\n=== Testing Study Group Discovery ===")
+
+        user = TEST_USERS['teacher']
+        if not user['token']:
+            self.skipTest("No teacher token available")
+
+        response = requests.get(
+            f"{API_URL}/groups/discover",
+            headers={'Authorization': f"Bearer {user['token']}"},
+            params={'subject': 'Computer Science', 'limit': 10}
+        )
+
+        self.assertEqual(response.status_code, 200, f"Failed to discover study groups: {response.text}")
+        groups = response.json()['groups']
+        self.assertLessEqual(len(groups), 10, "Discovery ignored the limit")
+        scores = [group['rank_score'] for group in groups if group['subject_match']]
+        self.assertEqual(scores, sorted(scores, reverse=True), "Subject matches are not ranked")
+        for group in groups:
+            self.assertNotIn('members', group, "Full member list returned")
+
+        print(f"Successfully discovered {len(groups)} ranked study groups")
+
+    def test_07_chat_history_members_only(self):
+        """Test that chat history is limited to room members and accepts zoned cursors"""
+        print("\n=== Testing Chat History Access ===")
+
+        user = TEST_USERS['teacher']
+        if not user['token']:
+            self.skipTest("No teacher token available")
+        if not TEST_DATA['study_groups']:
+            self.skipTest("No study groups available")
+
+        group = TEST_DATA['study_groups'][0]
+        response = requests.get(
+            f"{API_URL}/chat/rooms/{group['id']}/messages",
+            headers={'Authorization': f"Bearer {user['token']}"},
+            params={'before': '2030-01-01T09:00:00+02:00', 'limit': 10}
+        )
+        self.assertEqual(response.status_code, 200, f"Failed to get chat history: {response.text}")
+        self.assertIn('messages', response.json(), "No messages returned")
+
+        response = requests.get(
+            f"{API_URL}/chat/rooms/{random.randint(10**8, 10**9)}/messages",
+            headers={'Authorization': f"Bearer {user['token']}"}
+        )
+        self.assertEqual(response.status_code, 403, "Non-member read a room's chat history")
+
+        print("Chat history is only served to room members")
+
 
 class QuizArenaTest(unittest.TestCase):
     """Test Quiz Arena with Real-time Features"""
@@ -668,6 +795,40 @@ class QuizArenaTest(unittest.TestCase):
         
         print(f"Successfully joined quiz room with code: {room['room_code']}")
 
+    def test_03_start_quiz_room(self):
+        """Test that only the host can start a live quiz"""
+        print("\n=== Testing Start Quiz Room ===")
+
+        teacher, student = TEST_USERS['teacher'], TEST_USERS['student']
+        if not teacher['token'] or not student['token']:
+            self.skipTest("No teacher or student token available")
+
+        if not TEST_DATA['quiz_rooms']:
+            self.skipTest("No quiz rooms available to start")
+
+        room = TEST_DATA['quiz_rooms'][0]
+
+        response = requests.post(
+            f"{API_URL}/quiz/rooms/{room['room_code']}/start",
+            headers={'Authorization': f"Bearer {student['token']}"}
+        )
+        self.assertEqual(response.status_code, 403, f"Non-host started the quiz: {response.text}")
+
+        response = requests.post(
+            f"{API_URL}/quiz/rooms/{room['room_code']}/start",
+            headers={'Authorization': f"Bearer {teacher['token']}"}
+        )
+        self.assertEqual(response.status_code, 200, f"Failed to start quiz: {response.text}")
+        self.assertGreater(response.json()['total_questions'], 0, "Quiz started without questions")
+
+        response = requests.post(
+            f"{API_URL}/quiz/rooms/{room['room_code']}/start",
+            headers={'Authorization': f"Bearer {teacher['token']}"}
+        )
+        self.assertEqual(response.status_code, 400, "Quiz started twice")
+
+        print(f"Successfully started quiz room with code: {room['room_code']}")
+
 
 class HelpQueueTest(unittest.TestCase):
     """Test Help Queue System"""
@@ -741,6 +902,125 @@ class HelpQueueTest(unittest.TestCase):
         
         print(f"Successfully claimed help request with ID: {request['id']}")
 
+    def test_04_priority_order_and_cancel(self):
+        """Test that the queue serves urgent requests first and cancelled ones leave it"""
+        print("\n=== Testing Help Queue Priority and Cancel ===")
+
+        student, teacher = TEST_USERS['student'], TEST_USERS['teacher']
+        if not student['token'] or not teacher['token']:
+            self.skipTest("No student or teacher token available")
+
+        created = {}
+        for priority in ('low', 'urgent'):
+            response = requests.post(
+                f"{API_URL}/help/request",
+                headers={'Authorization': f"Bearer {student['token']}"},
+                params={'subject': 'Queue Order Test', 'description': f'{priority} request', 'priority': priority}
+            )
+            self.assertEqual(response.status_code, 200, f"Failed to create help request: {response.text}")
+            created[priority] = response.json()['request']['id']
+
+        response = requests.get(
+            f"{API_URL}/help/queue",
+            headers={'Authorization': f"Bearer {teacher['token']}"},
+            params={'subject': 'Queue Order Test'}
+        )
+        self.assertEqual(response.status_code, 200, f"Failed to get help queue: {response.text}")
+        self.assertEqual(response.json()['next']['id'], created['urgent'], "Urgent request is not served first")
+
+        for request_id in created.values():
+            response = requests.post(
+                f"{API_URL}/help/requests/{request_id}/cancel",
+                headers={'Authorization': f"Bearer {student['token']}"}
+            )
+            self.assertEqual(response.status_code, 200, f"Failed to cancel help request: {response.text}")
+
+        response = requests.get(
+            f"{API_URL}/help/queue",
+            headers={'Authorization': f"Bearer {teacher['token']}"},
+            params={'subject': 'Queue Order Test'}
+        )
+        self.assertIsNone(response.json()['next'], "Cancelled requests are still queued")
+
+        print("Successfully verified help queue priority order and cancellation")
+
+    def test_05_claim_and_complete(self):
+        """Test that a claimed request can be completed by its teacher and leaves the queue"""
+        print("\n=== Testing Help Request Completion ===")
+
+        student, teacher = TEST_USERS['student'], TEST_USERS['teacher']
+        if not student['token'] or not teacher['token']:
+            self.skipTest("No student or teacher token available")
+
+        response = requests.post(
+            f"{API_URL}/help/request",
+            headers={'Authorization': f"Bearer {student['token']}"},
+            params={'subject': 'Completion Test', 'description': 'complete me', 'priority': 'high'}
+        )
+        self.assertEqual(response.status_code, 200, f"Failed to create help request: {response.text}")
+        self.assertIn('estimated_wait_seconds', response.json())
+        request_id = response.json()['request']['id']
+
+        response = requests.post(
+            f"{API_URL}/help/requests/{request_id}/complete",
+            headers={'Authorization': f"Bearer {teacher['token']}"}
+        )
+        self.assertEqual(response.status_code, 404, "Unclaimed request should not be completable")
+
+        response = requests.post(
+            f"{API_URL}/help/requests/{request_id}/claim",
+            headers={'Authorization': f"Bearer {teacher['token']}"}
+        )
+        self.assertEqual(response.status_code, 200, f"Failed to claim help request: {response.text}")
+
+        response = requests.post(
+            f"{API_URL}/help/requests/{request_id}/complete",
+            headers={'Authorization': f"Bearer {teacher['token']}"}
+        )
+        self.assertEqual(response.status_code, 200, f"Failed to complete help request: {response.text}")
+        self.assertEqual(response.json()['request']['status'], 'completed')
+
+        response = requests.get(
+            f"{API_URL}/help/queue",
+            headers={'Authorization': f"Bearer {teacher['token']}"},
+            params={'subject': 'Completion Test'}
+        )
+        self.assertNotIn(request_id, [r['id'] for r in response.json()['requests']], "Completed request is still queued")
+
+        print("Successfully verified help request completion")
+
+    def test_06_teacher_capacity(self):
+        """Test setting a teacher's auto-assignment subjects and load cap"""
+        print("\n=== Testing Teacher Help Capacity ===")
+
+        student, teacher = TEST_USERS['student'], TEST_USERS['teacher']
+        if not student['token'] or not teacher['token']:
+            self.skipTest("No student or teacher token available")
+
+        response = requests.put(
+            f"{API_URL}/help/capacity",
+            headers={'Authorization': f"Bearer {teacher['token']}"},
+            json={'subjects': ['Mathematics', 'Physics'], 'max_load': 4, 'auto_assign': True}
+        )
+        self.assertEqual(response.status_code, 200, f"Failed to update capacity: {response.text}")
+        capacity = response.json()['capacity']
+        self.assertEqual(capacity['max_load'], 4)
+        self.assertEqual(capacity['subjects'], ['Mathematics', 'Physics'])
+        self.assertGreaterEqual(capacity['current_load'], 0)
+
+        response = requests.get(f"{API_URL}/help/capacity", headers={'Authorization': f"Bearer {teacher['token']}"})
+        self.assertEqual(response.status_code, 200, f"Failed to get capacity: {response.text}")
+        self.assertEqual(response.json()['capacity']['max_load'], 4)
+
+        response = requests.put(
+            f"{API_URL}/help/capacity",
+            headers={'Authorization': f"Bearer {student['token']}"},
+            json={'subjects': [], 'max_load': 1}
+        )
+        self.assertEqual(response.status_code, 403, "Students should not have help capacity")
+
+        print("Successfully verified teacher help capacity")
+
 
 class AnalyticsAchievementsTest(unittest.TestCase):
     """Test Analytics & Achievements System"""
@@ -812,6 +1092,34 @@ class AnalyticsAchievementsTest(unittest.TestCase):
         
         print(f"Successfully retrieved user's achievements")
 
+    def test_05_batch_predictions(self):
+        """Test batch learning predictions for a class"""
+        print("\n=== Testing Batch Predictions ===")
+
+        user = TEST_USERS['teacher']
+        if not user['token']:
+            self.skipTest("No teacher token available")
+
+        response = requests.post(
+            f"{API_URL}/analytics/predictions/batch",
+            headers={'Authorization': f"Bearer {user['token']}"},
+            json={'user_ids': [TEST_USERS['student']['id']]}
+        )
+
+        self.assertEqual(response.status_code, 200, f"Failed to run batch predictions: {response.text}")
+        data = response.json()
+        self.assertIn('users_scored', data, "No scoring summary returned")
+
+        response = requests.get(
+            f"{API_URL}/analytics/predictions/batch",
+            headers={'Authorization': f"Bearer {user['token']}"}
+        )
+
+        self.assertEqual(response.status_code, 200, f"Failed to get batch predictions: {response.text}")
+        self.assertIn('predictions', response.json(), "No predictions returned")
+
+        print(f"Successfully scored {data['users_scored']} users in {data['duration_ms']}ms")
+
 
 class FileUploadTest(unittest.TestCase):
     """Test File Upload System"""
@@ -841,6 +1149,164 @@ class FileUploadTest(unittest.TestCase):
         
         print(f"Successfully uploaded image with ID: {data['file_id']}")
 
+    def test_02_stream_upload(self):
+        """Test raw-body streaming upload and the size limit"""
+        print("\n=== Testing Streaming Upload ===")
+        
+        user = TEST_USERS['student']
+        if not user['token']:
+            self.skipTest("No student token available")
+        
+        def chunks():
+            for _ in range(4):
+                yield b"x" * 65536
+        
+        response = requests.post(
+            f"{API_URL}/upload/stream",
+            headers={'Authorization': f"Bearer {user['token']}", 'Content-Type': 'text/plain'},
+            params={'filename': 'notes.txt'},
+            data=chunks()
+        )
+        self.assertEqual(response.status_code, 200, f"Failed to stream upload: {response.text}")
+        self.assertEqual(response.json()['size'], 4 * 65536)
+        
+        def oversized():
+            for _ in range(11):  # past the default 10 MB limit, sent chunked
+                yield b"x" * (1024 * 1024)
+        
+        response = requests.post(
+            f"{API_URL}/upload/stream",
+            headers={'Authorization': f"Bearer {user['token']}"},
+            params={'filename': 'huge.bin'},
+            data=oversized()
+        )
+        self.assertEqual(response.status_code, 413, "Oversized upload was not rejected")
+        
+        print("Successfully verified streaming upload")
+
+    def test_03_download_ranges_and_dedup(self):
+        """Test ranged, cacheable downloads and deletion of deduplicated uploads"""
+        print("\n=== Testing File Download ===")
+        
+        user = TEST_USERS['student']
+        if not user['token']:
+            self.skipTest("No student token available")
+        headers = {'Authorization': f"Bearer {user['token']}"}
+        
+        content = bytes(range(256)) * 40
+        file_ids = []
+        for _ in range(2):
+            response = requests.post(
+                f"{API_URL}/upload/stream", headers=headers, params={'filename': 'same.bin'}, data=content
+            )
+            self.assertEqual(response.status_code, 200, f"Failed to upload: {response.text}")
+            file_ids.append(response.json()['file_id'])
+        
+        response = requests.get(f"{API_URL}/upload/files/{file_ids[0]}", headers=headers)
+        self.assertEqual(response.status_code, 200, f"Failed to download: {response.text}")
+        self.assertEqual(response.content, content)
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        etag = response.headers['ETag']
+        
+        response = requests.get(f"{API_URL}/upload/files/{file_ids[1]}", headers={**headers, 'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304, "Identical content should share an ETag")
+        for if_none_match in (f"W/{etag}", f'"other", {etag}', '*'):
+            response = requests.get(f"{API_URL}/upload/files/{file_ids[0]}", headers={**headers, 'If-None-Match': if_none_match})
+            self.assertEqual(response.status_code, 304, f"If-None-Match {if_none_match} should use weak comparison")
+        
+        response = requests.get(f"{API_URL}/upload/files/{file_ids[0]}", headers={**headers, 'Range': 'bytes=100-199'})
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, content[100:200])
+        self.assertEqual(response.headers['Content-Range'], f"bytes 100-199/{len(content)}")
+        
+        response = requests.get(f"{API_URL}/upload/files/{file_ids[0]}", headers={**headers, 'Range': f'bytes={len(content)}-'})
+        self.assertEqual(response.status_code, 416)
+        
+        # The shared blob survives until its last reference is deleted
+        response = requests.delete(f"{API_URL}/upload/files/{file_ids[0]}", headers=headers)
+        self.assertEqual(response.status_code, 200, f"Failed to delete: {response.text}")
+        response = requests.get(f"{API_URL}/upload/files/{file_ids[1]}", headers=headers)
+        self.assertEqual(response.content, content)
+        requests.delete(f"{API_URL}/upload/files/{file_ids[1]}", headers=headers)
+        
+        print("Successfully verified ranged downloads and dedup")
+
+    def test_03b_download_non_latin_filename(self):
+        """Test downloading a file whose name is not latin-1"""
+        print("\n=== Testing Non-Latin Filename Download ===")
+        
+        user = TEST_USERS['student']
+        if not user['token']:
+            self.skipTest("No student token available")
+        headers = {'Authorization': f"Bearer {user['token']}"}
+        
+        response = requests.post(
+            f"{API_URL}/upload/stream", headers=headers, params={'filename': '宿題 😀.txt'}, data=b"homework"
+        )
+        self.assertEqual(response.status_code, 200, f"Failed to upload: {response.text}")
+        file_id = response.json()['file_id']
+        
+        response = requests.get(f"{API_URL}/upload/files/{file_id}", headers=headers)
+        self.assertEqual(response.status_code, 200, f"Failed to download: {response.text}")
+        self.assertIn("filename*=UTF-8''%E5%AE%BF%E9%A1%8C%20%F0%9F%98%80.txt", response.headers['Content-Disposition'])
+        requests.delete(f"{API_URL}/upload/files/{file_id}", headers=headers)
+        
+        print("Successfully verified non-latin filename download")
+
+    def test_03c_download_is_private_to_uploader(self):
+        """Test that another user cannot download someone's upload or its variants"""
+        print("\n=== Testing File Download Access ===")
+        
+        owner, other = TEST_USERS['student'], TEST_USERS['teacher']
+        if not owner['token'] or not other['token']:
+            self.skipTest("Student and teacher tokens are required")
+        headers = {'Authorization': f"Bearer {owner['token']}"}
+        
+        response = requests.post(
+            f"{API_URL}/upload/stream", headers=headers, params={'filename': 'private.txt'}, data=b"my notes"
+        )
+        self.assertEqual(response.status_code, 200, f"Failed to upload: {response.text}")
+        file_id = response.json()['file_id']
+        
+        other_headers = {'Authorization': f"Bearer {other['token']}"}
+        response = requests.get(f"{API_URL}/upload/files/{file_id}", headers=other_headers)
+        self.assertEqual(response.status_code, 404, "Another user downloaded the file")
+        response = requests.get(f"{API_URL}/upload/files/{file_id}/variants/thumbnail", headers=other_headers)
+        self.assertIn(response.status_code, [404, 503], "Another user downloaded a variant")
+        
+        response = requests.get(f"{API_URL}/upload/files/{file_id}", headers=headers)
+        self.assertEqual(response.status_code, 200, f"Uploader could not download: {response.text}")
+        requests.delete(f"{API_URL}/upload/files/{file_id}", headers=headers)
+        
+        print("Uploads are only served to their uploader")
+
+    def test_04_image_variants(self):
+        """Test thumbnail rendering for an uploaded image"""
+        print("\n=== Testing Image Variants ===")
+        
+        user = TEST_USERS['student']
+        if not user['token']:
+            self.skipTest("No student token available")
+        headers = {'Authorization': f"Bearer {user['token']}"}
+        
+        image_data = base64.b64decode("iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mP8z8BQDwAEhQGAhKmMIQAAAABJRU5ErkJggg==")
+        response = requests.post(
+            f"{API_URL}/upload/image", headers=headers, files={'file': ('variant.png', image_data, 'image/png')}
+        )
+        self.assertEqual(response.status_code, 200, f"Failed to upload image: {response.text}")
+        file_id = response.json()['file_id']
+        
+        response = requests.get(f"{API_URL}/upload/files/{file_id}/variants/thumbnail", headers=headers)
+        if response.status_code == 503:
+            self.skipTest("Image processing is not installed on the server")
+        self.assertEqual(response.status_code, 200, f"Failed to get thumbnail: {response.text}")
+        self.assertEqual(response.headers['Content-Type'], 'image/webp')
+        
+        response = requests.get(f"{API_URL}/upload/files/{file_id}/variants/poster", headers=headers)
+        self.assertEqual(response.status_code, 404, "Unknown variants should be rejected")
+        
+        print("Successfully verified image variants")
+
 
 class WebSocketTest(unittest.TestCase):
     """Test WebSocket/Socket.IO functionality"""
@@ -862,6 +1328,30 @@ class WebSocketTest(unittest.TestCase):
         print("Note: Full WebSocket testing requires a proper Socket.IO client implementation")
 
 
+class MetricsTest(unittest.TestCase):
+    """Test Prometheus Metrics Endpoint"""
+    
+    def test_01_metrics_exposition(self):
+        """Test that /metrics reports route, MongoDB and subsystem metrics"""
+        print("\n=== Testing Metrics Endpoint ===")
+        
+        headers = {}
+        if os.environ.get('METRICS_TOKEN'):
+            headers['Authorization'] = f"Bearer {os.environ['METRICS_TOKEN']}"
+        
+        requests.get(f"{API_URL}/groups")
+        response = requests.get(f"{BACKEND_URL}/metrics", headers=headers)
+        
+        self.assertEqual(response.status_code, 200, f"Failed to get metrics: {response.text}")
+        self.assertTrue(response.headers['Content-Type'].startswith('text/plain'))
+        body = response.text
+        self.assertIn('starguide_http_request_duration_seconds_bucket{method="GET",route="/api/groups"', body)
+        self.assertIn('starguide_mongodb_command_duration_seconds_count{command="find"', body)
+        self.assertIn('starguide_help_queue_pending', body)
+        
+        print("Successfully verified metrics endpoint")
+
+
 def run_tests():
     """Run all test classes in sequence"""
     test_classes = [
@@ -873,7 +1363,8 @@ def run_tests():
         HelpQueueTest,
         AnalyticsAchievementsTest,
         FileUploadTest,
-        WebSocketTest
+        WebSocketTest,
+        MetricsTest
     ]
     
     loader = unittest.TestLoader()
@@ -1,5 +1,5 @@
 import React, { useState, useEffect, useRef } from 'react';
-import io from 'socket.io-client';
+import { connectSocket } from '../socketCodec';
 import axios from 'axios';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
@@ -19,17 +19,38 @@ const LiveQuiz = ({ roomCode, user, onExit }) => {
   const [hasAnswered, setHasAnswered] = useState(false);
   const [roomInfo, setRoomInfo] = useState(null);
   const [countdown, setCountdown] = useState(0);
+  const [distribution, setDistribution] = useState(null);
   const socketRef = useRef(null);
   const timerRef = useRef(null);
 
   useEffect(() => {
     // Initialize socket connection
-    socketRef.current = io(BACKEND_URL);
+    socketRef.current = connectSocket(BACKEND_URL);
     
     // Join quiz room
     joinQuizRoom();
     
     // Socket event listeners
+    socketRef.current.on('quiz_state', (state) => {
+      setRoomInfo({ roomCode: state.room_code, hostId: state.host_id });
+      setQuizState(prev => ({
+        ...prev,
+        status: state.status,
+        participants: state.participants,
+        totalQuestions: state.total_questions,
+        questionNumber: state.question_number,
+        currentQuestion: state.question || prev.currentQuestion,
+        leaderboard: state.leaderboard
+      }));
+      if (state.question) {
+        startQuestionTimer(state.time_remaining);
+      }
+    });
+
+    socketRef.current.on('quiz_error', (data) => {
+      console.error('Quiz error:', data.reason);
+    });
+
     socketRef.current.on('quiz_started', (data) => {
       console.log('Quiz started:', data);
       setQuizState(prev => ({
@@ -49,11 +70,16 @@ const LiveQuiz = ({ roomCode, user, onExit }) => {
       }));
       setSelectedAnswer('');
       setHasAnswered(false);
+      setDistribution(null);
       startQuestionTimer(questionData.time_limit || 30);
     });
 
     socketRef.current.on('answer_submitted', (data) => {
-      console.log('Answer submitted by:', data.user_id);
+      console.log('Answer accepted for question:', data.question_id);
+    });
+
+    socketRef.current.on('answer_distribution', (snapshot) => {
+      setDistribution(snapshot);
     });
 
     socketRef.current.on('question_results', (results) => {
@@ -99,17 +125,23 @@ const LiveQuiz = ({ roomCode, user, onExit }) => {
     try {
       const response = await axios.post(`${API}/quiz/rooms/${roomCode}/join`);
       console.log('Joined quiz room:', response.data);
-      
-      // Emit socket event to join room
-      socketRef.current.emit('join_quiz_room', {
-        room_code: roomCode,
-        user_id: user.id,
-        username: user.username
-      });
-      
     } catch (error) {
+      // Hosts and returning participants are already members
       console.error('Error joining quiz room:', error);
     }
+    
+    // Emit socket event to join room; the server checks membership
+    socketRef.current.emit('join_quiz_room', {
+      room_code: roomCode
+    });
+  };
+
+  const startQuiz = async () => {
+    try {
+      await axios.post(`${API}/quiz/rooms/${roomCode}/start`);
+    } catch (error) {
+      console.error('Error starting quiz:', error);
+    }
   };
 
   const startQuestionTimer = (seconds) => {
@@ -142,7 +174,6 @@ const LiveQuiz = ({ roomCode, user, onExit }) => {
     
     socketRef.current.emit('quiz_answer', {
       room_code: roomCode,
-      user_id: user.id,
       question_id: quizState.currentQuestion?.id,
       answer: answer,
       time_taken: (quizState.currentQuestion?.time_limit || 30) - quizState.timeRemaining
@@ -161,6 +192,11 @@ const LiveQuiz = ({ roomCode, user, onExit }) => {
         <div className="participants-count">
           <span>{quizState.participants.length} participants joined</span>
         </div>
+        {roomInfo?.hostId === user.id && (
+          <button onClick={startQuiz} className="btn btn-primary">
+            Start Quiz
+          </button>
+        )}
         <div className="participant-list">
           {quizState.participants.map((participant, index) => (
             <div key={index} className="participant-item">
@@ -199,6 +235,9 @@ const LiveQuiz = ({ roomCode, user, onExit }) => {
               >
                 <span className="option-letter">{String.fromCharCode(65 + index)}</span>
                 <span className="option-text">{option}</span>
+                {hasAnswered && distribution?.counts?.length > 0 && (
+                  <span className="option-count">{distribution.counts[index]}</span>
+                )}
               </button>
             ))}
           </div>
@@ -230,6 +269,11 @@ const LiveQuiz = ({ roomCode, user, onExit }) => {
         ) : (
           <div className="answered-state">
             <span>✓ Answer submitted! Waiting for other participants...</span>
+            {distribution && (
+              <span className="answered-count">
+                {distribution.answered} of {distribution.total} answered
+              </span>
+            )}
           </div>
         )}
       </div>
@@ -1,5 +1,5 @@
 import React, { useState, useEffect, useRef } from 'react';
-import io from 'socket.io-client';
+import { connectSocket } from '../socketCodec';
 import axios from 'axios';
 
 const BACKEND_URL = process.env.REACT_APP_BACKEND_URL;
@@ -17,7 +17,8 @@ const StudyRoom = ({ groupId, user, onLeave }) => {
 
   useEffect(() => {
     // Initialize socket connection with proper configuration
-    socketRef.current = io(BACKEND_URL, {
+    // Identity comes from the token, verified once at connect
+    socketRef.current = connectSocket(BACKEND_URL, {
       transports: ['websocket', 'polling'],
       upgrade: true,
       timeout: 20000
@@ -31,9 +32,7 @@ const StudyRoom = ({ groupId, user, onLeave }) => {
       
       // Join the study room after connection
       socketRef.current.emit('join_room', {
-        room_id: groupId,
-        user_id: user.id,
-        username: user.username || user.email
+        room_id: groupId
       });
     });
 
@@ -54,20 +53,33 @@ const StudyRoom = ({ groupId, user, onLeave }) => {
     loadChatHistory();
 
     // Socket event listeners
-    socketRef.current.on('user_joined', (data) => {
-      console.log('User joined:', data);
-      addSystemMessage(`${data.username || data.user_id} joined the study room`);
+    socketRef.current.on('presence_delta', (delta) => {
+      delta.joined.forEach((data) => {
+        addSystemMessage(`${data.username || data.user_id} joined the study room`);
+      });
+      delta.left.forEach((data) => {
+        addSystemMessage(`${data.username || data.user_id} left the study room`);
+      });
+
+      const changed = new Set([...delta.joined, ...delta.left].map(u => u.presence_id));
+      setOnlineUsers(prev => [
+        ...prev.filter(u => !changed.has(u.presence_id)),
+        ...delta.joined
+      ]);
     });
 
-    socketRef.current.on('user_left', (data) => {
-      console.log('User left:', data);
-      addSystemMessage(`${data.username || data.user_id} left the study room`);
+    socketRef.current.on('chat_history', (history) => {
+      setMessages(history.messages || []);
     });
 
     socketRef.current.on('new_message', (messageData) => {
       setMessages(prev => [...prev, messageData]);
     });
 
+    socketRef.current.on('rate_limited', (data) => {
+      addSystemMessage(`You're sending too fast, try again in ${Math.ceil(data.retry_after)}s`);
+    });
+
     socketRef.current.on('online_users', (users) => {
       setOnlineUsers(users || []);
     });
@@ -75,8 +87,7 @@ const StudyRoom = ({ groupId, user, onLeave }) => {
     return () => {
       // Leave room and disconnect
       socketRef.current.emit('leave_room', {
-        room_id: groupId,
-        user_id: user.id
+        room_id: groupId
       });
       socketRef.current.disconnect();
     };
@@ -99,7 +110,8 @@ const StudyRoom = ({ groupId, user, onLeave }) => {
 
   const loadChatHistory = async () => {
     try {
-      // In a real implementation, you'd load chat history from the backend
+      // Recent history arrives with the 'chat_history' event on join;
+      // older pages come from /chat/rooms/:id/messages?before=...
       setLoading(false);
     } catch (error) {
       console.error('Error loading chat history:', error);
@@ -125,8 +137,6 @@ const StudyRoom = ({ groupId, user, onLeave }) => {
 
     const messageData = {
       room_id: groupId,
-      user_id: user.id,
-      username: user.username,
       message: newMessage.trim()
     };
 
@@ -0,0 +1,127 @@
+import io from 'socket.io-client';
+
+// Must match COMPACT_FIELDS / COMPACT_TIMESTAMP_FIELDS in backend/server.py (append only)
+const COMPACT_FIELDS = [
+  'id', 'room_id', 'user_id', 'username', 'message', 'message_type', 'timestamp',
+  'presence_id', 'joined_at', 'joined', 'left', 'online_count', 'messages', 'status',
+  'room_code', 'question_id', 'question', 'question_number', 'time_limit', 'answered',
+  'total', 'counts', 'leaderboard', 'rank', 'score', 'correct', 'participants',
+  'total_questions', 'content', 'question_type', 'subject', 'difficulty', 'options',
+  'reason', 'host_id', 'time_remaining', 'correct_answer', 'explanation', 'final_leaderboard'
+];
+const COMPACT_TIMESTAMP_FIELDS = new Set(['timestamp', 'joined_at']);
+
+// Set REACT_APP_SOCKET_ENCODING=compact to receive binary (msgpack) events
+const SOCKET_ENCODING = process.env.REACT_APP_SOCKET_ENCODING || 'json';
+
+// Minimal msgpack decoder for the types the server produces
+const unpack = (buffer) => {
+  const view = new DataView(buffer);
+  const bytes = new Uint8Array(buffer);
+  const utf8 = new TextDecoder();
+  let offset = 0;
+
+  const str = (length) => {
+    const value = utf8.decode(bytes.subarray(offset, offset + length));
+    offset += length;
+    return value;
+  };
+  const array = (length) => {
+    const items = [];
+    for (let i = 0; i < length; i++) items.push(read());
+    return items;
+  };
+  const map = (length) => {
+    const entries = {};
+    for (let i = 0; i < length; i++) {
+      const key = read();
+      entries[key] = read();
+    }
+    return entries;
+  };
+  const uint = (size) => {
+    let value;
+    if (size === 1) value = view.getUint8(offset);
+    else if (size === 2) value = view.getUint16(offset);
+    else if (size === 4) value = view.getUint32(offset);
+    else value = Number(view.getBigUint64(offset));
+    offset += size;
+    return value;
+  };
+  const int = (size) => {
+    let value;
+    if (size === 1) value = view.getInt8(offset);
+    else if (size === 2) value = view.getInt16(offset);
+    else if (size === 4) value = view.getInt32(offset);
+    else value = Number(view.getBigInt64(offset));
+    offset += size;
+    return value;
+  };
+
+  const read = () => {
+    const type = bytes[offset++];
+    if (type <= 0x7f) return type;
+    if (type <= 0x8f) return map(type & 0x0f);
+    if (type <= 0x9f) return array(type & 0x0f);
+    if (type <= 0xbf) return str(type & 0x1f);
+    if (type >= 0xe0) return type - 0x100;
+    switch (type) {
+      case 0xc0: return null;
+      case 0xc2: return false;
+      case 0xc3: return true;
+      case 0xc4: case 0xc5: case 0xc6: {
+        const length = uint(1 << (type - 0xc4));
+        const value = bytes.slice(offset, offset + length);
+        offset += length;
+        return value;
+      }
+      case 0xca: { const value = view.getFloat32(offset); offset += 4; return value; }
+      case 0xcb: { const value = view.getFloat64(offset); offset += 8; return value; }
+      case 0xcc: return uint(1);
+      case 0xcd: return uint(2);
+      case 0xce: return uint(4);
+      case 0xcf: return uint(8);
+      case 0xd0: return int(1);
+      case 0xd1: return int(2);
+      case 0xd2: return int(4);
+      case 0xd3: return int(8);
+      case 0xd9: return str(uint(1));
+      case 0xda: return str(uint(2));
+      case 0xdb: return str(uint(4));
+      case 0xdc: return array(uint(2));
+      case 0xdd: return array(uint(4));
+      case 0xde: return map(uint(2));
+      case 0xdf: return map(uint(4));
+      default: throw new Error(`Unsupported msgpack type 0x${type.toString(16)}`);
+    }
+  };
+  return read();
+};
+
+// Restore field names and ISO timestamps so handlers see the JSON shape
+const expand = (value) => {
+  if (Array.isArray(value)) return value.map(expand);
+  if (value === null || typeof value !== 'object' || value instanceof Uint8Array) return value;
+  const expanded = {};
+  Object.entries(value).forEach(([key, item]) => {
+    const name = /^\d+$/.test(key) ? COMPACT_FIELDS[Number(key)] ?? key : key;
+    expanded[name] = COMPACT_TIMESTAMP_FIELDS.has(name) && typeof item === 'number'
+      ? new Date(item).toISOString()
+      : expand(item);
+  });
+  return expanded;
+};
+
+export const decodeEvent = (payload) =>
+  payload instanceof ArrayBuffer ? expand(unpack(payload)) : payload;
+
+// Authenticated Socket.IO connection that decodes compact events transparently
+export const connectSocket = (url, options = {}) => {
+  const socket = io(url, {
+    ...options,
+    auth: { token: localStorage.getItem('token'), encoding: SOCKET_ENCODING }
+  });
+  const on = socket.on.bind(socket);
+  socket.on = (event, handler) => on(event, (...args) => handler(...args.map(decodeEvent)));
+  return socket;
+};
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Socket.IO payload benchmark for IDFS StarGuide
+Compares the JSON text python-socketio sends with the opt-in compact binary
+encoding (CompactCodec in backend/server.py) for typical room traffic:
+payload size per event and encode cost per event.
+
+Usage: python serializer_benchmark.py [--iterations N]
+"""
+
+import argparse
+import json
+import os
+import sys
+import timeit
+import uuid
+from datetime import datetime, timedelta
+from pathlib import Path
+
+# server.py connects lazily, so any Mongo URL works for importing it
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'starguide_benchmark')
+sys.path.insert(0, str(Path(__file__).parent / 'backend'))
+
+import msgpack  # noqa: E402
+from server import COMPACT_FIELDS, COMPACT_TIMESTAMP_FIELDS, CompactCodec  # noqa: E402
+
+
+def chat_message(i, now):
+    return {
+        'id': str(uuid.uuid4()),
+        'room_id': 'study-group-3f2a9c1e',
+        'user_id': str(uuid.uuid4()),
+        'username': f'student{i % 30}',
+        'message': 'Can someone explain why the derivative of x^2 is 2x?',
+        'message_type': 'text',
+        'timestamp': (now + timedelta(seconds=i)).isoformat()
+    }
+
+
+def member(i, now):
+    return {
+        'presence_id': uuid.uuid4().hex[:12],
+        'user_id': str(uuid.uuid4()),
+        'username': f'student{i}',
+        'joined_at': (now + timedelta(seconds=i)).isoformat()
+    }
+
+
+def typical_events():
+    """One payload per event type, sized like a 30-member study room / 50-player quiz"""
+    now = datetime.utcnow()
+    leaderboard = [
+        {'rank': i + 1, 'user_id': str(uuid.uuid4()), 'username': f'player{i}', 'score': 5000 - i * 70, 'correct': 5 - i // 10}
+        for i in range(50)
+    ]
+    return {
+        'new_message': chat_message(0, now),
+        'online_users (30)': [member(i, now) for i in range(30)],
+        'presence_delta': {
+            'room_id': 'study-group-3f2a9c1e', 'joined': [member(1, now)], 'left': [], 'online_count': 31
+        },
+        'chat_history (50)': {
+            'room_id': 'study-group-3f2a9c1e', 'messages': [chat_message(i, now) for i in range(50)]
+        },
+        'answer_submitted': {
+            'user_id': str(uuid.uuid4()), 'question_id': str(uuid.uuid4()), 'timestamp': now.isoformat()
+        },
+        'answer_distribution': {
+            'room_code': '482913', 'question_id': str(uuid.uuid4()), 'answered': 37, 'total': 50, 'counts': [12, 20, 3, 2]
+        },
+        'question_results (50)': {
+            'question_id': str(uuid.uuid4()), 'correct_answer': 'Option B', 'explanation': '',
+            'answered': 50, 'correct': 20, 'leaderboard': leaderboard
+        }
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args()
+
+    codec = CompactCodec(COMPACT_FIELDS, COMPACT_TIMESTAMP_FIELDS, shared=False)
+
+    def encode_json(payload):
+        # What python-socketio puts on the wire for a JSON event
+        return json.dumps(payload, separators=(',', ':')).encode()
+
+    def encode_plain_msgpack(payload):
+        return msgpack.packb(payload, use_bin_type=True)
+
+    encoders = [('json', encode_json), ('msgpack', encode_plain_msgpack), ('compact', codec.encode)]
+
+    print(f"{'event':<24}" + ''.join(f"{name + ' B':>12}{name + ' us':>12}" for name, _ in encoders) + f"{'saved':>8}")
+    totals = {name: [0, 0.0] for name, _ in encoders}
+    for event, payload in typical_events().items():
+        row = f"{event:<24}"
+        sizes = {}
+        for name, encode in encoders:
+            size = len(encode(payload))
+            seconds = timeit.timeit(lambda: encode(payload), number=args.iterations)
+            micros = seconds / args.iterations * 1e6
+            sizes[name] = size
+            totals[name][0] += size
+            totals[name][1] += micros
+            row += f"{size:>12}{micros:>12.1f}"
+        row += f"{1 - sizes['compact'] / sizes['json']:>8.0%}"
+        print(row)
+
+    row = f"{'total':<24}"
+    for name, _ in encoders:
+        row += f"{totals[name][0]:>12}{totals[name][1]:>12.1f}"
+    row += f"{1 - totals['compact'][0] / totals['json'][0]:>8.0%}"
+    print(row)
+
+
+if __name__ == '__main__':
+    main()
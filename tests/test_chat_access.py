@@ -0,0 +1,96 @@
+"""
+Unit tests for the membership check on the join_room Socket.IO event
+(backend/server.py): outsiders get neither presence nor chat history.
+"""
+
+import asyncio
+import os
+import sys
+import unittest
+import uuid
+from datetime import datetime
+from pathlib import Path
+from unittest import mock
+
+# server.py connects lazily, so any Mongo URL works for importing it
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'starguide_unit_tests')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import server  # noqa: E402
+
+MESSAGE = {
+    'id': 'm-1', 'room_id': 'group-1', 'user_id': 'alice', 'username': 'alice',
+    'message': 'hi', 'timestamp': datetime(2026, 1, 1, 9, 0)
+}
+
+
+class Rooms:
+    """find_one over one room collection, matching on id and a member field"""
+
+    def __init__(self, member_field, rooms):
+        self.member_field = member_field
+        self.rooms = rooms
+
+    async def find_one(self, query, projection):
+        members = self.rooms.get(query['id'], ())
+        return {'_id': query['id']} if query[self.member_field] in members else None
+
+
+class MemoryDatabase:
+    def __init__(self):
+        self.study_groups = Rooms('members', {'group-1': ['alice']})
+        self.quiz_rooms = Rooms('participants', {})
+
+
+class JoinRoomAccessTest(unittest.TestCase):
+    """join_room must apply the same members-only rule as the chat history endpoint"""
+
+    def setUp(self):
+        self.emitted = []
+        self.entered = []
+
+        async def emit_event(event, payload, room=None, to=None, skip_sid=None):
+            self.emitted.append(event)
+
+        async def enter_event_room(sid, room_id):
+            self.entered.append(room_id)
+
+        self._patch(server, 'db', MemoryDatabase())
+        self._patch(server, 'emit_event', emit_event)
+        self._patch(server, 'enter_event_room', enter_event_room)
+        self._patch(server.recent_messages, 'recent', mock.AsyncMock(return_value=[MESSAGE]))
+
+    def _patch(self, target, name, value):
+        patcher = mock.patch.object(target, name, value)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def join(self, user_id, role='student'):
+        sid = f"sid-{uuid.uuid4().hex}"
+        identity = {'user_id': user_id, 'username': user_id, 'role': role}
+        with mock.patch.object(server.sio, 'get_session', mock.AsyncMock(return_value=identity)):
+            asyncio.run(server.join_room(sid, {'room_id': 'group-1'}))
+        members = asyncio.run(server.presence_store.members('group-1'))
+        asyncio.run(server.presence_store.drop_sid(sid))
+        return members
+
+    def test_01_non_member_gets_no_history_or_presence(self):
+        members = self.join('mallory')
+
+        self.assertEqual(self.emitted, ['join_rejected'])
+        self.assertEqual(self.entered, [], "Non-member was put in the room")
+        self.assertEqual(members, [], "Non-member was recorded as present")
+
+    def test_02_member_and_admin_get_history(self):
+        members = self.join('alice')
+        self.assertIn('chat_history', self.emitted)
+        self.assertEqual([m['user_id'] for m in members], ['alice'])
+
+        self.emitted.clear()
+        self.join('root', role='admin')
+        self.assertIn('chat_history', self.emitted)
+
+
+if __name__ == '__main__':
+    unittest.main()
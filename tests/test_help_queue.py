@@ -0,0 +1,72 @@
+"""
+Unit tests for HelpQueue's lazily pruned heaps (backend/server.py).
+"""
+
+import asyncio
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock
+
+# server.py connects lazily, so any Mongo URL works for importing it
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'starguide_unit_tests')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import server  # noqa: E402
+from server import HelpQueue  # noqa: E402
+
+CREATED = datetime(2026, 1, 1, 9, 0)
+
+
+def request(request_id, status, minutes=0):
+    return {
+        'id': request_id, 'status': status, 'subject': 'math', 'priority': 'medium', 'priority_rank': 2,
+        'created_at': CREATED + timedelta(minutes=minutes)
+    }
+
+
+class HelpQueueTest(unittest.TestCase):
+    """A request that leaves pending and comes back must be queued exactly once"""
+
+    def test_01_repending_does_not_revive_the_dead_entry(self):
+        queue = HelpQueue(sync_interval=3, service_window=50)
+        queue.apply(request('a', 'pending', 0))
+        queue.apply(request('b', 'pending', 1))
+        queue.apply(request('a', 'assigned', 0))
+        queue.apply(request('a', 'pending', 0))
+
+        self.assertEqual([r['id'] for r in queue.ordered()], ['a', 'b'])
+        self.assertEqual([r['id'] for r in queue.ordered('math')], ['a', 'b'])
+
+        queue.apply(request('a', 'assigned', 0))
+        self.assertEqual(queue.head()['id'], 'b', "A dead heap entry was served")
+        self.assertEqual([r['id'] for r in queue.ordered()], ['b'])
+
+    def test_02_unchanged_pending_request_is_not_pushed_again(self):
+        queue = HelpQueue(sync_interval=3, service_window=50)
+        queue.apply(request('a', 'pending'))
+        queue.apply(request('a', 'pending'))
+
+        self.assertEqual(queue.stats()['heap_entries'], 2)  # overall heap + subject heap
+
+    def test_03_sync_skips_requests_this_worker_applied(self):
+        queue = HelpQueue(sync_interval=3, service_window=50)
+        queue.watermark = CREATED
+        own = {**request('a', 'pending'), 'updated_at': CREATED + timedelta(microseconds=123456)}
+        queue.apply(own)
+        # Mongo hands the same write back cut to milliseconds
+        stored = {**own, 'updated_at': CREATED + timedelta(microseconds=123000)}
+        cursor = mock.Mock(to_list=mock.AsyncMock(return_value=[stored]))
+        database = mock.Mock(help_requests=mock.Mock(find=mock.Mock(return_value=cursor)))
+
+        with mock.patch.object(server, 'db', database):
+            asyncio.run(queue.sync())
+
+        self.assertEqual(queue.metrics['synced_requests'], 0, "An unchanged request was re-applied")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,152 @@
+"""
+Unit tests for MongoPresenceStore (backend/server.py): two stores share an
+in-memory stand-in for the presence collections, as two workers share Mongo.
+"""
+
+import asyncio
+import os
+import sys
+import unittest
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock
+
+# server.py connects lazily, so any Mongo URL works for importing it
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'starguide_unit_tests')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import server  # noqa: E402
+from server import MongoPresenceStore, PresenceRegistry  # noqa: E402
+
+
+def matches(document, query):
+    for field, condition in query.items():
+        value = document.get(field)
+        if not isinstance(condition, dict):
+            if value != condition:
+                return False
+        elif '$nin' in condition and value in condition['$nin']:
+            return False
+        elif '$lt' in condition and not value < condition['$lt']:
+            return False
+        elif '$gte' in condition and not value >= condition['$gte']:
+            return False
+    return True
+
+
+class Cursor:
+    def __init__(self, documents):
+        self.documents = documents
+
+    async def to_list(self, length):
+        return self.documents
+
+
+class MemoryCollection:
+    """The handful of collection methods the presence store uses"""
+
+    def __init__(self):
+        self.documents = []
+
+    async def insert_one(self, document):
+        self.documents.append(dict(document))
+
+    async def update_one(self, query, update, upsert=False):
+        for document in self.documents:
+            if matches(document, query):
+                document.update(update['$set'])
+                return
+        if upsert:
+            self.documents.append({**query, **update['$set']})
+
+    async def delete_one(self, query):
+        for document in self.documents:
+            if matches(document, query):
+                self.documents.remove(document)
+                return
+
+    async def delete_many(self, query):
+        self.documents = [document for document in self.documents if not matches(document, query)]
+
+    def find(self, query, projection):
+        hidden = {field for field, shown in projection.items() if not shown}
+        return Cursor([
+            {field: value for field, value in document.items() if field not in hidden}
+            for document in self.documents if matches(document, query)
+        ])
+
+    async def count_documents(self, query):
+        return sum(1 for document in self.documents if matches(document, query))
+
+    async def distinct(self, field, query):
+        return list({document[field] for document in self.documents if matches(document, query)})
+
+
+class MemoryDatabase:
+    def __init__(self):
+        self.presence = MemoryCollection()
+        self.presence_workers = MemoryCollection()
+
+
+def user(user_id):
+    return {'presence_id': f"p-{user_id}", 'user_id': user_id, 'username': user_id}
+
+
+class MongoPresenceStoreTest(unittest.TestCase):
+    """Room membership must be shared between workers and pruned when a worker dies"""
+
+    def setUp(self):
+        self.db = MemoryDatabase()
+        patcher = mock.patch.object(server, 'db', self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.first = MongoPresenceStore(PresenceRegistry(), 'worker-1', heartbeat_interval=10)
+        self.second = MongoPresenceStore(PresenceRegistry(), 'worker-2', heartbeat_interval=10)
+
+    def test_01_members_are_visible_from_every_worker(self):
+        async def scenario():
+            await self.first.join('room-1', 'sid-1', user('alice'))
+            await self.second.join('room-1', 'sid-2', user('bob'))
+            self.assertFalse(await self.first.join('room-1', 'sid-1', user('alice')), "Rejoin was recorded twice")
+            return await self.second.members('room-1'), await self.first.count('room-1')
+
+        members, count = asyncio.run(scenario())
+        self.assertEqual(sorted(m['user_id'] for m in members), ['alice', 'bob'])
+        self.assertEqual(count, 2)
+        self.assertNotIn('worker_id', members[0], "Internal fields leaked into the member list")
+
+    def test_02_leave_and_disconnect_remove_only_that_connection(self):
+        async def scenario():
+            await self.first.join('room-1', 'sid-1', user('alice'))
+            await self.first.join('room-2', 'sid-1', user('alice'))
+            await self.second.join('room-1', 'sid-2', user('bob'))
+            left = await self.first.leave('room-2', 'sid-1')
+            departed = await self.first.drop_sid('sid-1')
+            return left, departed, await self.second.members('room-1')
+
+        left, departed, members = asyncio.run(scenario())
+        self.assertEqual(left['user_id'], 'alice')
+        self.assertEqual([room for room, _ in departed], ['room-1'])
+        self.assertEqual([m['user_id'] for m in members], ['bob'])
+
+    def test_03_heartbeat_prunes_workers_that_stopped(self):
+        async def scenario():
+            # Both workers heartbeat once at startup, before serving
+            await self.first.heartbeat()
+            await self.second.heartbeat()
+            await self.first.join('room-1', 'sid-1', user('alice'))
+            await self.second.join('room-1', 'sid-2', user('bob'))
+            # worker-2 went away without closing; its last heartbeat is now too old
+            self.db.presence_workers.documents[1]['seen_at'] = datetime.utcnow() - timedelta(seconds=60)
+            await self.first.heartbeat()
+            return await self.first.members('room-1'), await self.first.count('room-1')
+
+        members, count = asyncio.run(scenario())
+        self.assertEqual([m['user_id'] for m in members], ['alice'])
+        self.assertEqual(count, 1)
+        self.assertEqual([w['_id'] for w in self.db.presence_workers.documents], ['worker-1'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+Unit tests for LoopbackPubSubManager and the shared worker events carried on
+it (backend/server.py): two servers in one process stand in for two workers.
+"""
+
+import asyncio
+import json
+import os
+import sys
+import unittest
+import uuid
+from pathlib import Path
+
+import socketio
+
+# server.py connects lazily, so any Mongo URL works for importing it
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'starguide_unit_tests')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+import server  # noqa: E402
+from server import SHARED_EVENTS_NAMESPACE, LoopbackPubSubManager, SnapshotCache  # noqa: E402
+
+
+class RecordingServer(socketio.AsyncServer):
+    """Keeps the events it would have written to its clients' transports"""
+
+    def __init__(self, channel):
+        super().__init__(client_manager=LoopbackPubSubManager(channel=channel))
+        self.sent = []
+
+    async def _send_eio_packet(self, eio_sid, eio_pkt):
+        event, *data = json.loads(eio_pkt.data[1:])
+        self.sent.append((eio_sid, event, data))
+
+
+async def start_workers(count=2):
+    channel = f"unit-{uuid.uuid4().hex}"
+    workers = [RecordingServer(channel) for _ in range(count)]
+    for worker in workers:
+        worker.manager.initialize()
+    await asyncio.sleep(0)
+    return workers
+
+
+async def settle():
+    """Let the listener tasks drain their queues"""
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+class LoopbackPubSubManagerTest(unittest.TestCase):
+    """Emits and shared events must cross workers exactly as through a broker"""
+
+    def test_01_room_emit_reaches_clients_of_the_other_worker(self):
+        async def scenario():
+            first, second = await start_workers()
+            sid = await second.manager.connect('eio-2', '/')
+            await second.enter_room(sid, 'room-1')
+            await first.emit('new_message', {'message': 'hi'}, room='room-1')
+            await settle()
+            return first.sent, second.sent
+
+        first_sent, second_sent = asyncio.run(scenario())
+        self.assertEqual(first_sent, [])
+        self.assertEqual(second_sent, [('eio-2', 'new_message', [{'message': 'hi'}])])
+
+    def test_02_shared_event_runs_on_other_workers_only(self):
+        calls = []
+        server.shared_event_handlers['unit_test_event'] = calls.append
+
+        async def scenario():
+            first, second, third = await start_workers(3)
+            await first.emit('unit_test_event', {'n': 1}, namespace=SHARED_EVENTS_NAMESPACE)
+            await settle()
+            return first.sent + second.sent + third.sent
+
+        try:
+            sent = asyncio.run(scenario())
+        finally:
+            del server.shared_event_handlers['unit_test_event']
+        self.assertEqual(calls, [{'n': 1}, {'n': 1}], "Expected one call per other worker")
+        self.assertEqual(sent, [], "Shared events must not reach clients")
+
+    def test_03_named_cache_invalidation_is_applied_from_another_worker(self):
+        async def load(key):
+            return {'key': key}
+
+        async def scenario():
+            cache = SnapshotCache(load, fresh_ttl=60, max_stale=600, name=f"unit-{uuid.uuid4().hex}")
+            await cache.get('user-1')
+            first, _ = await start_workers()
+            await first.emit(
+                f"invalidate:{cache.name}", {'key': 'user-1'}, namespace=SHARED_EVENTS_NAMESPACE
+            )
+            await settle()
+            return cache
+
+        cache = asyncio.run(scenario())
+        self.assertTrue(cache._entries['user-1']['stale'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,108 @@
+"""
+Unit tests for WriteBehindBuffer (backend/server.py) against an in-memory
+collection that fails part of an insert_many the way MongoDB does.
+"""
+
+import asyncio
+import os
+import sys
+import unittest
+from pathlib import Path
+
+from bson import ObjectId
+from pymongo.errors import AutoReconnect, BulkWriteError
+
+# server.py connects lazily, so any Mongo URL works for importing it
+os.environ.setdefault('MONGO_URL', 'mongodb://localhost:27017')
+os.environ.setdefault('DB_NAME', 'starguide_unit_tests')
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'backend'))
+
+from server import WriteBehindBuffer  # noqa: E402
+
+
+class FlakyCollection:
+    """insert_many(ordered=False) that fails chosen documents on the first call"""
+
+    name = 'chat_messages'
+
+    def __init__(self, fail_indexes=(), lose_reply=False):
+        self.stored = {}
+        self.fail_indexes = set(fail_indexes)
+        self.lose_reply = lose_reply
+        self.calls = 0
+
+    async def insert_many(self, documents, ordered=True):
+        self.calls += 1
+        errors = []
+        for index, document in enumerate(documents):
+            document.setdefault('_id', ObjectId())
+            if document['_id'] in self.stored:
+                errors.append({'index': index, 'code': 11000, 'errmsg': 'E11000 duplicate key error'})
+            elif self.calls == 1 and index in self.fail_indexes:
+                errors.append({'index': index, 'code': 91, 'errmsg': 'shutdown in progress'})
+            else:
+                self.stored[document['_id']] = document
+        if errors:
+            raise BulkWriteError({'writeErrors': errors, 'nInserted': len(documents) - len(errors)})
+        if self.lose_reply and self.calls == 1:
+            raise AutoReconnect('connection closed before the reply')
+
+
+def make_buffer(collection):
+    return WriteBehindBuffer(
+        collection, flush_interval=60, batch_size=10, max_pending=20, backpressure_timeout=0.1
+    )
+
+
+class WriteBehindBufferTest(unittest.TestCase):
+    """Retries after a failed flush must neither duplicate nor wedge the buffer"""
+
+    def test_01_partial_insert_failure_requeues_only_failed_documents(self):
+        collection = FlakyCollection(fail_indexes=[1, 3])
+        buffer = make_buffer(collection)
+
+        async def scenario():
+            for i in range(5):
+                await buffer.add({'id': f'm{i}'})
+            await buffer.flush()
+            self.assertEqual(sorted(d['id'] for d in buffer._pending), ['m1', 'm3'])
+            self.assertEqual(len(collection.stored), 3)
+            await buffer.flush()
+
+        asyncio.run(scenario())
+        self.assertEqual(buffer.stats()['depth'], 0)
+        self.assertEqual(sorted(d['id'] for d in collection.stored.values()), [f'm{i}' for i in range(5)])
+        self.assertEqual(buffer.metrics['documents_written'], 5)
+
+    def test_02_ambiguous_failure_retry_is_idempotent(self):
+        collection = FlakyCollection(lose_reply=True)
+        buffer = make_buffer(collection)
+
+        async def scenario():
+            for i in range(4):
+                await buffer.add({'id': f'm{i}'})
+            await buffer.flush()
+            self.assertEqual(buffer.stats()['depth'], 4)  # nothing known to be written
+            await buffer.flush()
+
+        asyncio.run(scenario())
+        self.assertEqual(buffer.stats()['depth'], 0, "Already-written documents stayed queued")
+        self.assertEqual(len(collection.stored), 4)
+
+    def test_03_full_buffer_frees_space_after_partial_failure(self):
+        collection = FlakyCollection(fail_indexes=[0, 5])
+        buffer = make_buffer(collection)
+
+        async def scenario():
+            for i in range(20):
+                await buffer.add({'id': f'm{i}'})
+            await buffer.flush()
+            await buffer.add({'id': 'late'})  # the written part of the batch made room
+            await buffer.flush()
+
+        asyncio.run(scenario())
+        self.assertEqual(len(collection.stored), 21)
+
+
+if __name__ == '__main__':
+    unittest.main()